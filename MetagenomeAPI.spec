@@ -9,6 +9,19 @@ module MetagenomeAPI {
 
     typedef tuple<string column, boolean ascending> column_sorting;
 
+    /*
+        Range filter on a numeric column, only items with value of the
+        column between min and max (both inclusive, each optional) are
+        returned. Items without value (e.g. missing cov) never match.
+        column - n_contigs, sum_contig_len, gc or cov for bins, len, gc or
+            cov for contigs
+    */
+    typedef structure {
+        string column;
+        float min;
+        float max;
+    } column_range;
+
 
     /*
         num_found - optional field which when set informs that there
@@ -16,6 +29,8 @@ module MetagenomeAPI {
             value because it was already done before; please don't
             set this value with 0 or any guessed number if you didn't 
             get right value previously.
+        filters - optional range filters combined with the query (all of
+            them have to match).
     */
     typedef structure {
         string ref;
@@ -24,6 +39,7 @@ module MetagenomeAPI {
         int start;
         int limit;
         int num_found;
+        list<column_range> filters;
     } SearchBinnedContigsOptions;
 
     /*
@@ -61,6 +77,8 @@ module MetagenomeAPI {
             value because it was already done before; please don't
             set this value with 0 or any guessed number if you didn't 
             get right value previously.
+        filters - optional range filters combined with the query (all of
+            them have to match).
     */
     typedef structure {
         string ref;
@@ -70,6 +88,7 @@ module MetagenomeAPI {
         int start;
         int limit;
         int num_found;
+        list<column_range> filters;
     } SearchContigsInBin;
 
     /*
@@ -100,6 +119,184 @@ module MetagenomeAPI {
     funcdef search_contigs_in_bin(SearchContigsInBin params)
         returns (SearchContigsInBinResult result) authentication optional;
 
+    /*
+        contig_id - optional exact id of the contig to look up (query and
+            filters still apply on top of it)
+        query, sort_by, start, limit, num_found, filters - same as in
+            SearchContigsInBin, bin_id column can be used as well
+    */
+    typedef structure {
+        string ref;
+        string contig_id;
+        string query;
+        list<column_sorting> sort_by;
+        int start;
+        int limit;
+        int num_found;
+        list<column_range> filters;
+    } SearchContigsInBinnedContigsOptions;
+
+    /*
+        contig_id       - id of the contig
+        bin_id          - id of the bin the contig belongs to
+        len             - (bp) length of the contig
+        gc              - GC content over the contig
+        cov             - coverage over the contig (if available, may be null)
+    */
+    typedef structure {
+        string contig_id;
+        string bin_id;
+        int len;
+        float gc;
+        float cov;
+    } ContigInBinnedContigs;
+
+    /*
+        num_found - number of all items found in query search (with 
+            only part of it returned in "contigs" list).
+    */
+    typedef structure {
+        string query;
+        int start;
+        list<ContigInBinnedContigs> contigs;
+        int num_found;
+    } SearchContigsInBinnedContigsResult;
+
+    funcdef search_contigs_in_binned_contigs(SearchContigsInBinnedContigsOptions params)
+        returns (SearchContigsInBinnedContigsResult result) authentication optional;
+
+    typedef structure {
+        string ref;
+    } GetBinnedContigsSummaryParams;
+
+    /*
+        Distribution of one contig column (len, gc or cov).
+        count - number of contigs having the value (min, max, mean and
+            quantiles are null if there are none)
+        quantiles - values at quantile_levels of the result
+        histogram - number of contigs between each pair of neighbouring
+            histogram_edges of the result
+    */
+    typedef structure {
+        int count;
+        float min;
+        float max;
+        float mean;
+        list<float> quantiles;
+        list<int> histogram;
+    } ColumnSummary;
+
+    /*
+        columns - summary per column name (len, gc and cov)
+    */
+    typedef structure {
+        string bin_id;
+        int n_contigs;
+        mapping<string, ColumnSummary> columns;
+    } BinSummary;
+
+    /*
+        quantile_levels - probabilities quantiles are reported for
+        histogram_edges - edges of histogram bins per column name, shared by
+            the object and all its bins
+        n_contigs, columns - summary over all contigs of the object
+        bins - summary of each bin
+    */
+    typedef structure {
+        list<float> quantile_levels;
+        mapping<string, list<float>> histogram_edges;
+        int n_contigs;
+        mapping<string, ColumnSummary> columns;
+        list<BinSummary> bins;
+    } GetBinnedContigsSummaryResult;
+
+    funcdef get_binned_contigs_summary(GetBinnedContigsSummaryParams params)
+        returns (GetBinnedContigsSummaryResult result) authentication optional;
+
+    /*
+        ref - reference to BinnedContigs object
+        resolution - number of grid cells along each axis (50 by default,
+            500 at most)
+        per_bin - add grid of each bin to the result
+        log_cov - use log10 of coverage for the cov axis
+    */
+    typedef structure {
+        string ref;
+        int resolution;
+        boolean per_bin;
+        boolean log_cov;
+    } GetGcCovDensityParams;
+
+    /*
+        cells - non-empty cells of the bin grid as (gc cell, cov cell,
+            number of contigs) triples
+    */
+    typedef structure {
+        string bin_id;
+        list<tuple<int, int, int>> cells;
+    } BinDensity;
+
+    /*
+        gc_edges, cov_edges - cell boundaries along the axes
+        counts - number of contigs in each cell, counts[i][j] is for gc
+            cell i and cov cell j
+        n_contigs - number of contigs counted
+        n_skipped - number of contigs without gc or cov value (with log_cov
+            also the ones with cov <= 0, which have no logarithm)
+        bins - grid of each bin (only if per_bin is set)
+    */
+    typedef structure {
+        int resolution;
+        boolean log_cov;
+        list<float> gc_edges;
+        list<float> cov_edges;
+        list<list<int>> counts;
+        int n_contigs;
+        int n_skipped;
+        list<BinDensity> bins;
+    } GetGcCovDensityResult;
+
+    funcdef get_gc_cov_density(GetGcCovDensityParams params)
+        returns (GetGcCovDensityResult result) authentication optional;
+
+    /*
+        ref - reference to BinnedContigs object
+        item_type - "bins" (default) to export bins, "contigs" to export
+            contigs of all the bins (each one with bin_id of its bin)
+        format - "tsv" (default, header line comes with the first chunk)
+            or "ndjson" (one JSON object per line)
+        sort_by - optional sorting, contigs come grouped by bin in the
+            order of the object and are sorted within each bin
+        start - position of the first row of the chunk, use next_start of
+            the previous chunk to continue
+        limit - maximum number of rows in the chunk (10000 by default,
+            100000 at most)
+    */
+    typedef structure {
+        string ref;
+        string item_type;
+        string format;
+        list<column_sorting> sort_by;
+        int start;
+        int limit;
+    } ExportBinnedContigsParams;
+
+    /*
+        data - rows of the chunk in requested format
+        next_start - start of the next chunk, -1 when export is complete
+        num_found - number of all rows being exported
+    */
+    typedef structure {
+        string format;
+        string data;
+        int start;
+        int next_start;
+        int num_found;
+    } ExportBinnedContigsResult;
+
+    funcdef export_binned_contigs(ExportBinnedContigsParams params)
+        returns (ExportBinnedContigsResult result) authentication optional;
+
 
     /*
       ref - workspace reference to AnnotatedMetagenomeAssembly Object
@@ -1,16 +1,26 @@
 class AMAUtils():
 
-    def __init__(self, ws):
+    def __init__(self, ws, info_cache=None, token=None):
+        """
+        ws         - Workspace client
+        info_cache - optional ObjectInfoCache used for object info lookups
+        token      - token of the Workspace client (needed with info_cache)
+        """
         self.ws = ws
+        self.info_cache = info_cache
+        self.token = token
 
     def _confirm_ws_type(self, ref):
         """confirm whether 'ref' is of type 'KBaseMetagenomes.AnnotatedMetagenomeAssembly
         if not, throw error. """
         if ref is None:
             raise ValueError(" 'ref' argument must be specified.")
-        obj_info = self.ws.get_object_info3({
-            'objects': [{'ref': ref}]
-        })['infos'][0]
+        if self.info_cache is not None:
+            obj_info = self.info_cache.get_object_info(ref, self.token, self.ws)
+        else:
+            obj_info = self.ws.get_object_info3({
+                'objects': [{'ref': ref}]
+            })['infos'][0]
         # check object type is 'KBaseMetagenome.AnnotatedMetagenomeAssembly'
         obj_type = obj_info[2]
         if 'KBaseMetagenomes.AnnotatedMetagenomeAssembly' not in obj_type:
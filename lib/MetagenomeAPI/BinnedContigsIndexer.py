@@ -1,44 +1,139 @@
 # -*- coding: utf-8 -*-
 import os
 import base64
+import json
+import logging
+import sys
 import time
-import subprocess
-import traceback
-import string
-import tempfile
+import multiprocessing
+from threading import Lock, Thread
 
+import numpy as np
+from cachetools import LRUCache
 from Workspace.WorkspaceClient import Workspace as Workspace
-from MetagenomeAPI.CombinedLineIterator import CombinedLineIterator
+from MetagenomeAPI.Codecs import get_codec
+from MetagenomeAPI.ColumnarTable import ColumnarTable
+from MetagenomeAPI.ContigStats import gc_cov_density, get_bin_groups, summarize_contigs
+from MetagenomeAPI.IndexJanitor import IndexCatalog
+from MetagenomeAPI.IndexManifest import IndexManifest, make_entry
+from MetagenomeAPI.ObjectInfoCache import ObjectInfoCache
+from MetagenomeAPI.SingleFlight import SingleFlight
+from MetagenomeAPI.TokenIndex import TokenIndex, build_postings
+
+
+def save_table(work_unit):
+    """
+    Builds one index table and writes its files. Module level so it can run
+    in the index build process pool. Returns (index_file, manifest entry).
+    work_unit - (column_props_map, size, values, index_file, codec)
+    """
+    column_props_map, size, values, index_file, codec = work_unit
+    table = ColumnarTable.from_values(column_props_map, size, values)
+    table.save(index_file, codec)
+    return index_file, make_entry(table.column_names, size)
+
+
+def build_token_postings(work_unit):
+    """
+    Token postings of a range of table rows, merged into the token index of
+    the table by the process saving it.
+    work_unit - (search texts of the rows, position of the first row)
+    """
+    texts, row_offset = work_unit
+    return build_postings(texts, row_offset)
+
+
+def run_build_task(task):
+    """Runs (function, work unit) task in the index build process pool."""
+    func, work_unit = task
+    return func(work_unit)
+
+
+def get_python_executable():
+    """
+    Python interpreter spawned index build workers run. Under uwsgi (python
+    embedded in the server binary) sys.executable is uwsgi itself, then the
+    interpreter installed next to the python library in use is picked.
+    """
+    if os.path.basename(sys.executable).startswith("python"):
+        return sys.executable
+    for name in ["python%d.%d" % sys.version_info[:2], "python3", "python"]:
+        path = os.path.join(sys.exec_prefix, "bin", name)
+        if os.access(path, os.X_OK):
+            return path
+    return sys.executable
+
 
 class BinnedContigsIndexer:
 
-    def __init__(self, config):
+    def __init__(self, config, info_cache=None, catalog=None):
         self.binnedcontigs_column_props_map = {
-            "bin_id": {"col": 1, "type": ""},
-            "n_contigs": {"col": 2, "type": "n"},
-            "sum_contig_len": {"col": 3, "type": "n"},
-            "gc": {"col": 4, "type": "n"},
-            "cov": {"col": 5, "type": "n"}
+            "bin_id": {"col": 1, "type": "", "dtype": "str"},
+            "n_contigs": {"col": 2, "type": "n", "dtype": "int"},
+            "sum_contig_len": {"col": 3, "type": "n", "dtype": "int"},
+            "gc": {"col": 4, "type": "n", "dtype": "float"},
+            "cov": {"col": 5, "type": "n", "dtype": "float"}
         }
         self.contigs_in_bin_column_props_map = {
-            "id": {"col": 1, "type": ""},
-            "len": {"col": 2, "type": "n"},
-            "gc": {"col": 3, "type": "n"},
-            "cov": {"col": 4, "type": "n"}
+            "id": {"col": 1, "type": "", "dtype": "str"},
+            "len": {"col": 2, "type": "n", "dtype": "int"},
+            "gc": {"col": 3, "type": "n", "dtype": "float"},
+            "cov": {"col": 4, "type": "n", "dtype": "float"}
+        }
+        self.all_contigs_column_props_map = {
+            "id": {"col": 1, "type": "", "dtype": "str", "hash": True},
+            "bin_id": {"col": 2, "type": "", "dtype": "str"},
+            "len": {"col": 3, "type": "n", "dtype": "int"},
+            "gc": {"col": 4, "type": "n", "dtype": "float"},
+            "cov": {"col": 5, "type": "n", "dtype": "float"}
         }
 
         self.BIN_SUFFIX = '_bins'
         self.CONTIGS_SUFFIX = '_ctgs'
+        self.ALL_CONTIGS_SUFFIX = '_allctgs'
+        self.SUMMARY_SUFFIX = '.summary.json'
+        self.EXPORT_FORMATS = ["tsv", "ndjson"]
+        self.MAX_EXPORT_LIMIT = 100000
 
         self.ws_url = config["workspace-url"]
         self.metagenome_index_dir = config["metagenome-index-dir"]
         if not os.path.isdir(self.metagenome_index_dir):
             os.makedirs(self.metagenome_index_dir, exist_ok=True)
         self.debug = "debug" in config and config["debug"] == "1"
-        self.max_sort_mem_size = 250000
         self.unicode_comma = u"\uFF0C"
-
-    def search_binned_contigs(self, token, ref, query, sort_by, start, limit, num_found):
+        self.summary_histogram_bins = int(config.get("summary-histogram-bins", "20"))
+        self.MAX_DENSITY_RESOLUTION = 500
+        level = config.get("index-codec-level")
+        self.codec = get_codec(config.get("index-codec", "none"),
+                               int(level) if level else None)
+        # tables loaded into memory, keyed by index file name and inode (so
+        # files rewritten by upgrade or rebuilt after eviction get reloaded)
+        self.table_cache = LRUCache(int(config.get("metagenome-table-cache-size", "32")))
+        self.table_cache_lock = Lock()
+        # gc/cov density grids, keyed by (object checksum, resolution, log_cov)
+        self.density_cache = LRUCache(int(config.get("density-cache-size", "64")))
+        # export orders of object-wide contig tables (sorted within each bin),
+        # keyed by (object checksum, sort_by)
+        self.export_order_cache = LRUCache(int(config.get("export-order-cache-size", "16")))
+        self.info_cache = info_cache if info_cache is not None else ObjectInfoCache(config)
+        self.catalog = catalog if catalog is not None else IndexCatalog(config)
+        self.manifest = IndexManifest(self.metagenome_index_dir)
+        # process pool building tables of big objects, started on first use
+        self.build_workers = int(config.get("index-build-workers", config.get("workers", "4")))
+        self.parallel_build_min_contigs = int(config.get("index-parallel-build-min-contigs", "20000"))
+        # workers are started fresh ("spawn") rather than forked from the
+        # server process, whose other threads may hold locks at fork time
+        self.build_start_method = config.get("index-build-start-method", "spawn")
+        self.build_python = config.get("index-build-python") or get_python_executable()
+        # how long a build waits for the pool before giving up on it
+        self.build_timeout = int(config.get("index-lock-timeout", "600"))
+        self.build_pool = None
+        self.build_pool_lock = Lock()
+        self.single_flight = SingleFlight(self.metagenome_index_dir,
+                                          wait_timeout=int(config.get("index-lock-timeout", "600")))
+
+    def search_binned_contigs(self, token, ref, query, sort_by, start, limit, num_found,
+                              filters=None):
         if query is None:
             query = ""
         if start is None:
@@ -48,11 +143,12 @@ class BinnedContigsIndexer:
         if self.debug:
             print("Search: BinnedContigs=" + ref + ", query=[" + query + "], sort-by=[" +
                   self.get_sorting_code(self.binnedcontigs_column_props_map, sort_by) +
-                  "], start=" + str(start) + ", limit=" + str(limit))
+                  "], filters=" + str(filters) + ", start=" + str(start) + ", limit=" + str(limit))
             t1 = time.time()
         inner_chsum = self.check_binnedcontigs_cache(ref, token)
-        index_iter = self.get_binnedcontigs_sorted_iterator(inner_chsum, sort_by)
-        ret = self.filter_binnedcontigs_query(index_iter, query, start, limit, num_found)
+        table = self.get_binnedcontigs_table(inner_chsum)
+        ret = self.filter_binnedcontigs_query(table, sort_by, query, start, limit, num_found,
+                                              filters)
         if self.debug:
             print("    (overall-time=" + str(time.time() - t1) + ")")
         return ret
@@ -65,57 +161,69 @@ class BinnedContigsIndexer:
             return ",".join(str(x) for x in value if x)
         return str(value)
 
-    def save_binnedcontigs_tsv(self, bins, inner_chsum):
-        outfile = tempfile.NamedTemporaryFile(dir=self.metagenome_index_dir,
-                                              prefix=inner_chsum + self.BIN_SUFFIX,
-                                              suffix=".tsv", delete=False)
-        with outfile:
-            for bin_data in bins:
-                bin_id = self.to_text(bin_data, "bid")
-                bin_n_contigs = ''
-                if 'n_contigs' in bin_data:
-                    bin_n_contigs = str(bin_data['n_contigs'])
-                bin_sum_contig_len = ''
-                if 'sum_contig_len' in bin_data:
-                    bin_sum_contig_len = str(bin_data['sum_contig_len'])
-                bin_gc = ''
-                if 'gc' in bin_data:
-                    bin_gc = str(bin_data['gc'])
-                bin_cov = ''
-                if 'cov' in bin_data:
-                    bin_cov = str(bin_data['cov'])
-
-                line = u"\t".join(x for x in [bin_id, bin_n_contigs, bin_sum_contig_len, bin_gc, bin_cov]) + u"\n"
-                outfile.write(line.encode("utf-8"))
-
-        subprocess.Popen(["gzip", outfile.name],
-                         stdout=subprocess.PIPE, stderr=subprocess.PIPE).wait()
-        os.rename(outfile.name + ".gz", os.path.join(self.metagenome_index_dir,
-                                                     inner_chsum + self.BIN_SUFFIX + ".tsv.gz"))
+    def save_binnedcontigs_index(self, bins, inner_chsum):
+        values = {col_name: [] for col_name in self.binnedcontigs_column_props_map}
+        for bin_data in bins:
+            values["bin_id"].append(self.to_text(bin_data, "bid"))
+            for col_name in ["n_contigs", "sum_contig_len", "gc", "cov"]:
+                values[col_name].append(bin_data.get(col_name))
+        self.save_tables(inner_chsum, [(self.binnedcontigs_column_props_map, len(bins), values,
+                                        self.get_index_file(inner_chsum, self.BIN_SUFFIX),
+                                        self.codec)])
+
+    def get_index_file(self, inner_chsum, item_type):
+        return os.path.join(self.metagenome_index_dir, inner_chsum + item_type + ".col")
+
+    def convert_legacy_index(self, inner_chsum, item_type, column_props_map):
+        """
+        Converts index in legacy gzip'd TSV format (written by older versions)
+        to column store. Returns False if there is no legacy index.
+        """
+        legacy_file = os.path.join(self.metagenome_index_dir, inner_chsum + item_type + ".tsv.gz")
+        if not os.path.isfile(legacy_file):
+            return False
+        if self.debug:
+            print("    Converting legacy index " + legacy_file + "...")
+            t1 = time.time()
+        index_file = self.get_index_file(inner_chsum, item_type)
+        table = ColumnarTable.from_tsv_file(column_props_map, legacy_file)
+        table.save(index_file, self.codec)
+        self.manifest.update(self.get_object_chsum(inner_chsum),
+                             {index_file: make_entry(table.column_names, table.size)})
+        os.remove(legacy_file)
+        if self.debug:
+            print("    (time=" + str(time.time() - t1) + ")")
+        return True
 
     def check_binnedcontigs_cache(self, ref, token):
-        ws = Workspace(self.ws_url, token=token)
-        info = ws.get_object_info3({"objects": [{"ref": ref}]})['infos'][0]
+        info = self.info_cache.get_object_info(ref, token)
         inner_chsum = info[8]
-        index_file = os.path.join(self.metagenome_index_dir, inner_chsum + self.BIN_SUFFIX + ".tsv.gz")
-        if not os.path.isfile(index_file):
-            if self.debug:
-                print("    Loading WS object...")
-                t1 = time.time()
-
-            included = ["/bins/[*]/bid",
-                        "/bins/[*]/gc",
-                        "/bins/[*]/n_contigs",
-                        "/bins/[*]/sum_contig_len",
-                        "/bins/[*]/cov"
-                        ]
-
-            binnedcontigs = ws.get_objects2({'objects': [{'ref': ref, 'included': included}]})['data'][0]['data']
-            self.save_binnedcontigs_tsv(binnedcontigs["bins"], inner_chsum)
-            if self.debug:
-                print("    (time=" + str(time.time() - t1) + ")")
+        index_file = self.get_index_file(inner_chsum, self.BIN_SUFFIX)
+        self.single_flight.run(inner_chsum + self.BIN_SUFFIX,
+                               lambda: os.path.isfile(index_file),
+                               lambda: self.build_binnedcontigs_index(ref, token, inner_chsum))
         return inner_chsum
 
+    def build_binnedcontigs_index(self, ref, token, inner_chsum):
+        if self.convert_legacy_index(inner_chsum, self.BIN_SUFFIX, self.binnedcontigs_column_props_map):
+            return
+        ws = Workspace(self.ws_url, token=token)
+        if self.debug:
+            print("    Loading WS object...")
+            t1 = time.time()
+
+        included = ["/bins/[*]/bid",
+                    "/bins/[*]/gc",
+                    "/bins/[*]/n_contigs",
+                    "/bins/[*]/sum_contig_len",
+                    "/bins/[*]/cov"
+                    ]
+
+        binnedcontigs = ws.get_objects2({'objects': [{'ref': ref, 'included': included}]})['data'][0]['data']
+        self.save_binnedcontigs_index(binnedcontigs["bins"], inner_chsum)
+        if self.debug:
+            print("    (time=" + str(time.time() - t1) + ")")
+
     def get_column_props(self, column_props_map, col_name):
         if col_name not in column_props_map:
             raise ValueError("Unknown column name '" + col_name + "', " +
@@ -134,107 +242,126 @@ class BinnedContigsIndexer:
             ret += col_pos + ('a' if ascending_order else 'd')
         return ret
 
-    def get_binnedcontigs_sorted_iterator(self, inner_chsum, sort_by):
-        return self.get_sorted_iterator(inner_chsum, sort_by, self.BIN_SUFFIX,
-                                        self.binnedcontigs_column_props_map)
+    def get_binnedcontigs_table(self, inner_chsum):
+        return self.get_table(inner_chsum, self.BIN_SUFFIX, self.binnedcontigs_column_props_map)
 
-    def get_sorted_iterator(self, inner_chsum, sort_by, item_type, column_props_map):
-        input_file = os.path.join(self.metagenome_index_dir, inner_chsum + item_type + ".tsv.gz")
-        if not os.path.isfile(input_file):
+    def get_table(self, inner_chsum, item_type, column_props_map):
+        input_file = self.get_index_file(inner_chsum, item_type)
+        self.catalog.touch(input_file)
+        try:
+            key = (input_file, os.stat(input_file).st_ino)
+        except FileNotFoundError:
             raise ValueError("File not found: " + input_file)
-        if sort_by is None or len(sort_by) == 0:
-            return CombinedLineIterator(input_file)
-        cmd = "gunzip -c \"" + input_file + "\" | sort -f -t\\\t"
-        for column_sorting in sort_by:
-            col_name = column_sorting[0]
-            col_props = self.get_column_props(column_props_map, col_name)
-            col_pos = str(col_props["col"])
-            ascending_order = column_sorting[1]
-            sort_arg = "-k" + col_pos + "," + col_pos + col_props["type"]
-            if not ascending_order:
-                sort_arg += "r"
-            cmd += " " + sort_arg
-        fname = (inner_chsum + "_" + item_type + "_" +
-                 self.get_sorting_code(column_props_map, sort_by))
-        final_output_file = os.path.join(self.metagenome_index_dir, fname + ".tsv.gz")
-        if not os.path.isfile(final_output_file):
-            if self.debug:
-                print("    Sorting...")
-                t1 = time.time()
-            need_to_save = os.path.getsize(input_file) > self.max_sort_mem_size
-            if need_to_save:
-                outfile = tempfile.NamedTemporaryFile(dir=self.metagenome_index_dir,
-                                                      prefix=fname + "_", suffix=".tsv.gz", delete=False)
-                outfile.close()
-                output_file = outfile.name
-                cmd += " | gzip -c > \"" + output_file + "\""
-            p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
-                                 stderr=subprocess.PIPE)
-            if not need_to_save:
-                if self.debug:
-                    print("    (time=" + str(time.time() - t1) + ")")
-                return CombinedLineIterator(p)
-            else:
-                p.wait()
-                os.rename(output_file, final_output_file)
-                if self.debug:
-                    print("    (time=" + str(time.time() - t1) + ")")
-        return CombinedLineIterator(final_output_file)
+        with self.table_cache_lock:
+            table = self.table_cache.get(key)
+        if table is not None:
+            return table
+        if self.debug:
+            print("    Loading table...")
+            t1 = time.time()
+        table = ColumnarTable.from_store_file(column_props_map, input_file)
+        with self.table_cache_lock:
+            self.table_cache[key] = table
+        if not self.manifest.is_current(self.get_object_chsum(inner_chsum), input_file):
+            # old layout is served as is until the upgraded files are there
+            self.start_upgrade(inner_chsum, item_type, column_props_map)
+        if self.debug:
+            print("    (time=" + str(time.time() - t1) + ")")
+        return table
+
+    def forget_files(self, paths):
+        """
+        Drops cached tables loaded from the files (index janitor is about to
+        evict them), so their flocks go away once requests using them finish.
+        """
+        paths = set(paths)
+        with self.table_cache_lock:
+            for key in [key for key in self.table_cache if key[0] in paths]:
+                del self.table_cache[key]
+
+    def get_object_chsum(self, inner_chsum):
+        # object checksums are hex MD5, so never contain '_'
+        return inner_chsum.split('_')[0]
+
+    def start_upgrade(self, inner_chsum, item_type, column_props_map):
+        """
+        Rewrites index table written in older layout (listed with older
+        version in the manifest or written before manifests) in background
+        thread. Only one upgrade of a table runs at a time across processes.
+        """
+        def upgrade():
+            try:
+                self.single_flight.try_run(
+                    inner_chsum + item_type + "_upgrade",
+                    lambda: self.upgrade_table(inner_chsum, item_type, column_props_map))
+            except Exception as ex:
+                logging.error("Upgrade of " + inner_chsum + item_type + " index failed: " + str(ex))
+        Thread(target=upgrade, daemon=True).start()
+
+    def upgrade_table(self, inner_chsum, item_type, column_props_map):
+        index_file = self.get_index_file(inner_chsum, item_type)
+        object_chsum = self.get_object_chsum(inner_chsum)
+        if not os.path.isfile(index_file) or self.manifest.is_current(object_chsum, index_file):
+            return
+        if self.debug:
+            print("    Upgrading index " + index_file + "...")
+            t1 = time.time()
+        table = ColumnarTable.from_store_file(column_props_map, index_file).copy()
+        table.save(index_file, self.codec)
+        self.manifest.update(object_chsum, {index_file: make_entry(table.column_names, table.size)})
+        if self.debug:
+            print("    (time=" + str(time.time() - t1) + ")")
 
-    def filter_binnedcontigs_query(self, index_iter, query, start, limit, num_found):
+    def filter_query(self, table, sort_by, query, start, limit, num_found, unpack, filters=None,
+                     within=None):
         query_words = (str(query).lower().replace('\n',' ').replace('\r',' ').replace('\t',' ').replace(',',' ')).split()
-        # query_words = str(query).lower().translate(string.maketrans("\r\n\t,", "    ")).split()
         if self.debug:
             print("    Filtering...")
             t1 = time.time()
-        fcount = 0
-        bins = []
-        with index_iter:
-            for line in index_iter:
-                if all(word in line.lower() for word in query_words):
-                    if fcount >= start and fcount < start + limit:
-                        bins.append(self.unpack_bin(line.rstrip('\n')))
-                    fcount += 1
-                    if num_found is not None and fcount >= start + limit:
-                        # Having shortcut when real num_found was already known
-                        fcount = num_found
-                        break
+        if not query_words and not filters:
+            # nothing to filter, jump straight to the page, the number of
+            # rows is known from the index file (or the rows given)
+            items = [unpack(table, row) for row in table.get_page(sort_by, start, limit, within)]
+            if self.debug:
+                print("    (time=" + str(time.time() - t1) + ")")
+            return table.size if within is None else len(within), items
+        # range filters and token index give exact number of matches, so
+        # client provided num_found isn't needed anymore
+        if filters:
+            matched = table.get_range_mask(filters)
+        else:
+            matched = np.ones(table.size, dtype=bool)
+        if within is not None:
+            within_matched = np.zeros(table.size, dtype=bool)
+            within_matched[within] = True
+            matched &= within_matched
+        if query_words:
+            query_matched = np.zeros(table.size, dtype=bool)
+            query_matched[table.find_rows(query_words)] = True
+            matched &= query_matched
+        rows = np.flatnonzero(matched)
+        items = [unpack(table, row) for row in table.get_page(sort_by, start, limit, rows)]
         if self.debug:
                 print("    (time=" + str(time.time() - t1) + ")")
+        return len(rows), items
+
+    def filter_binnedcontigs_query(self, table, sort_by, query, start, limit, num_found,
+                                   filters=None):
+        fcount, bins = self.filter_query(table, sort_by, query, start, limit, num_found,
+                                         self.unpack_bin, filters)
         return {"num_found": fcount, "start": start, "bins": bins,
                 "query": query}
 
-    def unpack_bin(self, line, items=None):
-        try:
-            if items is None:
-                items = line.split('\t')
-
-            bin_id = items[0]
-            bin_n_contigs = None
-            bin_sum_contig_len = None
-            bin_gc = None
-            bin_cov = None
-
-            if items[1]:
-                bin_n_contigs = int(items[1])
-            if items[2]:
-                bin_sum_contig_len = int(items[2])
-            if items[3]:
-                bin_gc = float(items[3])
-            if items[4]:
-                bin_cov = float(items[4])
-
-            return {'bin_id': bin_id,
-                    'n_contigs': bin_n_contigs,
-                    'sum_contig_len': bin_sum_contig_len,
-                    'gc': bin_gc,
-                    'cov': bin_cov
-                    }
-        except:
-            raise ValueError("Error parsing bin from: [" + line + "]\n" +
-                             "Cause: " + traceback.format_exc())
-
-    def search_contigs_in_bin(self, token, ref, bin_id, query, sort_by, start, limit, num_found):
+    def unpack_bin(self, table, row):
+        return {'bin_id': table.get_value('bin_id', row),
+                'n_contigs': table.get_value('n_contigs', row),
+                'sum_contig_len': table.get_value('sum_contig_len', row),
+                'gc': table.get_value('gc', row),
+                'cov': table.get_value('cov', row)
+                }
+
+    def search_contigs_in_bin(self, token, ref, bin_id, query, sort_by, start, limit, num_found,
+                              filters=None):
         if bin_id is None:
             raise ValueError('bin_id input parameter field is missing')
         if query is None:
@@ -246,121 +373,416 @@ class BinnedContigsIndexer:
         if self.debug:
             print("Search contigs in bin: BinnedContigs=" + ref + ", bin=" + bin_id + ", query=[" + query + "], " +
                   "sort-by=[" + self.get_sorting_code(self.contigs_in_bin_column_props_map,
-                  sort_by) + "], start=" + str(start) + ", limit=" + str(limit))
+                  sort_by) + "], filters=" + str(filters) + ", start=" + str(start) +
+                  ", limit=" + str(limit))
             t1 = time.time()
         inner_chsum = self.check_contigs_in_bin_cache(ref, bin_id, token)
-        index_iter = self.get_contigs_in_bin_sorted_iterator(inner_chsum, sort_by)
-        ret = self.filter_contig_query(index_iter, query, bin_id, start, limit, num_found)
+        table = self.get_contigs_in_bin_table(inner_chsum)
+        ret = self.filter_contig_query(table, sort_by, query, bin_id, start, limit, num_found,
+                                       filters)
         if self.debug:
             print("    (overall-time=" + str(time.time() - t1) + ")")
         return ret
 
     def check_contigs_in_bin_cache(self, binnedcontigs_ref, bin_id, token):
-        ws = Workspace(self.ws_url, token=token)
-
-        info = ws.get_object_info3({"objects": [{"ref": binnedcontigs_ref}]})['infos'][0]
-
-        # base64 encode the string so it is safe for filenames and still unique per contig id
-        b64key = base64.urlsafe_b64encode(bin_id.encode("utf-8")).decode('utf-8')
-
-        inner_chsum = info[8] + '_' + b64key
-        index_file = os.path.join(self.metagenome_index_dir, inner_chsum + self.CONTIGS_SUFFIX + ".tsv.gz")
+        info = self.info_cache.get_object_info(binnedcontigs_ref, token)
+
+        inner_chsum = self.get_contigs_in_bin_chsum(info[8], bin_id)
+        index_file = self.get_index_file(inner_chsum, self.CONTIGS_SUFFIX)
+        # marker is there when contigs of every bin of the object are indexed
+        marker_file = self.get_all_bins_marker_file(info[8])
+
+        def build():
+            if not self.convert_legacy_index(inner_chsum, self.CONTIGS_SUFFIX,
+                                             self.contigs_in_bin_column_props_map):
+                ws = Workspace(self.ws_url, token=token)
+                self.save_all_contigs_in_bins(ws, binnedcontigs_ref, info[8])
+
+        def is_done():
+            if os.path.isfile(index_file):
+                return True
+            # bin listed in the marker but missing was removed by index janitor
+            return os.path.isfile(marker_file) and \
+                bin_id not in self.get_indexed_bin_ids(info[8])
+
+        self.single_flight.run(info[8] + self.CONTIGS_SUFFIX, is_done, build)
         if not os.path.isfile(index_file):
-            if self.debug:
-                t1 = time.time()
-
-            # get the position in the array of the bin
-            binnedcontigs = ws.get_objects2({'objects': [{'ref': binnedcontigs_ref,
-                                             'included': ["/bins/[*]/bid"]}]})['data'][0]['data']
-            pos = 0
-            found = False
-            for b in binnedcontigs['bins']:
-                if b['bid'] == bin_id:
-                    found = True
-                    break
-                pos += 1
-            if not found:
-                raise ValueError('No Bin with ID: "' + bin_id + '" found.')
-
-            # get the contigs map
-            selection = ws.get_objects2({'objects': [{'ref': binnedcontigs_ref,
-                                         'included': ['/bins/' + str(pos) + '/contigs',
-                                                      '/bins/' + str(pos) + '/bid']}]})['data'][0]['data']
-            if selection['bins'][0]['bid'] != bin_id:
-                raise ValueError('Something went wrong- bin ids do not match on second ws get_objects2 call')
-
-            contigs = selection['bins'][0]['contigs']
-            self.save_contigs_in_bin_tsv(contigs, inner_chsum)
-            if self.debug:
-                print("    (time=" + str(time.time() - t1) + ")")
+            raise ValueError('No Bin with ID: "' + bin_id + '" found.')
         return inner_chsum
 
-    def save_contigs_in_bin_tsv(self, contigs, inner_chsum):
-        outfile = tempfile.NamedTemporaryFile(dir=self.metagenome_index_dir, mode='w+',
-                                              prefix=inner_chsum + self.CONTIGS_SUFFIX, suffix=".tsv", delete=False)
-
-        with outfile:
-            for contig_id in contigs:
-                info = contigs[contig_id]
+    def get_contigs_in_bin_chsum(self, binnedcontigs_chsum, bin_id):
+        # base64 encode the string so it is safe for filenames and still unique per contig id
+        b64key = base64.urlsafe_b64encode(bin_id.encode("utf-8")).decode('utf-8')
+        return binnedcontigs_chsum + '_' + b64key
 
-                contig_len = ''
-                if 'len' in info:
-                    contig_len = str(info['len'])
-                contig_gc = ''
-                if 'gc' in info:
-                    contig_gc = str(info['gc'])
-                contig_cov = ''
-                if 'cov' in info:
-                    contig_cov = str(info['cov'])
+    def get_all_bins_marker_file(self, binnedcontigs_chsum):
+        return os.path.join(self.metagenome_index_dir, binnedcontigs_chsum + self.CONTIGS_SUFFIX + ".done")
 
-                outfile.write("\t".join([contig_id, contig_len, contig_gc, contig_cov]) + "\n")
+    def get_indexed_bin_ids(self, binnedcontigs_chsum):
+        """Ids of bins (in the object order) listed in the all-bins marker."""
+        try:
+            with open(self.get_all_bins_marker_file(binnedcontigs_chsum)) as f:
+                return json.load(f)["bins"]
+        except FileNotFoundError:
+            return []
+
+    def check_all_contigs_in_bins_cache(self, binnedcontigs_ref, token):
+        """
+        Makes sure contigs of every bin (and the object-wide contig table) are
+        indexed. Returns checksum of the object and ids of its bins.
+        """
+        info = self.info_cache.get_object_info(binnedcontigs_ref, token)
+        marker_file = self.get_all_bins_marker_file(info[8])
+        all_contigs_file = self.get_index_file(info[8], self.ALL_CONTIGS_SUFFIX)
+
+        def is_done():
+            if not os.path.isfile(marker_file) or not os.path.isfile(all_contigs_file):
+                return False
+            for bin_id in self.get_indexed_bin_ids(info[8]):
+                inner_chsum = self.get_contigs_in_bin_chsum(info[8], bin_id)
+                if not os.path.isfile(self.get_index_file(inner_chsum, self.CONTIGS_SUFFIX)):
+                    return False
+            return True
+
+        self.single_flight.run(info[8] + self.CONTIGS_SUFFIX, is_done,
+                               lambda: self.save_all_contigs_in_bins(Workspace(self.ws_url, token=token),
+                                                                     binnedcontigs_ref, info[8]))
+        return info[8], self.get_indexed_bin_ids(info[8])
+
+    def save_all_contigs_in_bins(self, ws, binnedcontigs_ref, binnedcontigs_chsum):
+        """
+        Indexes contigs of every bin of BinnedContigs object (each bin on its
+        own and all of them in one object-wide table) using one Workspace
+        call, then writes marker file saying the object is done.
+        """
+        if self.debug:
+            print("    Loading contigs of all bins...")
+            t1 = time.time()
+        binnedcontigs = ws.get_objects2({'objects': [{'ref': binnedcontigs_ref,
+                                         'included': ["/bins/[*]/bid",
+                                                      "/bins/[*]/contigs"]}]})['data'][0]['data']
+        bins = binnedcontigs['bins']
+        bin_ids = []
+        work_units = []
+        all_values = {col_name: [] for col_name in self.all_contigs_column_props_map}
+        for pos in range(len(bins)):
+            bin_data = bins[pos]
+            bins[pos] = None
+            bin_ids.append(bin_data['bid'])
+            values = self.get_contigs_in_bin_values(bin_data['contigs'])
+            inner_chsum = self.get_contigs_in_bin_chsum(binnedcontigs_chsum, bin_data['bid'])
+            work_units.append((self.contigs_in_bin_column_props_map, len(values["id"]), values,
+                               self.get_index_file(inner_chsum, self.CONTIGS_SUFFIX), self.codec))
+            for col_name in values:
+                all_values[col_name].extend(values[col_name])
+            all_values["bin_id"].extend([bin_data['bid']] * len(values["id"]))
+        all_contigs_file = self.get_index_file(binnedcontigs_chsum, self.ALL_CONTIGS_SUFFIX)
+        work_units.append((self.all_contigs_column_props_map, len(all_values["id"]), all_values,
+                           all_contigs_file, self.codec))
+        self.save_tables(binnedcontigs_chsum, work_units)
+        # merge step: object-wide summary and the marker
+        table = ColumnarTable.from_store_file(self.all_contigs_column_props_map, all_contigs_file)
+        self.save_summary(binnedcontigs_chsum, table, bin_ids)
+        with open(self.get_all_bins_marker_file(binnedcontigs_chsum), 'w') as f:
+            json.dump({"bins": bin_ids}, f)
+        if self.debug:
+            print("    (time=" + str(time.time() - t1) + ")")
+
+    def run_work_units(self, work_units):
+        """
+        Saves index tables, in the process pool when there are enough contigs
+        to be worth it (biggest tables are started first). Returns manifest
+        entries of the tables.
+        """
+        total_size = sum(work_unit[1] for work_unit in work_units)
+        if self.build_workers <= 1 or total_size < self.parallel_build_min_contigs:
+            return dict(save_table(work_unit) for work_unit in work_units)
+        # table bigger than a worker's share (the object-wide one) would keep
+        # one worker busy long after the rest are done, it's saved here while
+        # its token index (most of the build time) is built in row ranges
+        share = -(-total_size // self.build_workers)
+        tasks = []
+        split_tables = []
+        for work_unit in work_units:
+            column_props_map, size, values, index_file, codec = work_unit
+            if size <= share:
+                tasks.append((size, save_table, work_unit))
+                continue
+            table = ColumnarTable.from_values(column_props_map, size, values)
+            texts = table.search_texts
+            task_positions = []
+            for start in range(0, size, share):
+                task_positions.append(len(tasks))
+                tasks.append((min(share, size - start), build_token_postings,
+                              (texts[start:start + share], start)))
+            split_tables.append((table, index_file, codec, task_positions))
+
+        def prepare_split_tables():
+            # sort helpers and hash indexes are computed while the pool works
+            for table, _, _, _ in split_tables:
+                for col_name in table.column_names:
+                    table.get_ascending_order(col_name)
+                    if table.column_props_map[col_name].get("hash"):
+                        table.get_hash_index(col_name)
+
+        # biggest tasks are started first
+        order = sorted(range(len(tasks)), key=lambda pos: tasks[pos][0], reverse=True)
+        results = dict(zip(order, self.map_on_build_pool(
+            run_build_task, [tasks[pos][1:] for pos in order], prepare_split_tables)))
+        entries = dict(results[pos] for pos in range(len(tasks)) if tasks[pos][1] is save_table)
+        for table, index_file, codec, task_positions in split_tables:
+            table.set_token_index(TokenIndex.merge([results[pos] for pos in task_positions]))
+            table.save(index_file, codec)
+            entries[index_file] = make_entry(table.column_names, table.size)
+        return entries
+
+    def map_on_build_pool(self, func, items, while_waiting=None):
+        """
+        Runs func over items in the build process pool (calling while_waiting
+        in this process meanwhile). Pool which doesn't deliver within
+        build_timeout (e.g. its workers can't start) is terminated, so the
+        build fails instead of holding its lock forever.
+        """
+        with self.build_pool_lock:
+            if self.build_pool is None:
+                context = multiprocessing.get_context(self.build_start_method)
+                if self.build_start_method != "fork":
+                    context.set_executable(self.build_python)
+                self.build_pool = context.Pool(self.build_workers)
+            pool = self.build_pool
+        try:
+            result = pool.map_async(func, items, chunksize=1)
+            if while_waiting is not None:
+                while_waiting()
+            return result.get(self.build_timeout)
+        except multiprocessing.TimeoutError:
+            with self.build_pool_lock:
+                if self.build_pool is pool:
+                    self.build_pool = None
+            pool.terminate()
+            raise RuntimeError("Index build workers didn't finish within " +
+                               str(self.build_timeout) + " seconds")
+
+    def save_tables(self, binnedcontigs_chsum, work_units):
+        """Saves index tables of BinnedContigs object and lists them in its manifest."""
+        self.manifest.update(binnedcontigs_chsum, self.run_work_units(work_units))
+
+    def get_contigs_in_bin_values(self, contigs):
+        values = {col_name: [] for col_name in self.contigs_in_bin_column_props_map}
+        for contig_id in contigs:
+            info = contigs[contig_id]
+            values["id"].append(contig_id)
+            for col_name in ["len", "gc", "cov"]:
+                values[col_name].append(info.get(col_name))
+        return values
+
+    def save_contigs_in_bin_index(self, contigs, inner_chsum):
+        self.save_tables(self.get_object_chsum(inner_chsum),
+                         [(self.contigs_in_bin_column_props_map, len(contigs),
+                           self.get_contigs_in_bin_values(contigs),
+                           self.get_index_file(inner_chsum, self.CONTIGS_SUFFIX), self.codec)])
+
+    def get_contigs_in_bin_table(self, inner_chsum):
+        return self.get_table(inner_chsum, self.CONTIGS_SUFFIX, self.contigs_in_bin_column_props_map)
+
+    def filter_contig_query(self, table, sort_by, query, bin_id, start, limit, num_found,
+                            filters=None):
+        fcount, contigs = self.filter_query(table, sort_by, query, start, limit, num_found,
+                                            self.unpack_contig_in_bin, filters)
+        return {"num_found": fcount, "start": start, "contigs": contigs,
+                "query": query, 'bin_id': bin_id}
 
-        subprocess.Popen(["gzip", outfile.name],
-                         stdout=subprocess.PIPE, stderr=subprocess.PIPE).wait()
-        os.rename(outfile.name + ".gz",
-                  os.path.join(self.metagenome_index_dir, inner_chsum + self.CONTIGS_SUFFIX + ".tsv.gz"))
+    def search_contigs_in_binned_contigs(self, token, ref, contig_id, query, sort_by, start, limit,
+                                         num_found, filters=None):
+        if query is None:
+            query = ""
+        if start is None:
+            start = 0
+        if limit is None:
+            limit = 50
+        if self.debug:
+            print("Search contigs in BinnedContigs=" + ref + ", contig_id=" + str(contig_id) +
+                  ", query=[" + query + "], sort-by=[" +
+                  self.get_sorting_code(self.all_contigs_column_props_map, sort_by) +
+                  "], filters=" + str(filters) + ", start=" + str(start) +
+                  ", limit=" + str(limit))
+            t1 = time.time()
+        binnedcontigs_chsum, _ = self.check_all_contigs_in_bins_cache(ref, token)
+        table = self.get_table(binnedcontigs_chsum, self.ALL_CONTIGS_SUFFIX,
+                               self.all_contigs_column_props_map)
+        within = None
+        if contig_id is not None:
+            within = table.find_equal_rows("id", contig_id)
+        fcount, contigs = self.filter_query(table, sort_by, query, start, limit, num_found,
+                                            self.unpack_contig, filters, within)
+        ret = {"num_found": fcount, "start": start, "contigs": contigs, "query": query}
+        if self.debug:
+            print("    (overall-time=" + str(time.time() - t1) + ")")
+        return ret
 
-    def get_contigs_in_bin_sorted_iterator(self, inner_chsum, sort_by):
-        return self.get_sorted_iterator(inner_chsum, sort_by, self.CONTIGS_SUFFIX,
-                                        self.contigs_in_bin_column_props_map)
+    def unpack_contig(self, table, row):
+        return {'contig_id': table.get_value('id', row),
+                'bin_id': table.get_value('bin_id', row),
+                'len': table.get_value('len', row),
+                'gc': table.get_value('gc', row),
+                'cov': table.get_value('cov', row)}
+
+    def get_summary_file(self, binnedcontigs_chsum):
+        return os.path.join(self.metagenome_index_dir,
+                            binnedcontigs_chsum + self.ALL_CONTIGS_SUFFIX + self.SUMMARY_SUFFIX)
+
+    def save_summary(self, binnedcontigs_chsum, all_contigs_table, bin_ids):
+        summary = summarize_contigs(all_contigs_table, bin_ids, self.summary_histogram_bins)
+        summary_file = self.get_summary_file(binnedcontigs_chsum)
+        tmp_file = summary_file + "." + str(os.getpid()) + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(summary, f)
+        os.rename(tmp_file, summary_file)
+
+    def get_binned_contigs_summary(self, token, ref):
+        """
+        Returns distribution summaries of contig len, gc and cov for the whole
+        BinnedContigs object and for each of its bins.
+        """
+        if self.debug:
+            print("Summary: BinnedContigs=" + ref)
+            t1 = time.time()
+        binnedcontigs_chsum, bin_ids = self.check_all_contigs_in_bins_cache(ref, token)
+        summary_file = self.get_summary_file(binnedcontigs_chsum)
+
+        def build():
+            # objects indexed before summaries were introduced
+            table = self.get_table(binnedcontigs_chsum, self.ALL_CONTIGS_SUFFIX,
+                                   self.all_contigs_column_props_map)
+            self.save_summary(binnedcontigs_chsum, table, bin_ids)
+
+        self.single_flight.run(binnedcontigs_chsum + self.ALL_CONTIGS_SUFFIX,
+                               lambda: os.path.isfile(summary_file), build)
+        with open(summary_file) as f:
+            ret = json.load(f)
+        if self.debug:
+            print("    (overall-time=" + str(time.time() - t1) + ")")
+        return ret
 
-    def filter_contig_query(self, index_iter, query, bin_id, start, limit, num_found):
-        query_words = (str(query).lower().replace('\n',' ').replace('\r',' ').replace('\t',' ').replace(',',' ')).split()
-        # query_words = str(query).lower().translate(string.maketrans("\r\n\t,", "    ")).split()
+    def get_gc_cov_density(self, token, ref, resolution, per_bin, log_cov):
+        """
+        Returns grid of contig counts over (gc, cov) of all contigs of the
+        BinnedContigs object, with sparse per bin grids if per_bin is set.
+        """
+        if resolution is None:
+            resolution = 50
+        if resolution < 1 or resolution > self.MAX_DENSITY_RESOLUTION:
+            raise ValueError("resolution should be between 1 and " +
+                             str(self.MAX_DENSITY_RESOLUTION))
         if self.debug:
-            print("    Filtering...")
+            print("Density: BinnedContigs=" + ref + ", resolution=" + str(resolution) +
+                  ", per_bin=" + str(per_bin) + ", log_cov=" + str(log_cov))
             t1 = time.time()
-        fcount = 0
-        contigs = []
-        with index_iter:
-            for line in index_iter:
-                if all(word in line.lower() for word in query_words):
-                    if fcount >= start and fcount < start + limit:
-                        contigs.append(self.unpack_contig_in_bin(line.rstrip('\n')))
-                    fcount += 1
-                    if num_found is not None and fcount >= start + limit:
-                        # Having shortcut when real num_found was already known
-                        fcount = num_found
-                        break
+        binnedcontigs_chsum, bin_ids = self.check_all_contigs_in_bins_cache(ref, token)
+        key = (binnedcontigs_chsum, resolution, bool(log_cov))
+        with self.table_cache_lock:
+            density = self.density_cache.get(key)
+        if density is None:
+            table = self.get_table(binnedcontigs_chsum, self.ALL_CONTIGS_SUFFIX,
+                                   self.all_contigs_column_props_map)
+            density = gc_cov_density(table, bin_ids, resolution, bool(log_cov))
+            with self.table_cache_lock:
+                self.density_cache[key] = density
+        ret = dict(density)
+        if not per_bin:
+            del ret["bins"]
         if self.debug:
-                print("    (time=" + str(time.time() - t1) + ")")
-        return {"num_found": fcount, "start": start, "contigs": contigs,
-                "query": query, 'bin_id': bin_id}
+            print("    (overall-time=" + str(time.time() - t1) + ")")
+        return ret
 
-    def unpack_contig_in_bin(self, line, items=None):
-        try:
-            if items is None:
-                items = line.split('\t')
-            contig_id = items[0]
-            contig_len = int(items[1])
-            contig_gc = float(items[2])
-            contig_cov = None
-            if items[3]:
-                contig_cov = float(items[3])
-            return {'contig_id': contig_id,
-                    'len': contig_len,
-                    'gc': contig_gc,
-                    'cov': contig_cov}
-        except:
-            raise ValueError("Error parsing contig from: [" + line + "]\n" +
-                             "Cause: " + traceback.format_exc())
+    def export_binned_contigs(self, token, ref, item_type, export_format, sort_by, start, limit):
+        """
+        Returns chunk of all bins (item_type "bins") or all contigs of all
+        bins ("contigs") formatted as TSV or NDJSON text. Contigs come grouped
+        by bin in the object order, sort_by is applied within each bin.
+        """
+        if item_type is None:
+            item_type = "bins"
+        if export_format is None:
+            export_format = "tsv"
+        if start is None:
+            start = 0
+        if limit is None:
+            limit = 10000
+        if start < 0:
+            raise ValueError("start should be non-negative, found: " + str(start))
+        if limit < 1:
+            raise ValueError("limit should be positive, found: " + str(limit))
+        if item_type not in ("bins", "contigs"):
+            raise ValueError("Unknown item_type '" + item_type + "', please use one of " +
+                             str(["bins", "contigs"]))
+        if export_format not in self.EXPORT_FORMATS:
+            raise ValueError("Unknown format '" + export_format + "', please use one of " +
+                             str(self.EXPORT_FORMATS))
+        limit = min(limit, self.MAX_EXPORT_LIMIT)
+        if self.debug:
+            print("Export: BinnedContigs=" + ref + ", item_type=" + item_type + ", format=" +
+                  export_format + ", start=" + str(start) + ", limit=" + str(limit))
+            t1 = time.time()
+        items = []
+        if item_type == "bins":
+            columns = ["bin_id", "n_contigs", "sum_contig_len", "gc", "cov"]
+            table = self.get_binnedcontigs_table(self.check_binnedcontigs_cache(ref, token))
+            items = [self.unpack_bin(table, row) for row in table.get_page(sort_by, start, limit)]
+            num_found = table.size
+        else:
+            columns = ["bin_id", "contig_id", "len", "gc", "cov"]
+            binnedcontigs_chsum, bin_ids = self.check_all_contigs_in_bins_cache(ref, token)
+            table = self.get_table(binnedcontigs_chsum, self.ALL_CONTIGS_SUFFIX,
+                                   self.all_contigs_column_props_map)
+            end = min(start + limit, table.size)
+            if sort_by is None or len(sort_by) == 0:
+                # rows of object-wide table come bin by bin in the object order
+                rows = range(start, end)
+            else:
+                rows = self.get_export_order(binnedcontigs_chsum, table, bin_ids, sort_by)[start:end]
+            for row in rows:
+                item = {'bin_id': table.get_value('bin_id', row)}
+                item.update(self.unpack_contig_in_bin(table, row))
+                items.append(item)
+            num_found = table.size
+        if export_format == "tsv":
+            lines = ["\t".join(columns)] if start == 0 else []
+            for item in items:
+                lines.append("\t".join('' if item[col] is None else str(item[col])
+                                       for col in columns))
+        else:
+            lines = [json.dumps(item) for item in items]
+        next_start = start + len(items)
+        if self.debug:
+            print("    (overall-time=" + str(time.time() - t1) + ")")
+        return {"format": export_format,
+                "data": "".join(line + "\n" for line in lines),
+                "start": start,
+                "next_start": next_start if next_start < num_found else -1,
+                "num_found": num_found}
+
+    def get_export_order(self, binnedcontigs_chsum, table, bin_ids, sort_by):
+        """
+        Row positions of object-wide contig table grouped by bin in the object
+        order and ordered according to sort_by within each bin.
+        """
+        key = (binnedcontigs_chsum,
+               tuple((column_sorting[0], bool(column_sorting[1])) for column_sorting in sort_by))
+        with self.table_cache_lock:
+            order = self.export_order_cache.get(key)
+        if order is None:
+            bin_pos = np.zeros(table.size, dtype=np.int32)
+            for pos, rows in enumerate(get_bin_groups(table, bin_ids)):
+                bin_pos[rows] = pos
+            order = np.asarray(table.get_sorted_order(sort_by))
+            order = order[np.argsort(bin_pos[order], kind="stable")]
+            with self.table_cache_lock:
+                self.export_order_cache[key] = order
+        return order
+
+    def unpack_contig_in_bin(self, table, row):
+        return {'contig_id': table.get_value('id', row),
+                'len': table.get_value('len', row),
+                'gc': table.get_value('gc', row),
+                'cov': table.get_value('cov', row)}
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import gzip
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+
+# This class reads lines of .gz file, plain file or subprocess output in big
+# chunks. Chunks are split on newlines in bulk and lines are returned as
+# bytes, so callers decode only the lines they actually use (or use
+# text_chunks() to decode whole chunk at once). Stopping early (leaving the
+# "with" block) just closes the source, so subprocess writing into the pipe
+# stops by itself instead of being polled line by line and killed.
+class ChunkedLineReader:
+
+    def __init__(self, source, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        source - path of gzip'd (.gz) or plain file, subprocess.Popen with
+                 stdout=PIPE or binary file object
+        """
+        self.chunk_size = chunk_size
+        self.process = None
+        if isinstance(source, str):
+            self.file = gzip.open(source, "rb") if source.endswith(".gz") else open(source, "rb")
+        elif hasattr(source, "stdout") and hasattr(source, "poll"):
+            self.process = source
+            self.file = source.stdout
+        else:
+            self.file = source
+
+    def close(self):
+        self.file.close()
+        if self.process is not None:
+            # closed pipe makes the process stop on its next write
+            self.process.wait()
+
+    def blocks(self):
+        """Yields chunks of whole lines (bytes without the last newline)."""
+        tail = b""
+        while True:
+            data = self.file.read(self.chunk_size)
+            if not data:
+                break
+            end = data.rfind(b"\n")
+            if end < 0:
+                tail += data
+                continue
+            yield tail + data[:end]
+            tail = data[end + 1:]
+        if tail:
+            yield tail
+
+    def chunks(self):
+        """Yields lists of lines (bytes without the trailing newline)."""
+        for block in self.blocks():
+            yield block.split(b"\n")
+
+    def text_chunks(self):
+        """Same as chunks() with lines decoded, one decode call per chunk."""
+        for block in self.blocks():
+            yield block.decode("utf-8").split("\n")
+
+    # iterator implementation
+    def __iter__(self):
+        for lines in self.chunks():
+            yield from lines
+
+    # context management (inside "with" block)
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
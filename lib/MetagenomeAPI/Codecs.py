@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import zlib
+
+# optional faster codecs, available when the packages are installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+
+class NoneCodec:
+    """Stores data as is (column store sections stay memory mapped)."""
+    name = "none"
+
+    def compress(self, data):
+        return data
+
+    def decompress(self, data, raw_len):
+        return data
+
+
+class GzipCodec:
+    name = "gzip"
+
+    def __init__(self, level=None):
+        self.level = 6 if level is None else level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data, raw_len):
+        return zlib.decompress(data, bufsize=max(raw_len, 1))
+
+
+class ZstdCodec:
+    name = "zstd"
+
+    def __init__(self, level=None):
+        self.level = 3 if level is None else level
+
+    def compress(self, data):
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def decompress(self, data, raw_len):
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=raw_len)
+
+
+class Lz4Codec:
+    name = "lz4"
+
+    def __init__(self, level=None):
+        self.level = 0 if level is None else level
+
+    def compress(self, data):
+        return lz4_frame.compress(data, compression_level=self.level)
+
+    def decompress(self, data, raw_len):
+        return lz4_frame.decompress(data)
+
+
+CODECS = {"none": NoneCodec, "gzip": GzipCodec, "zstd": ZstdCodec, "lz4": Lz4Codec}
+# python packages the optional codecs need
+CODEC_PACKAGES = {"zstd": "zstandard", "lz4": "lz4"}
+
+
+def get_available_codecs():
+    ret = ["none", "gzip"]
+    if zstandard is not None:
+        ret.append("zstd")
+    if lz4_frame is not None:
+        ret.append("lz4")
+    return ret
+
+
+def get_codec(name, level=None):
+    """
+    Returns codec by name ("none", "gzip", "zstd" or "lz4"). level is codec
+    specific compression level (None for codec's default).
+    """
+    if name not in CODECS:
+        raise ValueError("Unknown codec '" + name + "', please use one of " +
+                         str(sorted(CODECS.keys())))
+    if name not in get_available_codecs():
+        raise ValueError("Codec '" + name + "' requires python package '" +
+                         CODEC_PACKAGES[name] + "' which is not installed")
+    if name == "none":
+        return NoneCodec()
+    return CODECS[name](level)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+import fcntl
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from MetagenomeAPI.Codecs import get_codec, NoneCodec
+
+# Binary column store layout (all numbers little-endian):
+#   MAGIC, uint32 format version
+#   column sections, each one starting at an 8-byte aligned offset
+#   JSON footer describing the columns, uint64 footer length, MAGIC
+# Numeric columns are stored as fixed-width arrays ("int64" using INT_NULL for
+# missing values, "float64" using NaN), string columns as an int64 offsets
+# array (n_rows + 1 items) followed by a blob of utf-8 encoded values. "bytes"
+# columns use the same layout for raw binary values. Sections of a column can
+# be compressed by the codec named in its footer entry (version 2 files only),
+# sections then also carry their uncompressed length.
+MAGIC = b"MGCS"
+FORMAT_VERSION = 2
+INT_NULL = np.iinfo(np.int64).min
+_ALIGN = 8
+
+
+class StringColumn:
+    """Lazily decoded view over an offsets+blob string (or bytes) column."""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, pos):
+        return self.get_bytes(pos).decode("utf-8")
+
+    def get_bytes(self, pos):
+        return bytes(self.blob[self.offsets[pos]:self.offsets[pos + 1]])
+
+    def to_list(self):
+        data = bytes(self.blob)
+        text = data.decode("utf-8")
+        offsets = self.offsets.tolist()
+        if len(text) == len(data):
+            # plain ascii, byte offsets can be used on decoded text directly
+            return [text[offsets[i]:offsets[i + 1]] for i in range(len(self))]
+        return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(self))]
+
+
+def encode_strings(values):
+    return encode_bytes([v.encode("utf-8") for v in values])
+
+
+def encode_bytes(encoded):
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(v) for v in encoded], out=offsets[1:])
+    return offsets, b"".join(encoded)
+
+
+def write_column_store(path, n_rows, columns, metadata=None, codec=None):
+    """
+    Writes column store file. Write goes to temporary file in the same folder
+    which is renamed at the end so readers never see partial data.
+
+    path     - target file
+    n_rows   - number of rows in every column
+    columns  - list of (name, kind, values) where kind is numpy type name
+               ("int32", "int64", "float64"), "str" or "bytes" (values being
+               list of strings or bytes in the last two cases)
+    metadata - optional json-serializable dict stored in the footer
+    codec    - optional codec (see Codecs) compressing column sections
+    """
+    if codec is None:
+        codec = NoneCodec()
+    footer = {"n_rows": n_rows, "columns": {}, "metadata": metadata or {}}
+    # uncompressed files stay readable by older versions
+    version = 1 if codec.name == "none" else FORMAT_VERSION
+    outfile = tempfile.NamedTemporaryFile(dir=os.path.dirname(path),
+                                          prefix=os.path.basename(path) + "_",
+                                          suffix=".tmp", delete=False)
+    try:
+        with outfile:
+            outfile.write(MAGIC + struct.pack("<I", version))
+            for name, kind, values in columns:
+                if len(values) != n_rows:
+                    raise ValueError("Column '" + name + "' has " + str(len(values)) +
+                                     " values, expected " + str(n_rows))
+                if kind in ("str", "bytes"):
+                    if kind == "str":
+                        offsets, blob = encode_strings(values)
+                    else:
+                        offsets, blob = encode_bytes(values)
+                    col_info = {"kind": kind,
+                                "offsets": _write_section(outfile, offsets.tobytes(), codec),
+                                "blob": _write_section(outfile, blob, codec)}
+                else:
+                    data = np.ascontiguousarray(values, dtype=np.dtype(kind).newbyteorder("<"))
+                    col_info = {"kind": kind,
+                                "data": _write_section(outfile, data.tobytes(), codec)}
+                if codec.name != "none":
+                    col_info["codec"] = codec.name
+                footer["columns"][name] = col_info
+            footer_data = json.dumps(footer).encode("utf-8")
+            outfile.write(footer_data)
+            outfile.write(struct.pack("<Q", len(footer_data)) + MAGIC)
+        os.rename(outfile.name, path)
+    except BaseException:
+        if os.path.exists(outfile.name):
+            os.remove(outfile.name)
+        raise
+
+
+def _write_section(outfile, data, codec):
+    pos = outfile.tell()
+    if pos % _ALIGN:
+        outfile.write(b"\0" * (_ALIGN - pos % _ALIGN))
+        pos = outfile.tell()
+    if codec.name == "none":
+        outfile.write(data)
+        return [pos, len(data)]
+    compressed = codec.compress(data)
+    outfile.write(compressed)
+    return [pos, len(compressed), len(data)]
+
+
+# Read-only memory mapped access to column store file. Column arrays returned
+# are views over the mapping, so only pages actually touched are read
+# (compressed columns are decompressed into memory on first access). Shared
+# flock is held on the file while the store is alive so index janitor knows
+# the file is in use.
+class ColumnStore:
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        fcntl.flock(self.file, fcntl.LOCK_SH)
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:4] != MAGIC or self.mm[-4:] != MAGIC:
+            raise ValueError("File is not a column store: " + path)
+        self.version = struct.unpack("<I", self.mm[4:8])[0]
+        if self.version > FORMAT_VERSION:
+            raise ValueError("Unsupported column store version " + str(self.version) +
+                             " in file: " + path)
+        footer_len = struct.unpack("<Q", self.mm[-12:-4])[0]
+        footer = json.loads(self.mm[-12 - footer_len:-12].decode("utf-8"))
+        self.n_rows = footer["n_rows"]
+        self.metadata = footer["metadata"]
+        self.column_info = footer["columns"]
+        self.buf = memoryview(self.mm)
+        self.codecs = {}
+        self.decoded = {}
+
+    def has_column(self, name):
+        return name in self.column_info
+
+    def column(self, name):
+        info = self.column_info.get(name)
+        if info is None:
+            raise ValueError("Column '" + name + "' is not found in file: " + self.path)
+        codec = info.get("codec", "none")
+        if info["kind"] in ("str", "bytes"):
+            offsets = np.frombuffer(self._section(info["offsets"], codec), dtype=np.dtype("<i8"))
+            return StringColumn(offsets, self._section(info["blob"], codec))
+        return np.frombuffer(self._section(info["data"], codec),
+                             dtype=np.dtype(info["kind"]).newbyteorder("<"))
+
+    def _section(self, section, codec_name):
+        data = self.buf[section[0]:section[0] + section[1]]
+        if codec_name == "none":
+            return data
+        decoded = self.decoded.get(section[0])
+        if decoded is None:
+            codec = self.codecs.get(codec_name)
+            if codec is None:
+                try:
+                    codec = get_codec(codec_name)
+                except ValueError as ex:
+                    raise ValueError(str(ex) + ", can't read file: " + self.path)
+                self.codecs[codec_name] = codec
+            decoded = codec.decompress(data, section[2])
+            self.decoded[section[0]] = decoded
+        return decoded
@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+import os
+from threading import Lock
+
+import numpy as np
+from cachetools import LRUCache
+
+from MetagenomeAPI.ColumnStore import ColumnStore, StringColumn, INT_NULL, write_column_store
+from MetagenomeAPI.ChunkedLineReader import ChunkedLineReader
+from MetagenomeAPI.HashIndex import HashIndex, get_slot_count
+from MetagenomeAPI.TokenIndex import TokenIndex
+
+# column store kind used for each "dtype" of column_props_map
+STORE_KINDS = {"str": "str", "int": "int64", "float": "float64"}
+# names of the stored sort helper columns
+RANK_PREFIX = "__rank_"
+PERM_PREFIX = "__perm_"
+TIEBREAK_COLUMN = "__tiebreak"
+# stored lower-cased TSV text of rows, query words are checked against it
+SEARCH_COLUMN = "__search"
+# pages ending within the first 1/TOP_K_RATIO of the rows are selected without
+# sorting the whole table
+TOP_K_RATIO = 16
+# full sort orders kept per table for paging deeper than that
+MAX_CACHED_ORDERS = 8
+
+
+def reverse_rank_groups(perm, rank):
+    """
+    Turns ascending permutation into the descending one keeping the order of
+    rows with equal rank (so ties stay ordered the same way as ascending).
+    """
+    sorted_rank = rank[perm]
+    counts = np.bincount(sorted_rank, minlength=1)
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    pos = np.arange(len(perm)) - starts[sorted_rank] + (len(perm) - ends)[sorted_rank]
+    ret = np.empty_like(perm)
+    ret[pos] = perm
+    return ret
+
+
+def get_token_index_file(index_file):
+    return os.path.splitext(index_file)[0] + ".tok"
+
+
+def get_hash_index_file(index_file):
+    return os.path.splitext(index_file)[0] + ".hsh"
+
+
+# Column oriented copy of one index table (bins of a BinnedContigs object or
+# contigs of one bin). Rows keep the order of the source data, typed columns
+# are used for sorting and for building the returned items. Columns are either
+# in-memory arrays or views over memory mapped column store file. String
+# columns marked with "hash" in column_props_map get hash index for exact
+# value lookups.
+class ColumnarTable:
+
+    def __init__(self, column_props_map, size, columns, lines=None, index_file=None):
+        self.column_props_map = column_props_map
+        self.index_file = index_file
+        self.size = size
+        self.column_names = [col_name for col_name, _ in
+                             sorted(column_props_map.items(), key=lambda x: x[1]["col"])]
+        self.columns = columns
+        self._lines = lines
+        self._search_texts = None
+        self._text_values = {}
+        self._ranks = {}
+        self._perms = {}
+        self._tiebreak = None
+        self._token_index = None
+        self._hash_indexes = {}
+        self._orders = LRUCache(MAX_CACHED_ORDERS)
+        self._orders_lock = Lock()
+        self.store = None
+
+    @classmethod
+    def from_values(cls, column_props_map, size, values, lines=None):
+        """
+        values - mapping from column name to list of python values (None for
+                 missing ones)
+        """
+        columns = {}
+        for col_name, col_props in column_props_map.items():
+            dtype = col_props["dtype"]
+            col_values = values[col_name]
+            if dtype == "str":
+                columns[col_name] = [v if v is not None else "" for v in col_values]
+            elif dtype == "int":
+                columns[col_name] = np.array([INT_NULL if v is None else v for v in col_values],
+                                             dtype=np.int64)
+            else:
+                columns[col_name] = np.array([np.nan if v is None else v for v in col_values],
+                                             dtype=np.float64)
+        return cls(column_props_map, size, columns, lines)
+
+    @classmethod
+    def from_lines(cls, column_props_map, lines):
+        values = {col_name: [] for col_name in column_props_map}
+        parsers = []
+        for col_name, col_props in column_props_map.items():
+            parse = {"str": str, "int": int, "float": float}[col_props["dtype"]]
+            parsers.append((col_name, col_props["col"] - 1, parse))
+        for line in lines:
+            items = line.split('\t')
+            for col_name, pos, parse in parsers:
+                item = items[pos] if pos < len(items) else ''
+                values[col_name].append(parse(item) if item else None)
+        return cls.from_values(column_props_map, len(lines), values, lines)
+
+    @classmethod
+    def from_tsv_file(cls, column_props_map, index_file):
+        """Loads table from legacy gzip'd TSV index file."""
+        lines = []
+        with ChunkedLineReader(index_file) as reader:
+            for chunk in reader.text_chunks():
+                lines.extend(chunk)
+        return cls.from_lines(column_props_map, lines)
+
+    @classmethod
+    def from_store_file(cls, column_props_map, index_file):
+        store = ColumnStore(index_file)
+        columns = {col_name: store.column(col_name) for col_name in column_props_map}
+        table = cls(column_props_map, store.n_rows, columns, index_file=index_file)
+        # keeps the file open (and flock'ed) as long as the table is used
+        table.store = store
+        # sort permutations precomputed when index was built (missing in
+        # files written before they were introduced)
+        for col_name in column_props_map:
+            if store.has_column(RANK_PREFIX + col_name):
+                table._ranks[col_name] = store.column(RANK_PREFIX + col_name)
+                table._perms[col_name] = store.column(PERM_PREFIX + col_name)
+        if store.has_column(TIEBREAK_COLUMN):
+            table._tiebreak = store.column(TIEBREAK_COLUMN)
+        if store.has_column(SEARCH_COLUMN):
+            table._search_texts = store.column(SEARCH_COLUMN)
+        return table
+
+    def save(self, index_file, codec=None):
+        columns = [(col_name, STORE_KINDS[self.column_props_map[col_name]["dtype"]],
+                    self.columns[col_name]) for col_name in self.column_names]
+        for col_name in self.column_names:
+            columns.append((RANK_PREFIX + col_name, "int32", self.get_rank(col_name)))
+            columns.append((PERM_PREFIX + col_name, "int32", self.get_ascending_order(col_name)))
+        columns.append((TIEBREAK_COLUMN, "int32", self.get_tiebreak_rank()))
+        columns.append((SEARCH_COLUMN, "str", self.search_texts))
+        hash_columns = [(col_name, "int32", self.get_hash_index(col_name).slots)
+                        for col_name in self.column_names
+                        if self.column_props_map[col_name].get("hash")]
+        if hash_columns:
+            write_column_store(get_hash_index_file(index_file), get_slot_count(self.size),
+                               hash_columns, codec=codec)
+        self.get_token_index().save(get_token_index_file(index_file), codec)
+        write_column_store(index_file, self.size, columns, codec=codec)
+
+    def copy(self):
+        """
+        In-memory copy of the data columns without stored sort helpers and
+        indexes (so saving it rebuilds them in the current layout).
+        """
+        columns = {}
+        for col_name in self.column_names:
+            values = self.columns[col_name]
+            columns[col_name] = values.to_list() if isinstance(values, StringColumn) \
+                else np.array(values)
+        return ColumnarTable(self.column_props_map, self.size, columns)
+
+    def get_token_index(self):
+        if self._token_index is None:
+            token_index_file = None
+            if self.index_file is not None:
+                token_index_file = get_token_index_file(self.index_file)
+            if token_index_file is not None and os.path.isfile(token_index_file):
+                self._token_index = TokenIndex.from_file(token_index_file)
+            else:
+                self._token_index = TokenIndex.build(self.search_texts)
+        return self._token_index
+
+    def set_token_index(self, token_index):
+        """Uses token index built elsewhere (e.g. merged from row ranges) instead of building it."""
+        self._token_index = token_index
+
+    def get_hash_index(self, col_name):
+        hash_index = self._hash_indexes.get(col_name)
+        if hash_index is None:
+            hash_index_file = None
+            if self.index_file is not None:
+                hash_index_file = get_hash_index_file(self.index_file)
+            if hash_index_file is not None and os.path.isfile(hash_index_file):
+                store = ColumnStore(hash_index_file)
+                hash_index = HashIndex(store.column(col_name), self.columns[col_name])
+                hash_index.store = store
+            else:
+                hash_index = HashIndex(HashIndex.build(self.columns[col_name]),
+                                       self.columns[col_name])
+            self._hash_indexes[col_name] = hash_index
+        return hash_index
+
+    def find_equal_rows(self, col_name, value):
+        """Sorted positions of rows having exactly the value in the column."""
+        return self.get_hash_index(col_name).find_rows(value)
+
+    def find_rows(self, query_words):
+        """Sorted positions of rows which text contains all the query words."""
+        return self.get_token_index().match(query_words, self.get_search_text, self.search_texts)
+
+    def get_text_values(self, col_name):
+        """Returns all values of a string column as numpy array."""
+        values = self._text_values.get(col_name)
+        if values is None:
+            values = self.columns[col_name]
+            if isinstance(values, StringColumn):
+                values = values.to_list()
+            values = np.array(values, dtype=str)
+            self._text_values[col_name] = values
+        return values
+
+    @property
+    def lines(self):
+        """TSV text of every row."""
+        if self._lines is None:
+            texts = []
+            for col_name in self.column_names:
+                dtype = self.column_props_map[col_name]["dtype"]
+                values = self.columns[col_name]
+                if dtype == "str":
+                    texts.append(values.to_list() if isinstance(values, StringColumn) else values)
+                elif dtype == "int":
+                    texts.append(['' if v == INT_NULL else str(v) for v in values.tolist()])
+                else:
+                    texts.append(['' if v != v else str(v) for v in values.tolist()])
+            self._lines = ["\t".join(items) for items in zip(*texts)]
+        return self._lines
+
+    @property
+    def search_texts(self):
+        """Lower-cased TSV text of every row (the one query words are matched against)."""
+        if self._search_texts is None:
+            self._search_texts = [line.lower() for line in self.lines]
+        return self._search_texts
+
+    def get_search_text(self, row):
+        if self._search_texts is not None:
+            return self._search_texts[row]
+        return self.get_line(row).lower()
+
+    def get_line(self, row):
+        if self._lines is not None:
+            return self._lines[row]
+        items = []
+        for col_name in self.column_names:
+            value = self.get_value(col_name, row)
+            items.append('' if value is None else str(value))
+        return "\t".join(items)
+
+    def get_rank(self, col_name):
+        """
+        Dense rank of every row by ascending sort key of a column. Keys follow
+        "sort -f" semantics for text columns (case folded) and "sort -n" ones
+        for numeric columns (empty values are treated as 0).
+        """
+        if col_name not in self.column_props_map:
+            raise ValueError("Unknown column name '" + col_name + "', " +
+                             "please use one of " + str(self.column_props_map.keys()))
+        rank = self._ranks.get(col_name)
+        if rank is None:
+            dtype = self.column_props_map[col_name]["dtype"]
+            values = self.columns[col_name]
+            if dtype == "str":
+                key = np.char.upper(self.get_text_values(col_name))
+            elif dtype == "int":
+                key = np.where(values == INT_NULL, 0, values)
+            else:
+                key = np.nan_to_num(values, nan=0.0)
+            rank = np.unique(key, return_inverse=True)[1].astype(np.int32).reshape(-1)
+            self._ranks[col_name] = rank
+        return rank
+
+    def get_tiebreak_rank(self):
+        """
+        Rank of rows by their first (id) column, used to order rows equal by
+        all keys the same way "sort" falls back to comparing whole lines.
+        """
+        if self._tiebreak is None:
+            ids = self.get_text_values(self.column_names[0])
+            tiebreak = np.empty(self.size, dtype=np.int32)
+            tiebreak[np.argsort(ids, kind="stable")] = np.arange(self.size, dtype=np.int32)
+            self._tiebreak = tiebreak
+        return self._tiebreak
+
+    def get_ascending_order(self, col_name):
+        perm = self._perms.get(col_name)
+        if perm is None:
+            perm = np.lexsort((self.get_tiebreak_rank(), self.get_rank(col_name))).astype(np.int32)
+            self._perms[col_name] = perm
+        return perm
+
+    def get_sorted_order(self, sort_by):
+        """
+        Returns row positions (array, or range when there is nothing to sort)
+        ordered according to sort_by (list of [column name, ascending] pairs). Single column orders come straight
+        from the ascending permutation, combinations of columns are resolved
+        by integer ranks without comparing the values themselves.
+        """
+        if sort_by is None or len(sort_by) == 0:
+            return range(self.size)
+        if len(sort_by) == 1:
+            col_name, ascending = sort_by[0][0], sort_by[0][1]
+            perm = self.get_ascending_order(col_name)
+            if ascending:
+                return perm
+            return reverse_rank_groups(perm, self.get_rank(col_name))
+        # np.lexsort uses the last key as the primary one
+        keys = [self.get_tiebreak_rank()]
+        for column_sorting in reversed(sort_by):
+            rank = self.get_rank(column_sorting[0])
+            keys.append(rank if column_sorting[1] else -rank)
+        return np.lexsort(keys)
+
+    def get_range_mask(self, filters):
+        """
+        Boolean mask of rows having values of numeric columns within ranges.
+        filters - list of {"column", "min", "max"} dicts, bounds are inclusive
+                  and optional; rows with missing value never match.
+        """
+        mask = np.ones(self.size, dtype=bool)
+        for column_range in filters:
+            col_name = column_range.get("column")
+            if col_name not in self.column_props_map:
+                raise ValueError("Unknown column name '" + str(col_name) + "', " +
+                                 "please use one of " + str(self.column_props_map.keys()))
+            dtype = self.column_props_map[col_name]["dtype"]
+            if dtype == "str":
+                raise ValueError("Range filter is not supported for text column '" +
+                                 col_name + "'")
+            for bound in ("min", "max"):
+                value = column_range.get(bound)
+                if value is not None and (isinstance(value, bool) or
+                                          not isinstance(value, (int, float))):
+                    raise ValueError("Range filter " + bound + " of column '" + col_name +
+                                     "' should be a number, found: " + repr(value))
+            values = self.columns[col_name]
+            mask &= values != INT_NULL if dtype == "int" else ~np.isnan(values)
+            if column_range.get("min") is not None:
+                mask &= values >= column_range["min"]
+            if column_range.get("max") is not None:
+                mask &= values <= column_range["max"]
+        return mask
+
+    def get_page(self, sort_by, start, limit, rows=None):
+        """
+        Row positions of one page of rows ordered according to sort_by.
+        rows - optional sorted positions of rows to choose from (all rows of
+               the table if None)
+        First pages are picked by partial selection over rows, deeper ones
+        come from full sort order which is then kept for the next requests.
+        """
+        count = self.size if rows is None else len(rows)
+        end = min(start + limit, count)
+        if sort_by is None or len(sort_by) == 0:
+            return (range(self.size) if rows is None else rows)[start:end]
+        order_key = tuple((column_sorting[0], bool(column_sorting[1])) for column_sorting in sort_by)
+        with self._orders_lock:
+            order = self._orders.get(order_key)
+        if order is None and len(sort_by) == 1 and sort_by[0][1]:
+            # precomputed, nothing to select or cache
+            order = self.get_ascending_order(sort_by[0][0])
+        if order is None:
+            if end * TOP_K_RATIO <= count:
+                top_rows = self.get_top_rows(sort_by, end, rows)
+                if top_rows is not None:
+                    return top_rows[start:end]
+            order = self.get_sorted_order(sort_by)
+            with self._orders_lock:
+                self._orders[order_key] = order
+        if rows is not None:
+            # keep the chosen rows in sort order
+            matched = np.zeros(self.size, dtype=bool)
+            matched[rows] = True
+            order = np.asarray(order)
+            order = order[matched[order]]
+        return order[start:end]
+
+    def get_top_rows(self, sort_by, k, rows=None):
+        """
+        First k row positions in sort_by order (of the rows given or all of
+        them) found by np.argpartition, so the cost is linear in the number
+        of rows. Returns None if sort keys can't be packed into one integer.
+        """
+        keys = self.get_combined_sort_key(sort_by, rows)
+        if keys is None:
+            return None
+        if k < len(keys):
+            top = np.argpartition(keys, k - 1)[:k]
+        else:
+            top = np.arange(len(keys))
+        top = top[np.argsort(keys[top])]
+        return top if rows is None else np.asarray(rows)[top]
+
+    def get_combined_sort_key(self, sort_by, rows=None):
+        """
+        Single int64 key per row ordering the same way as the ranks of the
+        sort_by columns followed by the tiebreak rank (None on overflow).
+        """
+        rank_sizes = []
+        total = max(self.size, 1)
+        for column_sorting in sort_by:
+            rank = self.get_rank(column_sorting[0])
+            rank_size = int(rank.max()) + 1 if self.size else 1
+            rank_sizes.append(rank_size)
+            total *= rank_size
+        if total >= 2 ** 63:
+            return None
+        tiebreak = self.get_tiebreak_rank()
+        keys = np.zeros(self.size if rows is None else len(rows), dtype=np.int64)
+        for column_sorting, rank_size in zip(sort_by, rank_sizes):
+            rank = self.get_rank(column_sorting[0])
+            rank = (rank if rows is None else rank[rows]).astype(np.int64)
+            keys *= rank_size
+            keys += rank if column_sorting[1] else rank_size - 1 - rank
+        keys *= max(self.size, 1)
+        keys += tiebreak if rows is None else tiebreak[rows]
+        return keys
+
+    def get_value(self, col_name, row):
+        value = self.columns[col_name][row]
+        dtype = self.column_props_map[col_name]["dtype"]
+        if dtype == "str":
+            return str(value)
+        if dtype == "int":
+            return None if value == INT_NULL else int(value)
+        return None if np.isnan(value) else float(value)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from MetagenomeAPI.ColumnStore import INT_NULL
+
+# numeric contig columns summarized
+SUMMARY_COLUMNS = ["len", "gc", "cov"]
+QUANTILE_LEVELS = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+def get_float_values(table, col_name):
+    """Values of numeric column as float array with NaN for missing ones."""
+    values = table.columns[col_name]
+    if table.column_props_map[col_name]["dtype"] == "int":
+        return np.where(values == INT_NULL, np.nan, values.astype(np.float64))
+    return np.asarray(values, dtype=np.float64)
+
+
+def get_bin_groups(table, bin_ids):
+    """Row positions of every bin (in bin_ids order) of object-wide contig table."""
+    names, inverse = np.unique(table.get_text_values("bin_id"), return_inverse=True)
+    inverse = inverse.reshape(-1)
+    order = np.argsort(inverse, kind="stable")
+    groups = np.split(order, np.cumsum(np.bincount(inverse, minlength=len(names)))[:-1])
+    rows_by_name = {str(name): rows for name, rows in zip(names.tolist(), groups)}
+    return [rows_by_name.get(bin_id, np.zeros(0, dtype=np.int64)) for bin_id in bin_ids]
+
+
+def summarize_values(values, edges):
+    values = values[~np.isnan(values)]
+    ret = {"count": int(len(values)), "min": None, "max": None, "mean": None,
+           "quantiles": [None] * len(QUANTILE_LEVELS),
+           "histogram": np.histogram(values, edges)[0].tolist()}
+    if len(values):
+        ret["min"] = float(values.min())
+        ret["max"] = float(values.max())
+        ret["mean"] = float(values.mean())
+        ret["quantiles"] = [float(q) for q in np.quantile(values, QUANTILE_LEVELS)]
+    return ret
+
+
+def summarize_contigs(table, bin_ids, histogram_bins):
+    """
+    Distribution summaries (count, min, max, mean, quantiles and histogram)
+    of len, gc and cov over all contigs of object-wide contig table and over
+    contigs of every bin. Histograms of a column share the same edges taken
+    from the whole object so bins can be compared.
+    """
+    groups = get_bin_groups(table, bin_ids)
+    ret = {"quantile_levels": QUANTILE_LEVELS,
+           "histogram_edges": {},
+           "n_contigs": table.size,
+           "columns": {},
+           "bins": [{"bin_id": bin_id, "n_contigs": int(len(rows)), "columns": {}}
+                    for bin_id, rows in zip(bin_ids, groups)]}
+    for col_name in SUMMARY_COLUMNS:
+        values = get_float_values(table, col_name)
+        edges = np.histogram_bin_edges(values[~np.isnan(values)], bins=histogram_bins)
+        ret["histogram_edges"][col_name] = edges.tolist()
+        ret["columns"][col_name] = summarize_values(values, edges)
+        for bin_summary, rows in zip(ret["bins"], groups):
+            bin_summary["columns"][col_name] = summarize_values(values[rows], edges)
+    return ret
+
+
+def get_cell_index(values, edges):
+    """Histogram cell of each value (the last edge belongs to the last cell)."""
+    return np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+
+
+def gc_cov_density(table, bin_ids, resolution, log_cov=False):
+    """
+    Number of contigs of object-wide contig table in each cell of resolution
+    x resolution grid over (gc, cov), for all contigs and for each bin (as
+    sparse [gc cell, cov cell, count] triples). Contigs missing gc or cov are
+    left out and counted in n_skipped. log_cov - use log10 of coverage for
+    the cov axis, contigs with cov <= 0 are then skipped the same way.
+    """
+    gc = get_float_values(table, "gc")
+    cov = get_float_values(table, "cov")
+    if log_cov:
+        cov = np.where(cov > 0, np.log10(np.where(cov > 0, cov, 1.0)), np.nan)
+    present = ~(np.isnan(gc) | np.isnan(cov))
+    rows = np.flatnonzero(present)
+    counts, gc_edges, cov_edges = np.histogram2d(gc[rows], cov[rows], bins=resolution)
+    gc_cells = get_cell_index(gc[rows], gc_edges)
+    cov_cells = get_cell_index(cov[rows], cov_edges)
+    # one pass over all contigs counting (bin, cell) pairs
+    names, inverse = np.unique(table.get_text_values("bin_id"), return_inverse=True)
+    bin_pos = {bin_id: pos for pos, bin_id in enumerate(bin_ids)}
+    name_to_bin = np.array([bin_pos.get(name, -1) for name in names.tolist()], dtype=np.int64)
+    row_bins = name_to_bin[inverse.reshape(-1)[rows]]
+    keys, key_counts = np.unique((row_bins * resolution + gc_cells) * resolution + cov_cells,
+                                 return_counts=True)
+    bins = [{"bin_id": bin_id, "cells": []} for bin_id in bin_ids]
+    for key, count in zip(keys.tolist(), key_counts.tolist()):
+        bin_index, cell = divmod(key, resolution * resolution)
+        if bin_index >= 0:
+            bins[bin_index]["cells"].append(list(divmod(cell, resolution)) + [count])
+    return {"resolution": resolution,
+            "log_cov": 1 if log_cov else 0,
+            "gc_edges": gc_edges.tolist(),
+            "cov_edges": cov_edges.tolist(),
+            "n_contigs": int(len(rows)),
+            "n_skipped": int(table.size - len(rows)),
+            "counts": counts.astype(np.int64).tolist(),
+            "bins": bins}
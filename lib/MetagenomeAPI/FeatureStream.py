@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import codecs
+import json
+import re
+import zlib
+
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+_WHITESPACE = " \t\n\r"
+# rest of the text the last parsed value may still continue into
+_TOKEN_TAIL = re.compile(r"[^ \t\n\r,\]]*\Z")
+
+
+def iter_gunzip(chunks):
+    """
+    Decompresses gzip'd data (possibly several concatenated gzip members, as
+    gzip.decompress accepts) given as iterable of byte chunks.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+            chunk = decompressor.unused_data
+            if chunk:
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+def iter_json_array(chunks):
+    """
+    Yields elements of JSON array (top level "[...]") given as iterable of
+    utf-8 byte chunks, keeping only the not yet parsed tail in memory.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = 0
+    started = False
+    # what comes next: "first" value (or "]"), "value" after ',' or "delimiter"
+    expect = "first"
+    chunks = iter(chunks)
+    done = False
+    while True:
+        chunk = next(chunks, None)
+        if chunk is None:
+            done = True
+            buf = buf[pos:] + utf8.decode(b"", final=True)
+        else:
+            buf = buf[pos:] + utf8.decode(chunk)
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos == len(buf):
+                break
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("JSON array expected, found: " + buf[pos:pos + 20])
+                started = True
+                pos += 1
+                continue
+            if expect == "delimiter":
+                if buf[pos] == "]":
+                    return
+                if buf[pos] != ",":
+                    raise ValueError("Expecting ',' delimiter, found: " + buf[pos:pos + 20])
+                expect = "value"
+                pos += 1
+                continue
+            if buf[pos] == "]" and expect == "first":
+                return
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if done:
+                    raise
+                # element continues in the next chunk
+                break
+            if not done and _TOKEN_TAIL.match(buf, end):
+                # number (or other scalar) may continue in the next chunk
+                break
+            yield value
+            pos = end
+            expect = "delimiter"
+        if done:
+            raise ValueError("Unexpected end of JSON array")
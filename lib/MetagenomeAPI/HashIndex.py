@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import zlib
+
+import numpy as np
+
+
+def get_slot_count(n_values):
+    """Power of two giving load factor of at most 1/2."""
+    slot_count = 1
+    while slot_count < 2 * n_values:
+        slot_count *= 2
+    return slot_count
+
+
+# Open addressing hash table (linear probing, crc32 of utf-8 value) over a
+# string column. Slots keep row position + 1 (0 marks empty slot), so the
+# table is a plain int32 array which is stored next to the column and used
+# straight from the memory mapped file for exact value lookups.
+class HashIndex:
+
+    def __init__(self, slots, values):
+        """
+        slots  - int32 array built by build()
+        values - string column (list or StringColumn) the slots point to
+        """
+        self.slots = slots
+        self.values = values
+        self.mask = len(slots) - 1
+        self.store = None
+
+    @staticmethod
+    def build(values):
+        slots = np.zeros(get_slot_count(len(values)), dtype=np.int32)
+        mask = len(slots) - 1
+        for row, value in enumerate(values):
+            pos = zlib.crc32(value.encode("utf-8")) & mask
+            while slots[pos]:
+                pos = (pos + 1) & mask
+            slots[pos] = row + 1
+        return slots
+
+    def find_rows(self, value):
+        """Sorted positions of rows having exactly the value."""
+        rows = []
+        pos = zlib.crc32(value.encode("utf-8")) & self.mask
+        while self.slots[pos]:
+            row = int(self.slots[pos]) - 1
+            if self.values[row] == value:
+                rows.append(row)
+            pos = (pos + 1) & self.mask
+        return np.array(sorted(rows), dtype=np.int64)
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+import time
+from threading import Lock
+
+from MetagenomeAPI.IndexManifest import MANIFEST_SUFFIX
+from MetagenomeAPI.SingleFlight import SingleFlight
+
+# extensions of the index artifacts managed by the janitor, files sharing the
+# same name without extension (index, its token index...) go away together
+ARTIFACT_EXTENSIONS = [".tsv.gz", ".col", ".tok", ".hsh", ".summary.json", ".done", ".sql"]
+# the only artifacts kept in shared scratch folder (SQLite feature indexes)
+SCRATCH_EXTENSIONS = [".sql"]
+# marker saying contigs of all bins are indexed goes together with the
+# object-wide contig table, which is rebuilt with it anyway
+ALL_BINS_MARKER_SUFFIX = "_ctgs.done"
+ALL_CONTIGS_KEY_SUFFIX = "_allctgs"
+
+
+def get_artifact_key(path, extensions=ARTIFACT_EXTENSIONS):
+    """Path of the artifact group a file belongs to (None if not an index file)."""
+    if ".done" in extensions and path.endswith(ALL_BINS_MARKER_SUFFIX):
+        return path[:-len(ALL_BINS_MARKER_SUFFIX)] + ALL_CONTIGS_KEY_SUFFIX
+    for ext in extensions:
+        if path.endswith(ext):
+            return path[:-len(ext)]
+    return None
+
+
+class IndexCatalog:
+    """
+    Keeps last access time and access count of index artifacts in a small
+    SQLite database shared by all server processes. Accesses are written at
+    most once per touch_interval seconds per artifact.
+    """
+
+    def __init__(self, config):
+        index_dir = config["metagenome-index-dir"]
+        os.makedirs(index_dir, exist_ok=True)
+        self.catalog_file = os.path.join(index_dir, "catalog.sqlite")
+        self.touch_interval = int(config.get("index-catalog-touch-interval", "60"))
+        self.lock = Lock()
+        self.last_touch = {}
+        self.pending_counts = {}
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS artifacts " +
+                         "(key TEXT PRIMARY KEY, last_access REAL NOT NULL, " +
+                         "access_count INT NOT NULL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.catalog_file, timeout=30)
+
+    def touch(self, path):
+        key = get_artifact_key(path)
+        if key is None:
+            return
+        now = time.time()
+        with self.lock:
+            self.pending_counts[key] = self.pending_counts.get(key, 0) + 1
+            if now - self.last_touch.get(key, 0) < self.touch_interval:
+                return
+            self.last_touch[key] = now
+            count = self.pending_counts.pop(key)
+        try:
+            with self._connect() as conn:
+                conn.execute("INSERT INTO artifacts VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE " +
+                             "SET last_access=excluded.last_access, " +
+                             "access_count=access_count+excluded.access_count",
+                             (key, now, count))
+        except sqlite3.Error as ex:
+            # losing access statistics isn't worth failing the request
+            logging.warning("Can't update index catalog: " + str(ex))
+
+    def get_accesses(self):
+        """Returns mapping from artifact key to (last_access, access_count)."""
+        with self._connect() as conn:
+            return {row[0]: (row[1], row[2]) for row in
+                    conn.execute("SELECT key, last_access, access_count FROM artifacts")}
+
+    def remove(self, keys):
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM artifacts WHERE key=?", [(key,) for key in keys])
+        with self.lock:
+            for key in keys:
+                self.last_touch.pop(key, None)
+
+
+class IndexJanitor:
+    """
+    Background cleanup of metagenome-index-dir and the SQLite feature indexes
+    in scratch. Once total size of index artifacts goes over index-max-bytes
+    the least recently (or least frequently with index-eviction-policy=lfu)
+    used ones are deleted. Artifacts are never deleted while being built
+    (lock files present), used by a reader (shared flock held on the file) or
+    accessed within the last index-min-idle seconds.
+    """
+
+    def __init__(self, config, catalog):
+        self.catalog = catalog
+        self.index_dir = config["metagenome-index-dir"]
+        # (folder, extensions of artifacts looked for in it)
+        self.dirs = [(self.index_dir, ARTIFACT_EXTENSIONS)]
+        scratch = config.get("scratch", "/tmp")
+        if os.path.realpath(scratch) != os.path.realpath(self.index_dir):
+            self.dirs.append((scratch, SCRATCH_EXTENSIONS))
+        self.max_bytes = int(config.get("index-max-bytes", "0"))
+        self.interval = int(config.get("index-janitor-interval", "600"))
+        self.min_idle = int(config.get("index-min-idle", "300"))
+        self.policy = config.get("index-eviction-policy", "lru")
+        if self.policy not in ("lru", "lfu"):
+            raise ValueError("Unknown index-eviction-policy '" + self.policy +
+                             "', please use one of ['lru', 'lfu']")
+        self.single_flight = SingleFlight(self.index_dir)
+        self.thread = None
+        # functions called with paths of files about to be evicted, so
+        # readers of this process can let go of them
+        self.evict_callbacks = []
+
+    def add_evict_callback(self, callback):
+        self.evict_callbacks.append(callback)
+
+    def start(self):
+        """Starts background thread (does nothing if no byte budget is set)."""
+        if self.max_bytes <= 0 or self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._loop, name="IndexJanitor", daemon=True)
+        self.thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                # one janitor at a time across server processes
+                self.single_flight.try_run("janitor", self.run_once)
+            except Exception as ex:
+                logging.error("Index janitor failed: " + str(ex))
+
+    def get_artifacts(self):
+        """Returns mapping from artifact key to list of (path, stat) of its files."""
+        artifacts = {}
+        for folder, extensions in self.dirs:
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                key = get_artifact_key(path, extensions)
+                if key is None:
+                    continue
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                artifacts.setdefault(key, []).append((path, st))
+        return artifacts
+
+    def is_building(self, key):
+        # lock keys start with the checksum part of the artifact names
+        name = os.path.basename(key)
+        for lock_name in os.listdir(self.index_dir):
+            if lock_name.endswith(".lock") and name.startswith(lock_name[:-5].rsplit('_', 1)[0]):
+                return True
+        return False
+
+    def run_once(self):
+        """Deletes artifacts until total size fits in the budget. Returns freed bytes."""
+        artifacts = self.get_artifacts()
+        # hard linked copies of SQLite indexes take the space once
+        links = {}
+        total = 0
+        for files in artifacts.values():
+            for _, st in files:
+                inode = (st.st_dev, st.st_ino)
+                if inode not in links:
+                    links[inode] = 0
+                    total += st.st_size
+                links[inode] += 1
+        if total <= self.max_bytes:
+            return 0
+        accesses = self.catalog.get_accesses()
+
+        def get_last_access(key):
+            # files never read since being built count as accessed at build time
+            last_access = max([st.st_mtime for _, st in artifacts[key]])
+            if key in accesses:
+                last_access = max(last_access, accesses[key][0])
+            return last_access
+
+        def get_usage(key):
+            count = accesses[key][1] if key in accesses else 0
+            if self.policy == "lfu":
+                return count, get_last_access(key)
+            return get_last_access(key), count
+
+        idle_since = time.time() - self.min_idle
+        freed = 0
+        removed = []
+        for key in sorted(artifacts, key=get_usage):
+            if total - freed <= self.max_bytes:
+                break
+            if get_last_access(key) > idle_since:
+                continue
+            if self.is_building(key):
+                continue
+            paths = [path for path, _ in artifacts[key]]
+            for callback in self.evict_callbacks:
+                callback(paths)
+            if self._remove_files(paths):
+                for _, st in artifacts[key]:
+                    # space of hard linked file comes back with its last name
+                    inode = (st.st_dev, st.st_ino)
+                    links[inode] -= 1
+                    if links[inode] == 0:
+                        freed += st.st_size
+                removed.append(key)
+        self.catalog.remove(removed)
+        self._remove_orphan_manifests(set(artifacts) - set(removed))
+        logging.info("Index janitor removed " + str(len(removed)) + " artifacts, " +
+                     "freed " + str(freed) + " bytes")
+        return freed
+
+    def _remove_orphan_manifests(self, remaining):
+        """Removes manifests of objects which have no index artifacts left."""
+        # object checksum is the part of artifact name before the first '_'
+        chsums = set(os.path.basename(key).split('_')[0] for key in remaining)
+        for name in os.listdir(self.index_dir):
+            if name.endswith(MANIFEST_SUFFIX) and name[:-len(MANIFEST_SUFFIX)] not in chsums \
+                    and not self.is_building(name[:-len(MANIFEST_SUFFIX)]):
+                try:
+                    os.remove(os.path.join(self.index_dir, name))
+                except FileNotFoundError:
+                    pass
+
+    def _remove_files(self, paths):
+        """Removes the files unless some of them is held open by a reader."""
+        handles = []
+        try:
+            for path in paths:
+                try:
+                    f = open(path, "rb")
+                except FileNotFoundError:
+                    continue
+                handles.append(f)
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+            for f in handles:
+                try:
+                    os.remove(f.name)
+                except FileNotFoundError:
+                    pass
+            return True
+        finally:
+            for f in handles:
+                f.close()
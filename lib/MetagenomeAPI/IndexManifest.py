@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import fcntl
+import json
+import os
+import time
+
+# Version of BinnedContigs index layout written by this code. Increase it when
+# table files change (new columns, sidecars...) so existing indexes get
+# upgraded. Files written before manifests were introduced count as version 1.
+INDEX_VERSION = 3
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def make_entry(columns, rows):
+    return {"version": INDEX_VERSION, "columns": columns, "rows": rows, "built": time.time()}
+
+
+# Per object JSON file ("<object checksum>.manifest.json") describing index
+# tables built for the object: layout version, columns, number of rows and
+# build time of each table file. Updates are done under exclusive flock so
+# concurrent builds (other threads or processes) don't lose each other's
+# entries.
+class IndexManifest:
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+
+    def get_manifest_file(self, object_chsum):
+        return os.path.join(self.index_dir, object_chsum + MANIFEST_SUFFIX)
+
+    def read(self, object_chsum):
+        try:
+            with open(self.get_manifest_file(object_chsum)) as f:
+                fcntl.flock(f, fcntl.LOCK_SH)
+                data = f.read()
+        except FileNotFoundError:
+            return {"tables": {}}
+        return json.loads(data) if data else {"tables": {}}
+
+    def get_entry(self, object_chsum, table_file):
+        return self.read(object_chsum)["tables"].get(os.path.basename(table_file))
+
+    def is_current(self, object_chsum, table_file):
+        entry = self.get_entry(object_chsum, table_file)
+        return entry is not None and entry["version"] >= INDEX_VERSION
+
+    def update(self, object_chsum, entries):
+        """
+        entries - mapping from table file path to entry made by make_entry
+        """
+        with open(self.get_manifest_file(object_chsum), "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            data = f.read()
+            manifest = json.loads(data) if data else {"tables": {}}
+            for table_file, entry in entries.items():
+                manifest["tables"][os.path.basename(table_file)] = entry
+            manifest["version"] = INDEX_VERSION
+            f.seek(0)
+            f.truncate()
+            json.dump(manifest, f)
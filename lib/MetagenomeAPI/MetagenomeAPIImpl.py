@@ -6,6 +6,8 @@ from Workspace.WorkspaceClient import Workspace
 from MetagenomeAPI.AMAUtils import AMAUtils
 from MetagenomeAPI.MetagenomeSearchUtils import MetagenomeSearchUtils, get_contig_feature_info
 from MetagenomeAPI.CachingUtils import CachingUtils
+from MetagenomeAPI.ObjectInfoCache import ObjectInfoCache
+from MetagenomeAPI.IndexJanitor import IndexCatalog, IndexJanitor
 
 import json
 #END_HEADER
@@ -37,8 +39,14 @@ class MetagenomeAPI:
     # be found
     def __init__(self, config):
         #BEGIN_CONSTRUCTOR
-        self.indexer = BinnedContigsIndexer(config)
-        self.msu = MetagenomeSearchUtils(config)
+        self.info_cache = ObjectInfoCache(config)
+        self.catalog = IndexCatalog(config)
+        self.indexer = BinnedContigsIndexer(config, self.info_cache, self.catalog)
+        self.msu = MetagenomeSearchUtils(config, self.info_cache, self.catalog)
+        self.janitor = IndexJanitor(config, self.catalog)
+        self.janitor.add_evict_callback(self.msu.connections.close_files)
+        self.janitor.add_evict_callback(self.indexer.forget_files)
+        self.janitor.start()
         self.config = config
         #END_CONSTRUCTOR
         pass
@@ -47,16 +55,24 @@ class MetagenomeAPI:
     def search_binned_contigs(self, ctx, params):
         """
         :param params: instance of type "SearchBinnedContigsOptions"
-           (num_found - optional field which when set informs that there is
-           no need to perform full scan in order to count this value because
-           it was already done before; please don't set this value with 0 or
-           any guessed number if you didn't get right value previously.) ->
-           structure: parameter "ref" of String, parameter "query" of String,
-           parameter "sort_by" of list of type "column_sorting" -> tuple of
-           size 2: parameter "column" of String, parameter "ascending" of
-           type "boolean" (Indicates true or false values, false = 0, true =
-           1 @range [0,1]), parameter "start" of Long, parameter "limit" of
-           Long, parameter "num_found" of Long
+           (num_found - optional field which when set informs that there is no
+           need to perform full scan in order to count this value because it
+           was already done before; please don't set this value with 0 or any
+           guessed number if you didn't get right value previously. filters -
+           optional range filters combined with the query (all of them have to
+           match).) -> structure: parameter "ref" of String, parameter "query"
+           of String, parameter "sort_by" of list of type "column_sorting" ->
+           tuple of size 2: parameter "column" of String, parameter
+           "ascending" of type "boolean" (Indicates true or false values,
+           false = 0, true = 1 @range [0,1]), parameter "start" of Long,
+           parameter "limit" of Long, parameter "num_found" of Long, parameter
+           "filters" of list of type "column_range" (Range filter on a numeric
+           column, only items with value of the column between min and max
+           (both inclusive, each optional) are returned. Items without value
+           (e.g. missing cov) never match. column - n_contigs, sum_contig_len,
+           gc or cov for bins, len, gc or cov for contigs) -> structure:
+           parameter "column" of String, parameter "min" of Double, parameter
+           "max" of Double
         :returns: instance of type "SearchBinnedContigsResult" (num_found -
            number of all items found in query search (with only part of it
            returned in "bins" list).) -> structure: parameter "query" of
@@ -79,7 +95,8 @@ class MetagenomeAPI:
                                                     params.get("sort_by", None),
                                                     params.get("start", None),
                                                     params.get("limit", None),
-                                                    params.get("num_found", None))
+                                                    params.get("num_found", None),
+                                                    params.get("filters", None))
         #END search_binned_contigs
 
         # At some point might do deeper type checking...
@@ -95,13 +112,21 @@ class MetagenomeAPI:
            optional field which when set informs that there is no need to
            perform full scan in order to count this value because it was
            already done before; please don't set this value with 0 or any
-           guessed number if you didn't get right value previously.) ->
-           structure: parameter "ref" of String, parameter "bin_id" of
-           String, parameter "query" of String, parameter "sort_by" of list
-           of type "column_sorting" -> tuple of size 2: parameter "column" of
-           String, parameter "ascending" of type "boolean" (Indicates true or
-           false values, false = 0, true = 1 @range [0,1]), parameter "start"
-           of Long, parameter "limit" of Long, parameter "num_found" of Long
+           guessed number if you didn't get right value previously. filters -
+           optional range filters combined with the query (all of them have to
+           match).) -> structure: parameter "ref" of String, parameter
+           "bin_id" of String, parameter "query" of String, parameter
+           "sort_by" of list of type "column_sorting" -> tuple of size 2:
+           parameter "column" of String, parameter "ascending" of type
+           "boolean" (Indicates true or false values, false = 0, true = 1
+           @range [0,1]), parameter "start" of Long, parameter "limit" of
+           Long, parameter "num_found" of Long, parameter "filters" of list of
+           type "column_range" (Range filter on a numeric column, only items
+           with value of the column between min and max (both inclusive, each
+           optional) are returned. Items without value (e.g. missing cov)
+           never match. column - n_contigs, sum_contig_len, gc or cov for
+           bins, len, gc or cov for contigs) -> structure: parameter "column"
+           of String, parameter "min" of Double, parameter "max" of Double
         :returns: instance of type "SearchContigsInBinResult" (num_found -
            number of all items found in query search (with only part of it
            returned in "bins" list).) -> structure: parameter "query" of
@@ -124,7 +149,8 @@ class MetagenomeAPI:
                                                       params.get("sort_by", None),
                                                       params.get("start", None),
                                                       params.get("limit", None),
-                                                      params.get("num_found", None))
+                                                      params.get("num_found", None),
+                                                      params.get("filters", None))
         else:
           result = {}
         #END search_contigs_in_bin
@@ -136,6 +162,193 @@ class MetagenomeAPI:
         # return the results
         return [result]
 
+    def search_contigs_in_binned_contigs(self, ctx, params):
+        """
+        :param params: instance of type "SearchContigsInBinnedContigsOptions"
+           (contig_id - optional exact id of the contig to look up (query and
+           filters still apply on top of it) query, sort_by, start, limit,
+           num_found, filters - same as in SearchContigsInBin, bin_id column
+           can be used as well) -> structure: parameter "ref" of String,
+           parameter "contig_id" of String, parameter "query" of String,
+           parameter "sort_by" of list of type "column_sorting" -> tuple of
+           size 2: parameter "column" of String, parameter "ascending" of type
+           "boolean" (Indicates true or false values, false = 0, true = 1
+           @range [0,1]), parameter "start" of Long, parameter "limit" of
+           Long, parameter "num_found" of Long, parameter "filters" of list of
+           type "column_range" (Range filter on a numeric column, only items
+           with value of the column between min and max (both inclusive, each
+           optional) are returned. Items without value (e.g. missing cov)
+           never match. column - n_contigs, sum_contig_len, gc or cov for
+           bins, len, gc or cov for contigs) -> structure: parameter "column"
+           of String, parameter "min" of Double, parameter "max" of Double
+        :returns: instance of type "SearchContigsInBinnedContigsResult"
+           (num_found - number of all items found in query search (with only
+           part of it returned in "contigs" list).) -> structure: parameter
+           "query" of String, parameter "start" of Long, parameter "contigs"
+           of list of type "ContigInBinnedContigs" (contig_id       - id of
+           the contig bin_id          - id of the bin the contig belongs to
+           len             - (bp) length of the contig gc              - GC
+           content over the contig cov             - coverage over the contig
+           (if available, may be null)) -> structure: parameter "contig_id" of
+           String, parameter "bin_id" of String, parameter "len" of Long,
+           parameter "gc" of Double, parameter "cov" of Double, parameter
+           "num_found" of Long
+        """
+        # ctx is the context object
+        # return variables are: result
+        #BEGIN search_contigs_in_binned_contigs
+        result = self.indexer.search_contigs_in_binned_contigs(ctx["token"],
+                                                               params.get("ref", None),
+                                                               params.get("contig_id", None),
+                                                               params.get("query", None),
+                                                               params.get("sort_by", None),
+                                                               params.get("start", None),
+                                                               params.get("limit", None),
+                                                               params.get("num_found", None),
+                                                               params.get("filters", None))
+        #END search_contigs_in_binned_contigs
+
+        # At some point might do deeper type checking...
+        if not isinstance(result, dict):
+            raise ValueError('Method search_contigs_in_binned_contigs return value ' +
+                             'result is not type dict as required.')
+        # return the results
+        return [result]
+
+    def get_binned_contigs_summary(self, ctx, params):
+        """
+        :param params: instance of type "GetBinnedContigsSummaryParams" ->
+           structure: parameter "ref" of String
+        :returns: instance of type "GetBinnedContigsSummaryResult"
+           (quantile_levels - probabilities quantiles are reported for
+           histogram_edges - edges of histogram bins per column name, shared
+           by the object and all its bins n_contigs, columns - summary over
+           all contigs of the object bins - summary of each bin) -> structure:
+           parameter "quantile_levels" of list of Double, parameter
+           "histogram_edges" of mapping from String to list of Double,
+           parameter "n_contigs" of Long, parameter "columns" of mapping from
+           String to type "ColumnSummary" (Distribution of one contig column
+           (len, gc or cov). count - number of contigs having the value (min,
+           max, mean and quantiles are null if there are none) quantiles -
+           values at quantile_levels of the result histogram - number of
+           contigs between each pair of neighbouring histogram_edges of the
+           result) -> structure: parameter "count" of Long, parameter "min" of
+           Double, parameter "max" of Double, parameter "mean" of Double,
+           parameter "quantiles" of list of Double, parameter "histogram" of
+           list of Long, parameter "bins" of list of type "BinSummary"
+           (columns - summary per column name (len, gc and cov)) -> structure:
+           parameter "bin_id" of String, parameter "n_contigs" of Long,
+           parameter "columns" of mapping from String to type "ColumnSummary"
+           (Distribution of one contig column (len, gc or cov). count - number
+           of contigs having the value (min, max, mean and quantiles are null
+           if there are none) quantiles - values at quantile_levels of the
+           result histogram - number of contigs between each pair of
+           neighbouring histogram_edges of the result) -> structure: parameter
+           "count" of Long, parameter "min" of Double, parameter "max" of
+           Double, parameter "mean" of Double, parameter "quantiles" of list
+           of Double, parameter "histogram" of list of Long
+        """
+        # ctx is the context object
+        # return variables are: result
+        #BEGIN get_binned_contigs_summary
+        result = self.indexer.get_binned_contigs_summary(ctx["token"], params.get("ref", None))
+        #END get_binned_contigs_summary
+
+        # At some point might do deeper type checking...
+        if not isinstance(result, dict):
+            raise ValueError('Method get_binned_contigs_summary return value ' +
+                             'result is not type dict as required.')
+        # return the results
+        return [result]
+
+    def get_gc_cov_density(self, ctx, params):
+        """
+        :param params: instance of type "GetGcCovDensityParams" (ref -
+           reference to BinnedContigs object resolution - number of grid cells
+           along each axis (50 by default, 500 at most) per_bin - add grid of
+           each bin to the result log_cov - use log10 of coverage for the cov
+           axis) -> structure: parameter "ref" of String, parameter
+           "resolution" of Long, parameter "per_bin" of type "boolean"
+           (Indicates true or false values, false = 0, true = 1 @range [0,1]),
+           parameter "log_cov" of type "boolean" (Indicates true or false
+           values, false = 0, true = 1 @range [0,1])
+        :returns: instance of type "GetGcCovDensityResult" (gc_edges,
+           cov_edges - cell boundaries along the axes counts - number of
+           contigs in each cell, counts[i][j] is for gc cell i and cov cell j
+           n_contigs - number of contigs counted n_skipped - number of contigs
+           without gc or cov value (with log_cov also the ones with cov <= 0,
+           which have no logarithm) bins - grid of each bin (only if per_bin
+           is set)) -> structure: parameter "resolution" of Long, parameter
+           "log_cov" of type "boolean" (Indicates true or false values, false
+           = 0, true = 1 @range [0,1]), parameter "gc_edges" of list of
+           Double, parameter "cov_edges" of list of Double, parameter "counts"
+           of list of list of Long, parameter "n_contigs" of Long, parameter
+           "n_skipped" of Long, parameter "bins" of list of type "BinDensity"
+           (cells - non-empty cells of the bin grid as (gc cell, cov cell,
+           number of contigs) triples) -> structure: parameter "bin_id" of
+           String, parameter "cells" of list of tuple of size 3: Long, Long,
+           Long
+        """
+        # ctx is the context object
+        # return variables are: result
+        #BEGIN get_gc_cov_density
+        result = self.indexer.get_gc_cov_density(ctx["token"],
+                                                 params.get("ref", None),
+                                                 params.get("resolution", None),
+                                                 params.get("per_bin", 0),
+                                                 params.get("log_cov", 0))
+        #END get_gc_cov_density
+
+        # At some point might do deeper type checking...
+        if not isinstance(result, dict):
+            raise ValueError('Method get_gc_cov_density return value ' +
+                             'result is not type dict as required.')
+        # return the results
+        return [result]
+
+    def export_binned_contigs(self, ctx, params):
+        """
+        :param params: instance of type "ExportBinnedContigsParams" (ref -
+           reference to BinnedContigs object item_type - "bins" (default) to
+           export bins, "contigs" to export contigs of all the bins (each one
+           with bin_id of its bin) format - "tsv" (default, header line comes
+           with the first chunk) or "ndjson" (one JSON object per line)
+           sort_by - optional sorting, contigs come grouped by bin in the
+           order of the object and are sorted within each bin start - position
+           of the first row of the chunk, use next_start of the previous chunk
+           to continue limit - maximum number of rows in the chunk (10000 by
+           default, 100000 at most)) -> structure: parameter "ref" of String,
+           parameter "item_type" of String, parameter "format" of String,
+           parameter "sort_by" of list of type "column_sorting" -> tuple of
+           size 2: parameter "column" of String, parameter "ascending" of type
+           "boolean" (Indicates true or false values, false = 0, true = 1
+           @range [0,1]), parameter "start" of Long, parameter "limit" of Long
+        :returns: instance of type "ExportBinnedContigsResult" (data - rows of
+           the chunk in requested format next_start - start of the next chunk,
+           -1 when export is complete num_found - number of all rows being
+           exported) -> structure: parameter "format" of String, parameter
+           "data" of String, parameter "start" of Long, parameter "next_start"
+           of Long, parameter "num_found" of Long
+        """
+        # ctx is the context object
+        # return variables are: result
+        #BEGIN export_binned_contigs
+        result = self.indexer.export_binned_contigs(ctx["token"],
+                                                    params.get("ref", None),
+                                                    params.get("item_type", None),
+                                                    params.get("format", None),
+                                                    params.get("sort_by", None),
+                                                    params.get("start", None),
+                                                    params.get("limit", None))
+        #END export_binned_contigs
+
+        # At some point might do deeper type checking...
+        if not isinstance(result, dict):
+            raise ValueError('Method export_binned_contigs return value ' +
+                             'result is not type dict as required.')
+        # return the results
+        return [result]
+
     def get_annotated_metagenome_assembly(self, ctx, params):
         """
         :param params: instance of type
@@ -151,7 +364,7 @@ class MetagenomeAPI:
         # return variables are: output
         #BEGIN get_annotated_metagenome_assembly
         ws = Workspace(self.config['workspace-url'], token=ctx['token'])
-        ama_utils = AMAUtils(ws)
+        ama_utils = AMAUtils(ws, self.info_cache, ctx['token'])
         output = ama_utils.get_annotated_metagenome_assembly(params)
         #END get_annotated_metagenome_assembly
 
@@ -382,7 +595,7 @@ class MetagenomeAPI:
           raise RuntimeError(f"'contig_id' argument required for get_contig_info")
         contig_id = params['contig_id']
         ws = Workspace(self.config['workspace-url'], token=ctx['token'])
-        ama_utils = AMAUtils(ws)
+        ama_utils = AMAUtils(ws, self.info_cache, ctx['token'])
         params['included_fields'] = ['contig_ids', 'contig_lengths']
         data = ama_utils.get_annotated_metagenome_assembly(params)['genomes'][0]['data']
         contig_ids = data['contig_ids']
@@ -449,6 +662,7 @@ class MetagenomeAPI:
                      'message': "",
                      'version': self.VERSION,
                      'git_url': self.GIT_URL,
-                     'git_commit_hash': self.GIT_COMMIT_HASH}
+                     'git_commit_hash': self.GIT_COMMIT_HASH,
+                     'object_info_cache': self.info_cache.stats()}
         #END_STATUS
         return [returnVal]
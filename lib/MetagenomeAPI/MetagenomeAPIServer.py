@@ -346,6 +346,22 @@ class Application(object):
                              name='MetagenomeAPI.search_contigs_in_bin',
                              types=[dict])
         self.method_authentication['MetagenomeAPI.search_contigs_in_bin'] = 'optional'  # noqa
+        self.rpc_service.add(impl_MetagenomeAPI.search_contigs_in_binned_contigs,
+                             name='MetagenomeAPI.search_contigs_in_binned_contigs',
+                             types=[dict])
+        self.method_authentication['MetagenomeAPI.search_contigs_in_binned_contigs'] = 'optional'  # noqa
+        self.rpc_service.add(impl_MetagenomeAPI.get_binned_contigs_summary,
+                             name='MetagenomeAPI.get_binned_contigs_summary',
+                             types=[dict])
+        self.method_authentication['MetagenomeAPI.get_binned_contigs_summary'] = 'optional'  # noqa
+        self.rpc_service.add(impl_MetagenomeAPI.get_gc_cov_density,
+                             name='MetagenomeAPI.get_gc_cov_density',
+                             types=[dict])
+        self.method_authentication['MetagenomeAPI.get_gc_cov_density'] = 'optional'  # noqa
+        self.rpc_service.add(impl_MetagenomeAPI.export_binned_contigs,
+                             name='MetagenomeAPI.export_binned_contigs',
+                             types=[dict])
+        self.method_authentication['MetagenomeAPI.export_binned_contigs'] = 'optional'  # noqa
         self.rpc_service.add(impl_MetagenomeAPI.get_annotated_metagenome_assembly,
                              name='MetagenomeAPI.get_annotated_metagenome_assembly',
                              types=[dict])
@@ -8,10 +8,14 @@ import time
 import sqlite3
 import os
 import logging
-from gzip import decompress
+import shutil
 from multiprocessing import Pool
 
 from MetagenomeAPI.AMAUtils import AMAUtils
+from MetagenomeAPI.FeatureStream import DOWNLOAD_CHUNK_SIZE, iter_gunzip, iter_json_array
+from MetagenomeAPI.IndexJanitor import IndexCatalog
+from MetagenomeAPI.ObjectInfoCache import ObjectInfoCache
+from MetagenomeAPI.SqlConnectionPool import SqlConnectionPool
 from Workspace.WorkspaceClient import Workspace
 from installed_clients.AbstractHandleClient import AbstractHandle
 from cachetools import TTLCache, cached
@@ -26,7 +30,7 @@ def get_contig_feature_info(ctx, config, params, sort_by, cache_id, msu, caching
     Function to get information about contigss
     """
     ws = Workspace(config['workspace-url'], token=ctx['token'])
-    ama_utils = AMAUtils(ws)
+    ama_utils = AMAUtils(ws, msu.info_cache, ctx['token'])
     params['included_fields'] = ['contig_ids', 'contig_lengths']
     ama = ama_utils.get_annotated_metagenome_assembly(params)['genomes'][0]
     data = ama['data']
@@ -77,7 +81,7 @@ def get_contig_feature_info(ctx, config, params, sort_by, cache_id, msu, caching
 
 class MetagenomeSearchUtils:
     """Utilities for Searching Annotated Metagenome Assemblies in the KBase Search API"""
-    def __init__(self, config):
+    def __init__(self, config, info_cache=None, catalog=None):
         # check if server is active.
         self.workspace_url = config.get('workspace-url')
         self.handle_service_url = config.get('handle-service-url')
@@ -94,12 +98,15 @@ class MetagenomeSearchUtils:
         if config.get('text-fields'):
             fields = config['text-fields'].split(',')
             # combine with default fields
-            self.text_fields = list(set(self.text_fields) + set(fields))
+            self.text_fields = list(set(self.text_fields) | set(fields))
         if config.get('keyword-fields'):
             fields = config['keyword-fields'].split(',')
             # combine with default fields
-            self.keyword_fields = list(set(self.keyword_fields) + set(fields))
+            self.keyword_fields = list(set(self.keyword_fields) | set(fields))
         self.indexer = Indexer(self.handle_service_url, self.scratch)
+        self.info_cache = info_cache if info_cache is not None else ObjectInfoCache(config)
+        self.catalog = catalog if catalog is not None else IndexCatalog(config)
+        self.connections = SqlConnectionPool(config)
         self.pool = Pool(int(config.get("workers", "4")))
 
     @cached(cache)
@@ -180,20 +187,29 @@ class MetagenomeSearchUtils:
         stop = region_start + region_length
         q = "SELECT json from features "
         # TODO: Handle direction
-        # q += "WHERE ((starts>=%d AND starts<=%d) " % (region_start, stop)
-        where_clause = "WHERE ((starts BETWEEN %d AND %d) " % (region_start, stop)
-        where_clause += "OR (stops BETWEEN %d AND %d) " % (region_start, stop)
-        where_clause += "OR (starts<=%d AND stops>=%d)) " % (region_start, stop)
-        where_clause += " AND contig_id='%s'" % (contig_id)
-
-        cursor = conn.execute("SELECT count(*) from features " + where_clause)
+        if self.indexer.has_table(conn, Indexer.RTREE_TABLE):
+            # features overlapping the region, found by the interval index
+            row = conn.execute("SELECT num FROM contigs WHERE contig_id=?", [contig_id]).fetchone()
+            where_clause = "WHERE rowid IN (SELECT id FROM %s " % (Indexer.RTREE_TABLE)
+            where_clause += "WHERE contig_min<=? AND contig_max>=? AND start<=? AND stop>=?) "
+            num = row[0] if row else -1
+            args = [num, num, stop, region_start]
+        else:
+            # index built before the interval index, being backfilled
+            where_clause = "WHERE ((starts BETWEEN ? AND ?) "
+            where_clause += "OR (stops BETWEEN ? AND ?) "
+            where_clause += "OR (starts<=? AND stops>=?)) "
+            where_clause += " AND contig_id=?"
+            args = [region_start, stop, region_start, stop, region_start, stop, contig_id]
+
+        cursor = conn.execute("SELECT count(*) from features " + where_clause, args)
         ct = cursor.fetchone()[0]
 
         q += where_clause
         q += self._order_by(sort_by)
         q += " LIMIT %d OFFSET %d" % (limit, start)
         query = q
-        cursor = conn.execute(query)
+        cursor = conn.execute(query, args)
         features = []
         for row in cursor:
             f = self._process_features(json.loads(row[0]))
@@ -241,18 +257,32 @@ class MetagenomeSearchUtils:
 
         # Handle query
         where_clause = ""
+        args = []
         if query is not None and query != "":
+            tokens = str(query).split()
+            has_text_index = self.indexer.has_table(conn, Indexer.FTS_TABLE)
             ele = []
-            for tok in str(query).split():
+            phrases = []
+            for tok in tokens:
                 for k in self.keyword_fields:
-                    ele.append("(%s='%s')" % (k, tok))
+                    ele.append("(%s=?)" % (k))
+                    args.append(tok)
                 for k in self.text_fields:
-                    ele.append("(%s like '%%%s%%')" % (k, tok))
+                    if has_text_index and k in Indexer.FTS_COLUMNS and Indexer.is_text_indexable(tok):
+                        # substring match answered by the trigram index
+                        phrases.append('{%s}: "%s"' % (k, tok.replace('"', '""')))
+                    else:
+                        ele.append("(%s like ?)" % (k))
+                        args.append("%" + tok + "%")
+            if phrases:
+                ele.append("(rowid IN (SELECT rowid FROM %s WHERE %s MATCH ?))" %
+                           (Indexer.FTS_TABLE, Indexer.FTS_TABLE))
+                args.append(" OR ".join(phrases))
             if len(ele) > 0:
                 where_clause = "WHERE (%s) " % (" OR ".join(ele))
 
         # Get Count
-        cursor = conn.execute("SELECT count(*) from features " + where_clause)
+        cursor = conn.execute("SELECT count(*) from features " + where_clause, args)
         ct = cursor.fetchone()[0]
 
         q += where_clause
@@ -260,7 +290,7 @@ class MetagenomeSearchUtils:
         q += " LIMIT %d OFFSET %d" % (limit, start)
 
         query = q
-        cursor = conn.execute(query)
+        cursor = conn.execute(query, args)
         features = []
         for row in cursor:
             f = self._process_features(json.loads(row[0]))
@@ -325,7 +355,12 @@ class MetagenomeSearchUtils:
 
         ready, sqlf = self.indexer.is_indexed(ref)
         if ready:
-            conn = sqlite3.connect(sqlf)
+            self.catalog.touch(sqlf)
+            conn = self.connections.get_connection(sqlf)
+            if not self.indexer.is_complete(conn):
+                # index written by older version, missing tables are added
+                # to a copy which then replaces it
+                self.pool.apply_async(self.indexer._backfill, [sqlf], {}, None, self._error)
             return conn
         args = [objdata, sqlf, token]
         self.pool.apply_async(self.indexer._create_index, args, {}, None, self._error)
@@ -340,6 +375,50 @@ class Indexer():
     # Allow up to 15 minutes to index
     _TIMEOUT = 15*60
     _LOG_TIME = 30
+    # features inserted per executemany call
+    _BATCH_SIZE = 5000
+    # the file is renamed into place only once complete, so it doesn't need
+    # to survive a crash while being built
+    _BUILD_PRAGMAS = ["PRAGMA journal_mode = OFF",
+                      "PRAGMA synchronous = OFF",
+                      "PRAGMA locking_mode = EXCLUSIVE",
+                      "PRAGMA temp_store = MEMORY",
+                      "PRAGMA cache_size = -262144"]
+    _INDEXES = ["create index starts on features (starts);",
+                "create index stops on features (stops);",
+                "create index cid on features (contig_id);",
+                "create index size on features (size);",
+                "create index type on features (type);",
+                "create index functions on features (functions);",
+                "create index descr on features (functional_descriptions);"]
+
+    # contentless trigram index over text fields, rowid is the one of the
+    # feature. Trigram phrase queries match substrings like the "LIKE '%tok%'"
+    # search does (ASCII case-insensitive), so they give the same results.
+    # Needs SQLite 3.34, without it text fields are searched with LIKE only.
+    FTS_TABLE = "features_text"
+    FTS_COLUMNS = ["functions", "functional_descriptions"]
+    HAS_TRIGRAM = sqlite3.sqlite_version_info >= (3, 34, 0)
+    _FTS_SQL = ["CREATE VIRTUAL TABLE features_text USING fts5"
+                "(functions, functional_descriptions, content='', tokenize='trigram')",
+                "INSERT INTO features_text(rowid, functions, functional_descriptions) "
+                "SELECT rowid, functions, functional_descriptions FROM features"]
+    # prefix-matching word index of earlier development builds, replaced by
+    # the trigram one when backfilling
+    _OLD_FTS_TABLES = ["features_fts"]
+    # interval index of feature locations, contigs are numbered so that
+    # (contig, start, stop) fit in integer R*Tree dimensions. Rows go in
+    # ordered by (contig, start), so neighbouring features fill the same
+    # leaves and the tree comes out packed (R*Tree has no bulk load)
+    RTREE_TABLE = "features_rtree"
+    _RTREE_SQL = ["CREATE TABLE contigs (num INTEGER PRIMARY KEY, contig_id TEXT UNIQUE NOT NULL)",
+                  "INSERT INTO contigs(contig_id) SELECT DISTINCT contig_id FROM features "
+                  "ORDER BY contig_id",
+                  "CREATE VIRTUAL TABLE features_rtree USING rtree_i32"
+                  "(id, contig_min, contig_max, start, stop)",
+                  "INSERT INTO features_rtree SELECT f.rowid, c.num, c.num, f.starts, f.stops "
+                  "FROM features f JOIN contigs c ON c.contig_id = f.contig_id "
+                  "ORDER BY c.num, f.starts"]
 
     def __init__(self, handle_service_url, scratch):
         self.handle_service_url = handle_service_url
@@ -376,22 +455,34 @@ class Indexer():
                 return
 
         tmpsql = '%s.tmp' % (sqlf)
-        if os.path.exists(tmpsql):
-            st = os.stat(tmpsql)
-            if st.st_mtime > (time.time() - self._TIMEOUT):
-                logging.debug("Already indexing")
-                return
-            # Potentially failed attempt, cleanup old file
-            logging.warn("Removing stale index file")
-            os.unlink(tmpsql)
+        if self._is_building(tmpsql):
+            logging.debug("Already indexing")
+            return
 
         logging.info("Generating index %s" % (sqlf))
         start_time = time.time()
-        conn = sqlite3.connect(tmpsql)
         hid = objdata["data"]["features_handle_ref"]
         logging.debug("Fetching hid=%s" % (hid))
         features = self._fetch_data(hid, token)
+        ct = self._build_sql(tmpsql, features)
+        os.rename(tmpsql, sqlf)
+        # If this was a copy then let's link them together
+        if copied:
+            os.link(sqlf, osql)
+        elapsed = time.time() - start_time
+        logging.info("Indexing complete in %ds (%d features/sec)" % (elapsed, ct / max(elapsed, 1e-3)))
+        return True
 
+    def _build_sql(self, sqlf, features):
+        """
+        Bulk loads features into new sqlite file: rows are inserted in
+        batches with journaling off, secondary indexes are created (and
+        statistics gathered) once all the rows are in. Features with
+        duplicate ids are skipped. Returns number of features loaded.
+        """
+        conn = sqlite3.connect(sqlf)
+        for pragma in self._BUILD_PRAGMAS:
+            conn.execute(pragma)
         # TODO: Make these more configurable
         conn.execute('''CREATE TABLE features
              (id INT PRIMARY KEY     NOT NULL,
@@ -405,66 +496,133 @@ class Indexer():
              strands          TEXT    NOT NULL,
              json             BLOB    NOT NULL);
              ''')
-        conn.execute("create index starts on features (starts);")
-        conn.execute("create index stops on features (stops);")
-        conn.execute("create index cid on features (contig_id);")
-        conn.execute("create index size on features (size);")
-        conn.execute("create index type on features (type);")
-        conn.execute("create index functions on features (functions);")
-        conn.execute("create index descr on features (functional_descriptions);")
+        query = "INSERT OR IGNORE INTO features VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
         ct = 0
-        seen = {}
         last_update = time.time()
         logging.debug("Starting indexing: %s" % (sqlf))
+        batch = []
         for f in features:
-            id = f["id"]
-            if id in seen:
-                logging.warn("Duplicate ID")
-                continue
-            seen[id] = 1
-            loc = f["location"][0]
-            length = loc[3]
-            if loc[2] == "+":
-                start = loc[1]
-                stop = start + length
-            else:
-                start = loc[1] - length
-                stop = loc[1]
-
-            values = [f["id"],
-                      loc[0],
-                      f["type"],
-                      start,
-                      stop,
-                      length,
-                      f.get("functions",[''])[0],
-                      f.get("functions",[''])[0],
-                      loc[2],
-                      json.dumps(f)]
-#                      f.get("functions",[''])[0].replace('""', "''"),
-    
-            query = "INSERT INTO features VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
-            conn.execute(query, values)
-            elapsed = time.time() - last_update
-            if elapsed >= self._LOG_TIME:
-                logging.info("Indexed %s %d features" % (sqlf, ct))
-                conn.commit()
-                last_update = time.time()
-            ct += 1
+            batch.append(self._feature_row(f))
+            if len(batch) >= self._BATCH_SIZE:
+                conn.executemany(query, batch)
+                ct += len(batch)
+                batch = []
+                if time.time() - last_update >= self._LOG_TIME:
+                    logging.info("Indexed %s %d features" % (sqlf, ct))
+                    # fresh mtime tells other workers the build is alive
+                    os.utime(sqlf)
+                    last_update = time.time()
+        conn.executemany(query, batch)
+        ct += len(batch)
+        loaded = conn.execute("SELECT count(*) FROM features").fetchone()[0]
+        if loaded < ct:
+            logging.warning("Skipped %d features with duplicate IDs" % (ct - loaded))
+        for index_sql in self._INDEXES:
+            conn.execute(index_sql)
+        self._add_search_tables(conn)
+        conn.execute("ANALYZE")
         conn.commit()
-        os.rename(tmpsql, sqlf)
-        # If this was a copy then let's link them together
-        if copied:
-            os.link(sqlf, osql)
-        logging.info("Indexing complete in %ds" % (time.time() - start_time))
-        return True
+        conn.close()
+        return loaded
+
+    def has_table(self, conn, name):
+        return conn.execute("SELECT count(*) FROM sqlite_master WHERE name=?",
+                            [name]).fetchone()[0] > 0
+
+    @staticmethod
+    def is_text_indexable(tok):
+        """
+        Tells if trigram index finds exactly the rows "LIKE '%tok%'" does:
+        at least 3 characters, no LIKE wildcards and plain ASCII (LIKE only
+        ignores case of ASCII letters).
+        """
+        return len(tok) >= 3 and "%" not in tok and "_" not in tok and tok.isascii()
+
+    def is_complete(self, conn):
+        """Tells if index has all the tables current version builds."""
+        return (self.has_table(conn, self.FTS_TABLE) or not self.HAS_TRIGRAM) and \
+            self.has_table(conn, self.RTREE_TABLE)
+
+    def _add_search_tables(self, conn):
+        for name in self._OLD_FTS_TABLES:
+            conn.execute("DROP TABLE IF EXISTS " + name)
+        if self.HAS_TRIGRAM and not self.has_table(conn, self.FTS_TABLE):
+            for sql in self._FTS_SQL:
+                conn.execute(sql)
+        if not self.has_table(conn, self.RTREE_TABLE):
+            for sql in self._RTREE_SQL:
+                conn.execute(sql)
+
+    def _is_building(self, tmpf):
+        """Tells if other worker builds the temporary file, removes stale one."""
+        if os.path.exists(tmpf):
+            st = os.stat(tmpf)
+            if st.st_mtime > (time.time() - self._TIMEOUT):
+                return True
+            # Potentially failed attempt, cleanup old file
+            logging.warn("Removing stale index file")
+            os.unlink(tmpf)
+        return False
+
+    def _backfill(self, sqlf):
+        """
+        Adds tables missing in index built by older version to a copy of it
+        which then atomically replaces the index (readers keep using the old
+        file until they reconnect).
+        """
+        tmpsql = '%s.tmp' % (sqlf)
+        if self._is_building(tmpsql):
+            return
+        try:
+            fd = os.open(tmpsql, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return
+        os.close(fd)
+        try:
+            start_time = time.time()
+            shutil.copyfile(sqlf, tmpsql)
+            conn = sqlite3.connect(tmpsql)
+            for pragma in self._BUILD_PRAGMAS:
+                conn.execute(pragma)
+            if self.is_complete(conn):
+                conn.close()
+                os.unlink(tmpsql)
+                return
+            self._add_search_tables(conn)
+            conn.execute("ANALYZE")
+            conn.commit()
+            conn.close()
+            os.rename(tmpsql, sqlf)
+            logging.info("Backfilled %s in %ds" % (sqlf, time.time() - start_time))
+        except Exception:
+            if os.path.exists(tmpsql):
+                os.unlink(tmpsql)
+            raise
+
+    def _feature_row(self, f):
+        loc = f["location"][0]
+        length = loc[3]
+        if loc[2] == "+":
+            start = loc[1]
+            stop = start + length
+        else:
+            start = loc[1] - length
+            stop = loc[1]
+        function = f.get("functions", [''])[0]
+        return [f["id"], loc[0], f["type"], start, stop, length, function, function, loc[2],
+                json.dumps(f)]
 
     def _fetch_data(self, hid, token):
+        """
+        Yields features one at a time while the gzip'd JSON array is being
+        downloaded, so memory use doesn't grow with the number of features.
+        """
         hs = AbstractHandle(self.handle_service_url, token=token)
         hobj = hs.hids_to_handles([hid])[0]
         url = "%s/node/%s?download_raw" % (hobj["url"], hobj["id"])
-        resp = requests.get(url, headers={"Authorization": "OAuth %s" % (token)})
-        rawdata = decompress(resp.content)
-        features = json.loads(rawdata)
-        return features
+        with requests.get(url, headers={"Authorization": "OAuth %s" % (token)},
+                          stream=True) as resp:
+            resp.raise_for_status()
+            chunks = resp.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE)
+            yield from iter_json_array(iter_gunzip(chunks))
 
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import re
+from threading import Lock
+
+from cachetools import LRUCache, TTLCache
+from Workspace.WorkspaceClient import Workspace
+
+# ws/obj/ver reference with numeric ids always points to the same object
+# version, so its info never changes.
+ABSOLUTE_REF = re.compile(r'^\d+/\d+/\d+$')
+
+
+class ObjectInfoCache:
+    """
+    Cross-request cache of Workspace object info (get_object_info3) keyed by
+    reference and token, so permission checks stay per user. Absolute
+    references are kept until evicted by size, other ones for a short time as
+    they may start pointing to a new object version.
+    """
+
+    def __init__(self, config):
+        self.ws_url = config["workspace-url"]
+        max_size = int(config.get("object-info-cache-size", "10000"))
+        self.absolute_cache = LRUCache(max_size)
+        self.relative_cache = TTLCache(max_size, int(config.get("object-info-cache-ttl", "60")))
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_object_info(self, ref, token, ws=None):
+        """
+        Returns object info tuple for the reference.
+        ws - optional Workspace client to use in case of cache miss
+        """
+        cache = self.absolute_cache if ABSOLUTE_REF.match(ref) else self.relative_cache
+        key = (ref, token)
+        with self.lock:
+            info = cache.get(key)
+            if info is not None:
+                self.hits += 1
+                return info
+            self.misses += 1
+        if ws is None:
+            ws = Workspace(self.ws_url, token=token)
+        info = ws.get_object_info3({"objects": [{"ref": ref}]})['infos'][0]
+        with self.lock:
+            cache[key] = info
+        return info
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "size": len(self.absolute_cache) + len(self.relative_cache)}
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+
+class SingleFlight:
+    """
+    Makes sure only one caller (across threads and uwsgi processes sharing
+    the folder) builds a given artifact at a time. The builder holds
+    "<key>.lock" file created exclusively, others wait for the lock to go
+    away and then reuse the result. The builder refreshes mtime of the lock
+    while it runs, so lock left by a dead process of this host (or by other
+    host, not refreshed within stale_timeout) is removed and waiters can
+    take over, but long builds are never run twice.
+    """
+
+    def __init__(self, lock_dir, wait_timeout=600, stale_timeout=120, poll_interval=0.1):
+        self.lock_dir = lock_dir
+        self.wait_timeout = wait_timeout
+        # waiters have to outlive lock of crashed builder on other host
+        self.stale_timeout = min(stale_timeout, wait_timeout / 2)
+        self.poll_interval = poll_interval
+        self.hostname = socket.gethostname()
+
+    def get_lock_file(self, key):
+        return os.path.join(self.lock_dir, key + ".lock")
+
+    def is_locked(self, key):
+        return os.path.exists(self.get_lock_file(key))
+
+    def run(self, key, is_done, build):
+        """
+        Calls build() unless is_done() reports the artifact is already there.
+        Returns True if build was done by this caller.
+        """
+        lock_file = self.get_lock_file(key)
+        deadline = time.time() + self.wait_timeout
+        while True:
+            if is_done():
+                return False
+            token = self._acquire(lock_file)
+            if token is not None:
+                with self._holding(lock_file, token):
+                    # might have been finished while we were taking the lock
+                    if is_done():
+                        return False
+                    build()
+                    return True
+            self._remove_if_stale(lock_file)
+            if time.time() > deadline:
+                raise RuntimeError("Timed out waiting for concurrent build of " + key)
+            time.sleep(self.poll_interval)
+
+    def try_run(self, key, build):
+        """
+        Calls build() unless somebody else is running it for the same key
+        right now. Returns True if build was done by this caller.
+        """
+        lock_file = self.get_lock_file(key)
+        self._remove_if_stale(lock_file)
+        token = self._acquire(lock_file)
+        if token is None:
+            return False
+        with self._holding(lock_file, token):
+            build()
+            return True
+
+    def _acquire(self, lock_file):
+        """Creates the lock, returns its unique token (None if it's taken)."""
+        try:
+            fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return None
+        token = uuid.uuid4().hex
+        with os.fdopen(fd, "w") as f:
+            json.dump({"host": self.hostname, "pid": os.getpid(), "time": time.time(),
+                       "token": token}, f)
+        return token
+
+    @contextlib.contextmanager
+    def _holding(self, lock_file, token):
+        """Keeps mtime of the lock fresh while the block runs, then releases it."""
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(self.stale_timeout / 4):
+                try:
+                    os.utime(lock_file)
+                except FileNotFoundError:
+                    return
+
+        thread = threading.Thread(target=heartbeat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+            self._release(lock_file, token)
+
+    def _release(self, lock_file, token):
+        # remove the lock only if it's still ours
+        try:
+            with open(lock_file) as f:
+                owner = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if owner.get("token") != token:
+            logging.warning("Lock " + lock_file + " was taken over by other builder")
+            return
+        try:
+            os.remove(lock_file)
+        except FileNotFoundError:
+            pass
+
+    def _remove_if_stale(self, lock_file):
+        try:
+            st = os.stat(lock_file)
+            with open(lock_file) as f:
+                owner = json.load(f)
+        except (FileNotFoundError, ValueError):
+            # released meanwhile or still being written
+            return
+        if owner.get("host") == self.hostname:
+            stale = not self._is_alive(owner.get("pid"))
+        else:
+            # builder on other host refreshes mtime as long as it runs
+            stale = st.st_mtime < time.time() - self.stale_timeout
+        if not stale:
+            return
+        logging.warning("Removing stale lock " + lock_file)
+        # move lock away first and make sure it's still the one we looked at,
+        # another waiter could have replaced it in between
+        moved = lock_file + "." + uuid.uuid4().hex + ".stale"
+        try:
+            os.rename(lock_file, moved)
+        except FileNotFoundError:
+            return
+        if os.stat(moved).st_ino != st.st_ino:
+            try:
+                os.link(moved, lock_file)
+            except FileExistsError:
+                pass
+        os.remove(moved)
+
+    def _is_alive(self, pid):
+        if not pid:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
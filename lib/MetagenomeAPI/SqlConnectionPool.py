@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import fcntl
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+from threading import Lock
+
+
+class _PooledConnection:
+
+    def __init__(self, conn, lock_file, inode):
+        self.conn = conn
+        self.lock_file = lock_file
+        self.inode = inode
+        self.last_used = time.time()
+
+
+class SqlConnectionPool:
+    """
+    Keeps one read-only connection per (thread, SQLite feature index file)
+    and reuses it across requests. Index files are complete once renamed
+    into place and later only replaced (new inode), so they are opened as
+    immutable with memory mapped reads. A shared flock is held on every open
+    file so the index janitor doesn't delete it; connections idle for more
+    than sql-connection-idle-timeout seconds are let go, and so are ones to
+    files the janitor evicts (close_files()). A connection is only closed by
+    its own thread, on its next get_connection(), since another thread may be
+    running a query on it; the flock is released right away.
+    """
+
+    def __init__(self, config):
+        self.mmap_size = int(config.get("sql-mmap-size", str(256 * 1024 * 1024)))
+        self.cache_kb = int(config.get("sql-cache-kb", "16384"))
+        self.idle_timeout = int(config.get("sql-connection-idle-timeout", "120"))
+        # (thread id, path) -> _PooledConnection
+        self.connections = {}
+        # thread id -> connections let go of, waiting for their thread to close them
+        self.retired = {}
+        self.lock = Lock()
+        self.last_sweep = time.time()
+
+    def get_connection(self, path):
+        thread_id = threading.get_ident()
+        key = (thread_id, path)
+        st = os.stat(path)
+        with self.lock:
+            retired = self.retired.pop(thread_id, [])
+            pooled = self.connections.get(key)
+            if pooled is not None and pooled.inode != (st.st_dev, st.st_ino):
+                # file was replaced (backfilled or rebuilt after eviction)
+                del self.connections[key]
+                retired.append(pooled)
+                pooled = None
+        for old in retired:
+            self._close(old)
+        if pooled is None:
+            pooled = self._open(path)
+            with self.lock:
+                self.connections[key] = pooled
+        pooled.last_used = time.time()
+        self._sweep()
+        return pooled.conn
+
+    def _open(self, path):
+        lock_file = open(path, "rb")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            st = os.fstat(lock_file.fileno())
+            uri = "file:%s?mode=ro&immutable=1" % (urllib.parse.quote(path))
+            # connection is used by one thread only, but connections of
+            # threads that are gone get closed by the idle sweep
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            conn.execute("PRAGMA mmap_size = %d" % (self.mmap_size))
+            conn.execute("PRAGMA cache_size = %d" % (-self.cache_kb))
+        except Exception:
+            lock_file.close()
+            raise
+        return _PooledConnection(conn, lock_file, (st.st_dev, st.st_ino))
+
+    def _close(self, pooled):
+        pooled.conn.close()
+        pooled.lock_file.close()
+
+    def _retire(self, key, live_threads):
+        """
+        Takes connection out of the pool (caller holds self.lock). Its flock
+        is released now, the connection itself is closed by its thread (or
+        here if the thread is gone).
+        """
+        pooled = self.connections.pop(key)
+        pooled.lock_file.close()
+        if key[0] in live_threads:
+            self.retired.setdefault(key[0], []).append(pooled)
+        else:
+            pooled.conn.close()
+
+    def _sweep(self):
+        """Lets go of connections not used within the idle timeout."""
+        now = time.time()
+        if now - self.last_sweep < self.idle_timeout / 2:
+            return
+        self.last_sweep = now
+        live_threads = set(thread.ident for thread in threading.enumerate())
+        with self.lock:
+            idle = [key for key, pooled in self.connections.items()
+                    if now - pooled.last_used > self.idle_timeout]
+            for key in idle:
+                self._retire(key, live_threads)
+            # threads that are gone won't close their retired connections
+            for thread_id in [thread_id for thread_id in self.retired
+                              if thread_id not in live_threads]:
+                for pooled in self.retired.pop(thread_id):
+                    pooled.conn.close()
+
+    def close_files(self, paths):
+        """Lets go of connections (of all threads) to the files."""
+        paths = set(paths)
+        live_threads = set(thread.ident for thread in threading.enumerate())
+        with self.lock:
+            for key in [key for key in self.connections if key[1] in paths]:
+                self._retire(key, live_threads)
+
+    def close_all(self):
+        """Closes all connections, only safe once no thread is using the pool."""
+        with self.lock:
+            for pooled in self.connections.values():
+                self._close(pooled)
+            for retired in self.retired.values():
+                for pooled in retired:
+                    pooled.conn.close()
+            self.connections = {}
+            self.retired = {}
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from MetagenomeAPI.ColumnStore import ColumnStore, StringColumn, write_column_store
+
+NGRAM_SIZE = 3
+# short word found in more than this share of the tokens is looked for by
+# scanning row texts, merging that many postings costs more than the scan
+SCAN_KEY_SHARE = 0.05
+
+
+def get_tokens(line):
+    """
+    Tokens of one lower-cased TSV row: n-grams of every field (not crossing
+    tab separators) and whole fields shorter than n-gram size.
+    """
+    tokens = set()
+    for field in line.split('\t'):
+        if len(field) < NGRAM_SIZE:
+            tokens.add(field)
+        else:
+            for i in range(len(field) - NGRAM_SIZE + 1):
+                tokens.add(field[i:i + NGRAM_SIZE])
+    return tokens
+
+
+def scan_rows(texts, word):
+    """
+    Sorted positions of rows which text contains the word, by scanning all
+    the texts (list of strings or string column).
+    """
+    if not isinstance(texts, StringColumn):
+        return np.array([row for row, text in enumerate(texts) if word in text], dtype=np.int32)
+    data = np.frombuffer(texts.blob, dtype=np.uint8)
+    pattern = word.encode("utf-8")
+    count = len(data) - len(pattern) + 1
+    if count <= 0:
+        return np.zeros(0, dtype=np.int32)
+    found = data[:count] == pattern[0]
+    for i in range(1, len(pattern)):
+        found &= data[i:i + count] == pattern[i]
+    # texts are stored back to back, drop matches running into the next row
+    for i in range(1, len(pattern)):
+        crossing = texts.offsets[1:] - i
+        found[crossing[(crossing >= 0) & (crossing < count)]] = False
+    rows = np.flatnonzero(texts.offsets[1:] - texts.offsets[:-1] >= len(pattern))
+    if len(rows) == 0:
+        return np.zeros(0, dtype=np.int32)
+    # segments between starts of long enough rows hold the rest (too short to
+    # match) in their tails
+    return rows[np.logical_or.reduceat(found, texts.offsets[rows])].astype(np.int32)
+
+
+def build_postings(texts, row_offset=0):
+    """
+    Sorted tokens of the texts and int32 positions of rows having each of
+    them (as bytes), row positions start at row_offset.
+    """
+    rows_by_token = {}
+    for row, text in enumerate(texts, row_offset):
+        for token in get_tokens(text):
+            rows = rows_by_token.get(token)
+            if rows is None:
+                rows_by_token[token] = [row]
+            else:
+                rows.append(row)
+    keys = sorted(rows_by_token)
+    return keys, [np.array(rows_by_token[key], dtype=np.int32).tobytes() for key in keys]
+
+
+# Inverted index from lower-cased tokens (n-grams and short fields) to sorted
+# arrays of row positions having them. Used to answer substring queries of the
+# BinnedContigs search without scanning every row: rows containing a word have
+# all n-grams of it, short words are found among the tokens themselves.
+class TokenIndex:
+
+    def __init__(self, keys, postings, store=None):
+        """
+        keys     - sorted list of tokens
+        postings - sequence (list or bytes column) of int32 row arrays, one
+                   per token
+        store    - column store the postings are read from (if any)
+        """
+        self.keys = keys
+        self.postings = postings
+        self.store = store
+        self.key_pos = {key: pos for pos, key in enumerate(keys)}
+
+    @classmethod
+    def build(cls, texts):
+        """texts - lower-cased TSV text of every row"""
+        return cls(*build_postings(texts))
+
+    @classmethod
+    def merge(cls, parts):
+        """
+        Index of all rows from postings built for consecutive row ranges
+        (list of (keys, postings) pairs as returned by build_postings, in row
+        order). Same as the one built from all the texts at once.
+        """
+        postings_by_token = {}
+        for keys, postings in parts:
+            for key, rows in zip(keys, postings):
+                token_postings = postings_by_token.get(key)
+                if token_postings is None:
+                    postings_by_token[key] = [rows]
+                else:
+                    token_postings.append(rows)
+        keys = sorted(postings_by_token)
+        return cls(keys, [b"".join(postings_by_token[key]) for key in keys])
+
+    @classmethod
+    def from_file(cls, index_file):
+        store = ColumnStore(index_file)
+        return cls(store.column("token").to_list(), store.column("rows"), store)
+
+    def save(self, index_file, codec=None):
+        write_column_store(index_file, len(self.keys),
+                           [("token", "str", self.keys), ("rows", "bytes", self.postings)],
+                           codec=codec)
+
+    def get_rows(self, pos):
+        postings = self.postings[pos] if isinstance(self.postings, list) else \
+            self.postings.get_bytes(pos)
+        return np.frombuffer(postings, dtype=np.int32)
+
+    def find_rows(self, word, get_text, within=None, texts=None):
+        """
+        Sorted positions of rows which text (lower-cased) contains the word.
+        get_text - function returning lower-cased text of a row, used to
+                   check candidate rows for words longer than n-gram size.
+        within   - optional sorted row positions to limit the search to.
+        texts    - optional lower-cased texts of all rows, scanned instead of
+                   merging postings of short words found in many tokens.
+        """
+        if len(word) < NGRAM_SIZE:
+            # every field containing a short word has it in one of its tokens
+            positions = [pos for pos, key in enumerate(self.keys) if word in key]
+            if texts is not None and len(positions) > SCAN_KEY_SHARE * len(self.keys):
+                return scan_rows(texts, word)
+            if len(positions) == 1:
+                return self.get_rows(positions[0])
+            return np.unique(np.concatenate([self.get_rows(pos) for pos in positions] +
+                                            [np.zeros(0, dtype=np.int32)]))
+        rows = None
+        for i in range(len(word) - NGRAM_SIZE + 1):
+            pos = self.key_pos.get(word[i:i + NGRAM_SIZE])
+            if pos is None:
+                return np.zeros(0, dtype=np.int32)
+            ngram_rows = self.get_rows(pos)
+            rows = ngram_rows if rows is None else \
+                np.intersect1d(rows, ngram_rows, assume_unique=True)
+            if len(rows) == 0:
+                return rows
+        if within is not None:
+            rows = np.intersect1d(rows, within, assume_unique=True)
+        # all n-grams present doesn't mean they are adjacent
+        return np.array([row for row in rows.tolist() if word in get_text(row)], dtype=np.int32)
+
+    def match(self, query_words, get_text, texts=None):
+        """Sorted positions of rows containing all the query words."""
+        rows = None
+        for word in sorted(set(query_words), key=len, reverse=True):
+            word_rows = self.find_rows(word, get_text, rows, texts)
+            rows = word_rows if rows is None else \
+                np.intersect1d(rows, word_rows, assume_unique=True)
+            if len(rows) == 0:
+                break
+        return rows
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import filecmp
+import os
+import shutil
+import tempfile
+import unittest
+
+from MetagenomeAPI.BinnedContigsIndexer import BinnedContigsIndexer
+
+
+class FakeWorkspace:
+    """Serves one BinnedContigs object with bins of synthetic contigs."""
+
+    def __init__(self, n_bins, contigs_per_bin):
+        self.bins = []
+        for bin_pos in range(n_bins):
+            contigs = {}
+            for pos in range(contigs_per_bin + bin_pos):
+                contigs["NODE_%d_%d_length_%d" % (bin_pos, pos, 500 + pos)] = {
+                    "len": 500 + pos, "gc": (pos % 97) / 97.0, "cov": (pos % 13) * 1.5}
+            self.bins.append({"bid": "bin.%03d.fasta" % bin_pos, "contigs": contigs})
+
+    def get_objects2(self, params):
+        bins = [{"bid": b["bid"], "contigs": dict(b["contigs"])} for b in self.bins]
+        return {"data": [{"data": {"bins": bins}}]}
+
+
+class BinnedContigsIndexerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.ws = FakeWorkspace(5, 40)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def build(self, name, config):
+        index_dir = os.path.join(self.work_dir, name)
+        config.update({"workspace-url": "https://localhost/ws", "metagenome-index-dir": index_dir})
+        indexer = BinnedContigsIndexer(config)
+        try:
+            indexer.save_all_contigs_in_bins(self.ws, "1/2/3", "0123456789abcdef")
+        finally:
+            if indexer.build_pool is not None:
+                indexer.build_pool.terminate()
+        return indexer, index_dir
+
+    def test_parallel_build(self):
+        _, seq_dir = self.build("seq", {"index-build-workers": "1"})
+        # object-wide table (210 rows) is over a worker's share of 420 rows,
+        # its token index is built in two row ranges and merged
+        indexer, par_dir = self.build("par", {"index-build-workers": "3",
+                                              "index-parallel-build-min-contigs": "0"})
+        # tables really came from the process pool
+        self.assertIsNotNone(indexer.build_pool)
+        files = sorted(name for name in os.listdir(seq_dir) if name.endswith((".col", ".tok", ".hsh")))
+        self.assertEqual(len(files), 5 * 2 + 3)
+        self.assertEqual(files, sorted(name for name in os.listdir(par_dir)
+                                       if name.endswith((".col", ".tok", ".hsh"))))
+        for name in files:
+            self.assertTrue(filecmp.cmp(os.path.join(seq_dir, name), os.path.join(par_dir, name),
+                                        shallow=False), msg=name)
+        table = indexer.get_table("0123456789abcdef", indexer.ALL_CONTIGS_SUFFIX,
+                                  indexer.all_contigs_column_props_map)
+        self.assertEqual(table.size, 5 * 40 + 10)
+        self.assertEqual(len(table.find_rows(["node_3_1"])), 11)
+
+    def test_broken_build_workers(self):
+        # workers which can't start fail the build instead of hanging it
+        with self.assertRaises(RuntimeError):
+            self.build("broken", {"index-build-workers": "2",
+                                  "index-parallel-build-min-contigs": "0",
+                                  "index-build-python": "/bin/false",
+                                  "index-lock-timeout": "3"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import re
+import shutil
+import struct
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from MetagenomeAPI import Codecs
+from MetagenomeAPI.Codecs import get_available_codecs, get_codec
+from MetagenomeAPI.ColumnStore import INT_NULL, MAGIC, ColumnStore, write_column_store
+
+COLUMNS = [("id", "str", ["contig_1", "", "contig_ü"]),
+           ("len", "int64", np.array([500, INT_NULL, 7])),
+           ("gc", "float64", np.array([0.5, np.nan, 0.25])),
+           ("rank", "int32", np.array([1, 0, 2], dtype=np.int32)),
+           ("rows", "bytes", [b"\x00\x01", b"", b"\xff"])]
+
+
+class ColumnStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.work_dir, "table.col")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def check_columns(self, store):
+        self.assertEqual(store.n_rows, 3)
+        self.assertEqual(store.column("id").to_list(), COLUMNS[0][2])
+        self.assertEqual(store.column("id")[2], "contig_ü")
+        self.assertEqual(store.column("len").tolist(), COLUMNS[1][2].tolist())
+        np.testing.assert_array_equal(store.column("gc"), COLUMNS[2][2])
+        self.assertEqual(store.column("rank").dtype, np.int32)
+        self.assertEqual(store.column("rank").tolist(), [1, 0, 2])
+        self.assertEqual([store.column("rows").get_bytes(pos) for pos in range(3)], COLUMNS[4][2])
+
+    def test_round_trip(self):
+        for name in ["none", "gzip", "zstd", "lz4"]:
+            with self.subTest(codec=name):
+                if name not in get_available_codecs():
+                    self.skipTest(Codecs.CODEC_PACKAGES[name] + " is not installed")
+                write_column_store(self.path, 3, COLUMNS, metadata={"key": "value"},
+                                   codec=get_codec(name))
+                store = ColumnStore(self.path)
+                self.check_columns(store)
+                self.assertEqual(store.metadata, {"key": "value"})
+                # uncompressed files keep the layout older versions read
+                self.assertEqual(store.version, 1 if name == "none" else 2)
+                self.assertEqual(store.column_info["id"].get("codec", "none"), name)
+
+    def test_version_1_file(self):
+        # written the way versions without codecs did
+        data = MAGIC + struct.pack("<I", 1)
+        columns = {}
+        for name, values in [("offsets", np.array([0, 3, 3, 5], dtype="<i8").tobytes()),
+                             ("blob", b"abcde"),
+                             ("data", np.array([1, 2, 3], dtype="<i8").tobytes())]:
+            data += b"\0" * (-len(data) % 8)
+            columns[name] = [len(data), len(values)]
+            data += values
+        footer = json.dumps({"n_rows": 3, "metadata": {}, "columns": {
+            "id": {"kind": "str", "offsets": columns["offsets"], "blob": columns["blob"]},
+            "len": {"kind": "int64", "data": columns["data"]}}}).encode("utf-8")
+        with open(self.path, "wb") as f:
+            f.write(data + footer + struct.pack("<Q", len(footer)) + MAGIC)
+        store = ColumnStore(self.path)
+        self.assertEqual(store.column("id").to_list(), ["abc", "", "de"])
+        self.assertEqual(store.column("len").tolist(), [1, 2, 3])
+
+    def test_missing_codec_package(self):
+        with self.assertRaisesRegex(ValueError, "Unknown codec 'bz2'"):
+            get_codec("bz2")
+        write_column_store(self.path, 3, COLUMNS, codec=get_codec("gzip"))
+        with mock.patch.object(Codecs, "zstandard", None), \
+                mock.patch.object(Codecs, "lz4_frame", None):
+            self.assertEqual(get_available_codecs(), ["none", "gzip"])
+            with self.assertRaisesRegex(ValueError, "'zstandard' which is not installed"):
+                get_codec("zstd")
+            with self.assertRaisesRegex(ValueError, "'lz4' which is not installed"):
+                get_codec("lz4")
+            # files of other codecs are still read
+            self.check_columns(ColumnStore(self.path))
+
+    @unittest.skipUnless("zstd" in get_available_codecs(), "zstandard is not installed")
+    def test_file_of_missing_codec(self):
+        write_column_store(self.path, 3, COLUMNS, codec=get_codec("zstd"))
+        store = ColumnStore(self.path)
+        with mock.patch.object(Codecs, "zstandard", None):
+            with self.assertRaisesRegex(ValueError, "'zstandard' which is not installed.*" +
+                                        "can't read file: " + re.escape(self.path)):
+                store.column("id")
+
+
+if __name__ == "__main__":
+    unittest.main()
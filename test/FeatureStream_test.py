@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import unittest
+
+from MetagenomeAPI.FeatureStream import iter_gunzip, iter_json_array
+
+ARRAY = ('[{"id": "gene_1", "functions": ["kinase é", "x\\"y"], "location": [["c", 10, "+", 90]]},'
+         ' 123, -4.5e3, "str", true, null, [1, [2, []]], {} ]').encode("utf-8")
+
+
+def split(data, size):
+    return [data[pos:pos + size] for pos in range(0, len(data), size)]
+
+
+class FeatureStreamTest(unittest.TestCase):
+
+    def test_values_split_across_chunks(self):
+        expected = json.loads(ARRAY)
+        # every place a chunk boundary can fall at, including inside numbers,
+        # escapes and multi-byte characters
+        for pos in range(len(ARRAY) + 1):
+            self.assertEqual(list(iter_json_array([ARRAY[:pos], ARRAY[pos:]])), expected,
+                             msg=str(pos))
+        self.assertEqual(list(iter_json_array(split(ARRAY, 1))), expected)
+        self.assertEqual(list(iter_json_array([b" [ 1 ,2 ] \n"])), [1, 2])
+        self.assertEqual(list(iter_json_array([b"[", b"]"])), [])
+
+    def test_malformed_input(self):
+        for data in [b'{"id": 1}', b'[1 2]', b'[{"id": 1} {"id": 2}]', b'[1, tru]',
+                     b'[,1]', b'[1,,2]', b'[1,]']:
+            with self.assertRaises(ValueError, msg=data):
+                list(iter_json_array(split(data, 3)))
+
+    def test_truncated_input(self):
+        for data in [b'', b'[', b'[1, 2', b'[1, 2,', b'[{"id": "gene', ARRAY[:-1]]:
+            with self.assertRaises(ValueError, msg=data):
+                list(iter_json_array(split(data, 4)))
+
+    def test_gzip_members(self):
+        first, second = ARRAY[:50], ARRAY[50:]
+        data = gzip.compress(first) + gzip.compress(second)
+        for size in [1, 7, len(data)]:
+            self.assertEqual(b"".join(iter_gunzip(split(data, size))), ARRAY)
+        self.assertEqual(list(iter_json_array(iter_gunzip(split(data, 16)))), json.loads(ARRAY))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import fcntl
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from MetagenomeAPI.IndexJanitor import IndexCatalog, IndexJanitor, get_artifact_key
+
+
+class IndexJanitorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.index_dir = os.path.join(self.work_dir, "index")
+        self.scratch = os.path.join(self.work_dir, "scratch")
+        os.makedirs(self.scratch)
+        self.config = {"metagenome-index-dir": self.index_dir, "scratch": self.scratch,
+                       "index-max-bytes": "100", "index-min-idle": "60"}
+        self.catalog = IndexCatalog(self.config)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def get_janitor(self, policy="lru"):
+        return IndexJanitor(dict(self.config, **{"index-eviction-policy": policy}), self.catalog)
+
+    def make_artifact(self, name, folder=None, size=100):
+        """Index file built long ago, returns its path."""
+        path = os.path.join(folder or self.index_dir, name)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        mtime = time.time() - 3 * 3600
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def set_access(self, path, age, count):
+        with self.catalog._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?)",
+                         (get_artifact_key(path), time.time() - age, count))
+
+    def make_artifacts(self):
+        """
+        Three objects: "aaaa" used recently but rarely, "bbbb" long ago but
+        often and "cccc" in between.
+        """
+        for chsum, age, count in [("aaaa", 1000, 1), ("bbbb", 2000, 10), ("cccc", 1500, 5)]:
+            self.make_artifact(chsum + "_bins.col", size=60)
+            self.set_access(self.make_artifact(chsum + "_bins.tok", size=40), age, count)
+
+    def remaining(self):
+        return sorted(set(name.split("_")[0] for name in os.listdir(self.index_dir)
+                          if get_artifact_key(name) is not None))
+
+    def test_artifact_groups(self):
+        self.assertEqual(get_artifact_key("/x/aaaa_bins.col"), "/x/aaaa_bins")
+        self.assertEqual(get_artifact_key("/x/aaaa_bins.tok"), "/x/aaaa_bins")
+        # all bins marker goes with the object-wide contig table
+        self.assertEqual(get_artifact_key("/x/aaaa_ctgs.done"), "/x/aaaa_allctgs")
+        self.assertIsNone(get_artifact_key("/x/aaaa.manifest.json"))
+        self.assertIsNone(get_artifact_key("/x/a.col", [".sql"]))
+
+    def test_lru(self):
+        self.make_artifacts()
+        self.assertEqual(self.get_janitor("lru").run_once(), 200)
+        self.assertEqual(self.remaining(), ["aaaa"])
+        self.assertEqual(sorted(self.catalog.get_accesses()),
+                         [os.path.join(self.index_dir, "aaaa_bins")])
+
+    def test_lfu(self):
+        self.make_artifacts()
+        self.assertEqual(self.get_janitor("lfu").run_once(), 200)
+        self.assertEqual(self.remaining(), ["bbbb"])
+
+    def test_within_budget(self):
+        self.make_artifact("aaaa_bins.col")
+        self.assertEqual(self.get_janitor().run_once(), 0)
+        self.assertEqual(self.remaining(), ["aaaa"])
+
+    def test_recently_used_kept(self):
+        self.make_artifacts()
+        self.set_access(os.path.join(self.index_dir, "bbbb_bins.col"), 10, 11)
+        self.assertEqual(self.get_janitor().run_once(), 200)
+        self.assertEqual(self.remaining(), ["bbbb"])
+
+    def test_reader_holds_file(self):
+        self.make_artifacts()
+        with open(os.path.join(self.index_dir, "bbbb_bins.tok"), "rb") as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            self.assertEqual(self.get_janitor().run_once(), 200)
+        # the rest of the group is left in place as well
+        self.assertEqual(self.remaining(), ["bbbb"])
+        self.assertTrue(os.path.exists(os.path.join(self.index_dir, "bbbb_bins.col")))
+
+    def test_building_artifacts_kept(self):
+        self.make_artifacts()
+        open(os.path.join(self.index_dir, "bbbb_ctgs.lock"), "w").close()
+        self.get_janitor().run_once()
+        self.assertEqual(self.remaining(), ["bbbb"])
+
+    def test_hard_links(self):
+        # two names of the same SQLite index take its space once
+        first = self.make_artifact("1_2_3.sql", self.scratch)
+        os.link(first, os.path.join(self.scratch, "1_2_4.sql"))
+        self.set_access(first, 2000, 1)
+        self.set_access(os.path.join(self.scratch, "1_2_4.sql"), 1500, 1)
+        self.set_access(self.make_artifact("aaaa_bins.col"), 1000, 1)
+        # first name alone frees nothing, the space comes back with the second
+        self.assertEqual(self.get_janitor().run_once(), 100)
+        self.assertEqual(os.listdir(self.scratch), [])
+        self.assertEqual(self.remaining(), ["aaaa"])
+
+    def test_orphan_manifests(self):
+        self.make_artifacts()
+        for chsum in ["aaaa", "bbbb", "cccc", "dddd"]:
+            open(os.path.join(self.index_dir, chsum + ".manifest.json"), "w").close()
+        # object being built has no tables yet
+        open(os.path.join(self.index_dir, "dddd_ctgs.lock"), "w").close()
+        self.get_janitor().run_once()
+        self.assertEqual(sorted(name for name in os.listdir(self.index_dir)
+                                if name.endswith(".manifest.json")),
+                         ["aaaa.manifest.json", "dddd.manifest.json"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -21,6 +21,7 @@ from AssemblyUtil.AssemblyUtilClient import AssemblyUtil
 from biokbase.workspace.client import Workspace as workspaceService
 from MetagenomeAPI.MetagenomeAPIImpl import MetagenomeAPI
 from MetagenomeAPI.MetagenomeAPIServer import MethodContext
+from MetagenomeAPI.IndexManifest import INDEX_VERSION
 from MetagenomeAPI.authclient import KBaseAuth as _KBaseAuth
 from installed_clients.DataFileUtilClient import DataFileUtil
 import MetagenomeAPI.MetagenomeSearchUtils as MSU
@@ -400,6 +401,19 @@ class MetagenomeAPITest(unittest.TestCase):
         self.assertEquals(ret['bins'][0]['bin_id'], 'out_header.002.fasta')
         self.assertEquals(ret['bins'][1]['bin_id'], 'out_header.001.fasta')
         self.assertEquals(ret['bins'][2]['bin_id'], 'out_header.003.fasta')
+
+        # range filter
+        search_params = {'ref': self.binnedcontigs_ref_1, 'sort_by': [['gc', 1]],
+                         'filters': [{'column': 'gc', 'min': ret['bins'][1]['gc']}]}
+        ret = self.getImpl().search_binned_contigs(self.getContext(), search_params)[0]
+        self.assertEquals(ret['num_found'], 2)
+        self.assertEquals(ret['bins'][0]['bin_id'], 'out_header.001.fasta')
+        with self.assertRaises(ValueError):
+            search_params['filters'] = [{'column': 'bin_id', 'min': 1}]
+            self.getImpl().search_binned_contigs(self.getContext(), search_params)
+        with self.assertRaises(ValueError):
+            search_params['filters'] = [{'column': 'gc', 'min': '0.5'}]
+            self.getImpl().search_binned_contigs(self.getContext(), search_params)
         # todo: sort by other stuff
 
     # @unittest.skip('x')
@@ -466,6 +480,121 @@ class MetagenomeAPITest(unittest.TestCase):
         self.assertEquals(len(ret['contigs']), 5)
         self.assertEquals(ret['contigs'][0]['contig_id'], 'NODE_2492_length_1446_cov_9.165283')
 
+        # range filter combined with sorting and query
+        search_params = {'ref': self.binnedcontigs_ref_1, 'bin_id': 'out_header.002.fasta', 'limit': 5,
+                         'sort_by': [['len', 1]], 'filters': [{'column': 'len', 'min': 10000, 'max': 20000}]}
+        ret = self.getImpl().search_contigs_in_bin(self.getContext(), search_params)[0]
+        self.assertEquals(ret['num_found'], 78)
+        self.assertEquals(len(ret['contigs']), 5)
+        self.assertEquals(ret['contigs'][0]['contig_id'], 'NODE_2148_length_10045_cov_9.282330')
+        search_params['query'] = 'NODE_21'
+        ret = self.getImpl().search_contigs_in_bin(self.getContext(), search_params)[0]
+        self.assertEquals(ret['num_found'], 25)
+
+    # @unittest.skip('x')
+    def test_search_contigs_in_binned_contigs(self):
+        search_params = {'ref': self.binnedcontigs_ref_1, 'limit': 5, 'sort_by': [['len', 0]]}
+        ret = self.getImpl().search_contigs_in_binned_contigs(self.getContext(), search_params)[0]
+        self.assertEquals(ret['num_found'], 922)
+        self.assertEquals(len(ret['contigs']), 5)
+
+        # point lookup of the bin holding a contig
+        search_params = {'ref': self.binnedcontigs_ref_1, 'contig_id': 'NODE_2131_length_1678_cov_9.039928'}
+        ret = self.getImpl().search_contigs_in_binned_contigs(self.getContext(), search_params)[0]
+        self.assertEquals(ret['num_found'], 1)
+        self.assertEquals(ret['contigs'][0]['bin_id'], 'out_header.002.fasta')
+        self.assertEquals(ret['contigs'][0]['len'], 1678)
+
+        # query, filter and sort across bins
+        search_params = {'ref': self.binnedcontigs_ref_1, 'query': 'out_header.002',
+                         'filters': [{'column': 'len', 'min': 10000, 'max': 20000}],
+                         'sort_by': [['len', 1]]}
+        ret = self.getImpl().search_contigs_in_binned_contigs(self.getContext(), search_params)[0]
+        self.assertEquals(ret['num_found'], 78)
+        self.assertEquals(ret['contigs'][0]['contig_id'], 'NODE_2148_length_10045_cov_9.282330')
+
+    # @unittest.skip('x')
+    def test_get_binned_contigs_summary(self):
+        params = {'ref': self.binnedcontigs_ref_1}
+        ret = self.getImpl().get_binned_contigs_summary(self.getContext(), params)[0]
+        self.assertEquals(ret['n_contigs'], 922)
+        self.assertEquals(ret['columns']['len']['count'], 922)
+        self.assertEquals(ret['columns']['len']['max'], 389469)
+        self.assertEquals(sum(ret['columns']['len']['histogram']), 922)
+        self.assertEquals([b['n_contigs'] for b in ret['bins']], [81, 369, 472])
+        bin_002 = ret['bins'][1]
+        self.assertEquals(bin_002['bin_id'], 'out_header.002.fasta')
+        self.assertEquals(bin_002['columns']['len']['max'], 51632)
+        self.assertEquals(len(bin_002['columns']['gc']['histogram']),
+                          len(ret['histogram_edges']['gc']) - 1)
+
+    # @unittest.skip('x')
+    def test_get_gc_cov_density(self):
+        params = {'ref': self.binnedcontigs_ref_1, 'resolution': 10, 'per_bin': 1}
+        ret = self.getImpl().get_gc_cov_density(self.getContext(), params)[0]
+        self.assertEquals(len(ret['counts']), 10)
+        self.assertEquals(len(ret['gc_edges']), 11)
+        self.assertEquals(ret['n_contigs'] + ret['n_skipped'], 922)
+        self.assertEquals(sum(sum(row) for row in ret['counts']), ret['n_contigs'])
+        self.assertEquals(sum(cell[2] for b in ret['bins'] for cell in b['cells']), ret['n_contigs'])
+        params = {'ref': self.binnedcontigs_ref_1, 'resolution': 10}
+        ret = self.getImpl().get_gc_cov_density(self.getContext(), params)[0]
+        self.assertNotIn('bins', ret)
+
+    # @unittest.skip('x')
+    def test_export_binned_contigs(self):
+        params = {'ref': self.binnedcontigs_ref_1, 'sort_by': [['gc', 1]]}
+        ret = self.getImpl().export_binned_contigs(self.getContext(), params)[0]
+        self.assertEquals(ret['num_found'], 3)
+        self.assertEquals(ret['next_start'], -1)
+        lines = ret['data'].splitlines()
+        self.assertEquals(lines[0], 'bin_id\tn_contigs\tsum_contig_len\tgc\tcov')
+        self.assertEquals([line.split('\t')[0] for line in lines[1:]],
+                          ['out_header.002.fasta', 'out_header.001.fasta', 'out_header.003.fasta'])
+
+        # all contigs in chunks
+        params = {'ref': self.binnedcontigs_ref_1, 'item_type': 'contigs', 'format': 'ndjson',
+                  'limit': 400}
+        contigs = []
+        while params.get('start') != -1:
+            ret = self.getImpl().export_binned_contigs(self.getContext(), params)[0]
+            contigs.extend(json.loads(line) for line in ret['data'].splitlines())
+            params['start'] = ret['next_start']
+        self.assertEquals(ret['num_found'], 922)
+        self.assertEquals(len(contigs), 922)
+        self.assertEquals(len([c for c in contigs if c['bin_id'] == 'out_header.002.fasta']), 369)
+
+        # first and last page
+        params = {'ref': self.binnedcontigs_ref_1, 'item_type': 'contigs', 'limit': 10}
+        ret = self.getImpl().export_binned_contigs(self.getContext(), params)[0]
+        self.assertEquals(ret['start'], 0)
+        self.assertEquals(ret['next_start'], 10)
+        self.assertEquals(len(ret['data'].splitlines()), 11)
+        params['start'] = 915
+        ret = self.getImpl().export_binned_contigs(self.getContext(), params)[0]
+        self.assertEquals(ret['next_start'], -1)
+        self.assertEquals(len(ret['data'].splitlines()), 7)
+
+        # paging that would never end
+        with self.assertRaises(ValueError):
+            params = {'ref': self.binnedcontigs_ref_1, 'item_type': 'contigs', 'limit': 0}
+            self.getImpl().export_binned_contigs(self.getContext(), params)
+        with self.assertRaises(ValueError):
+            params = {'ref': self.binnedcontigs_ref_1, 'item_type': 'contigs', 'start': -5}
+            self.getImpl().export_binned_contigs(self.getContext(), params)
+
+    def test_index_manifest(self):
+        params = {'ref': self.binnedcontigs_ref_1}
+        self.getImpl().search_contigs_in_binned_contigs(self.getContext(), params)
+        indexer = self.getImpl().indexer
+        chsum = indexer.info_cache.get_object_info(self.binnedcontigs_ref_1,
+                                                   self.getContext()['token'])[8]
+        tables = indexer.manifest.read(chsum)['tables']
+        entry = tables[chsum + indexer.ALL_CONTIGS_SUFFIX + '.col']
+        self.assertEquals(entry['rows'], 922)
+        self.assertEquals(entry['columns'], ['id', 'bin_id', 'len', 'gc', 'cov'])
+        self.assertEquals(entry['version'], INDEX_VERSION)
+
     @attr("indexing")
     def test_indexing(self):
         # Test a copy
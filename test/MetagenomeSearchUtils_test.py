@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from MetagenomeAPI.MetagenomeSearchUtils import Indexer, MetagenomeSearchUtils
+
+
+def make_feature(pos, function):
+    contig_id = "contig_%d" % (pos % 3)
+    return {"id": "gene_%d" % pos,
+            "type": "CDS" if pos % 2 else "gene",
+            "location": [[contig_id, pos * 100, "+", 90]],
+            "dna_sequence": "ACGT",
+            "dna_sequence_length": 90,
+            "functions": [function]}
+
+
+class MetagenomeSearchUtilsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scratch = tempfile.mkdtemp()
+        self.msu = MetagenomeSearchUtils({"workspace-url": "https://localhost/ws",
+                                          "scratch": self.scratch,
+                                          "metagenome-index-dir": self.scratch,
+                                          "workers": "1"})
+        # features blob is never fetched, the index is built from local data
+        patcher = mock.patch.object(self.msu, "get_object", return_value={"data": {}})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        functions = ["Phosphokinase"] * 5 + ["kinase A"] * 3 + ["gene_12 like"] * 2 + \
+            ["hypothetical protein"] * 110
+        self.ref = "1/2/3"
+        self.msu.indexer._build_sql(self.msu.indexer.sqlfile(self.ref),
+                                    [make_feature(pos, function)
+                                     for pos, function in enumerate(functions)])
+
+    def tearDown(self):
+        # background backfills are done before the files go away
+        self.msu.pool.close()
+        self.msu.pool.join()
+        self.msu.connections.close_all()
+        shutil.rmtree(self.scratch)
+
+    def copy_without_tables(self, ref, tables):
+        """Copy of the test index as built by older versions (no such tables)."""
+        sqlf = self.msu.indexer.sqlfile(ref)
+        shutil.copyfile(self.msu.indexer.sqlfile(self.ref), sqlf)
+        conn = sqlite3.connect(sqlf)
+        for table in tables:
+            conn.execute("DROP TABLE " + table)
+        conn.commit()
+        conn.close()
+        return sqlf
+
+    def search_ids(self, ref, query):
+        ret = self.msu.search("token", ref, 0, 200, None, query)
+        return ret["num_found"], [feature["feature_id"] for feature in ret["features"]]
+
+    @unittest.skipUnless(Indexer.HAS_TRIGRAM, "SQLite without trigram tokenizer")
+    def test_text_index_search(self):
+        conn = self.msu.connections.get_connection(self.msu.indexer.sqlfile(self.ref))
+        self.assertTrue(self.msu.indexer.has_table(conn, Indexer.FTS_TABLE))
+        # substrings anywhere in the text fields, case-insensitive
+        self.assertEqual(self.search_ids(self.ref, "kinase")[0], 8)
+        self.assertEqual(self.search_ids(self.ref, "KINASE")[0], 8)
+        self.assertEqual(self.search_ids(self.ref, "phosphokinase kinase")[0], 8)
+        # keyword fields match exactly, "_" isn't a word separator
+        self.assertEqual(self.search_ids(self.ref, "gene_12"), (3, ["gene_12", "gene_8", "gene_9"]))
+        self.assertEqual(self.search_ids(self.ref, "CDS")[0], 60)
+        # short tokens aren't in the trigram index
+        self.assertEqual(self.search_ids(self.ref, "12")[0], 2)
+
+    def test_like_fallback(self):
+        self.copy_without_tables("1/2/4", [Indexer.FTS_TABLE])
+        for query in ["kinase", "KINASE", "gene_12", "hypothetical gene_3", "CDS", "12", "xyz"]:
+            self.assertEqual(self.search_ids("1/2/4", query), self.search_ids(self.ref, query),
+                             msg=query)
+
+    def test_backfill(self):
+        sqlf = self.copy_without_tables("1/2/5", [Indexer.FTS_TABLE, Indexer.RTREE_TABLE,
+                                                  "contigs"])
+        conn = sqlite3.connect(sqlf)
+        # word index of earlier development builds gets replaced
+        conn.execute("CREATE VIRTUAL TABLE features_fts USING fts5(id, content='')")
+        conn.commit()
+        self.assertFalse(self.msu.indexer.is_complete(conn))
+        conn.close()
+        inode = os.stat(sqlf).st_ino
+        self.msu.indexer._backfill(sqlf)
+        self.assertNotEqual(os.stat(sqlf).st_ino, inode)
+        self.assertFalse(os.path.exists(sqlf + ".tmp"))
+        conn = sqlite3.connect(sqlf)
+        self.assertTrue(self.msu.indexer.is_complete(conn))
+        self.assertFalse(self.msu.indexer.has_table(conn, "features_fts"))
+        conn.close()
+        self.assertEqual(self.search_ids("1/2/5", "kinase"), self.search_ids(self.ref, "kinase"))
+        region = self.msu.search_region("token", "1/2/5", "contig_0", 0, 1000, 0, 100, None)
+        self.assertEqual(region["num_found"], 4)
+        # complete index is left alone
+        self.msu.indexer._backfill(sqlf)
+        self.assertFalse(os.path.exists(sqlf + ".tmp"))
+
+
+if __name__ == "__main__":
+    unittest.main()
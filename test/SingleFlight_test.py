@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from MetagenomeAPI.SingleFlight import SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.lock_dir = tempfile.mkdtemp()
+        self.flight = SingleFlight(self.lock_dir, wait_timeout=5, stale_timeout=1,
+                                   poll_interval=0.01)
+        self.lock_file = self.flight.get_lock_file("key")
+
+    def tearDown(self):
+        shutil.rmtree(self.lock_dir)
+
+    def write_lock(self, host, pid, age=0, token="other"):
+        with open(self.lock_file, "w") as f:
+            json.dump({"host": host, "pid": pid, "time": time.time(), "token": token}, f)
+        mtime = time.time() - age
+        os.utime(self.lock_file, (mtime, mtime))
+
+    def get_dead_pid(self):
+        proc = subprocess.Popen([sys.executable, "-c", "pass"])
+        proc.wait()
+        return proc.pid
+
+    def test_single_build(self):
+        builds = []
+        done = threading.Event()
+
+        def build():
+            time.sleep(0.2)
+            builds.append(1)
+            done.set()
+
+        threads = [threading.Thread(target=self.flight.run, args=("key", done.is_set, build))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(builds), 1)
+        self.assertFalse(self.flight.is_locked("key"))
+        # finished artifact isn't built again
+        self.assertFalse(self.flight.run("key", done.is_set, build))
+
+    def test_takeover_of_other_host_lock(self):
+        # builder on other host stopped refreshing the lock
+        self.write_lock("other-host", os.getpid(), age=2)
+        self.assertTrue(self.flight.try_run("key", lambda: None))
+        self.assertFalse(self.flight.is_locked("key"))
+
+    def test_takeover_of_dead_process_lock(self):
+        self.write_lock(self.flight.hostname, self.get_dead_pid())
+        self.assertTrue(self.flight.run("key", lambda: False, lambda: None))
+
+    def test_live_locks_are_kept(self):
+        # refreshed lock of other host
+        self.write_lock("other-host", 1)
+        self.assertFalse(self.flight.try_run("key", lambda: None))
+        # lock of running process of this host, however old
+        self.write_lock(self.flight.hostname, os.getpid(), age=10)
+        self.assertFalse(self.flight.try_run("key", lambda: None))
+        self.assertTrue(self.flight.is_locked("key"))
+        flight = SingleFlight(self.lock_dir, wait_timeout=0.3, poll_interval=0.01)
+        with self.assertRaises(RuntimeError):
+            flight.run("key", lambda: False, lambda: None)
+
+    def test_heartbeat(self):
+        other_host = SingleFlight(self.lock_dir, stale_timeout=1)
+        other_host.hostname = "other-host"
+        seen = []
+
+        def build():
+            # runs longer than lock of other host would stay fresh
+            time.sleep(1.5)
+            seen.append(time.time() - os.stat(self.lock_file).st_mtime)
+            other_host._remove_if_stale(self.lock_file)
+            seen.append(self.flight.is_locked("key"))
+
+        self.assertTrue(self.flight.try_run("key", build))
+        lock_age, still_locked = seen
+        self.assertLess(lock_age, 1)
+        self.assertTrue(still_locked)
+        self.assertFalse(self.flight.is_locked("key"))
+
+    def test_release_checks_token(self):
+        def build():
+            # lock got taken over by other builder meanwhile
+            self.write_lock("other-host", 1, token="new")
+
+        self.assertTrue(self.flight.try_run("key", build))
+        with open(self.lock_file) as f:
+            self.assertEqual(json.load(f)["token"], "new")
+        # released lock is ignored
+        os.remove(self.lock_file)
+        self.flight._release(self.lock_file, "new")
+        self.assertFalse(self.flight.is_locked("key"))
+
+
+if __name__ == "__main__":
+    unittest.main()
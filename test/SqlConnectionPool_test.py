@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import fcntl
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from MetagenomeAPI.SqlConnectionPool import SqlConnectionPool
+
+
+class SqlConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.pool = SqlConnectionPool({"sql-connection-idle-timeout": "60"})
+        self.path = self.make_index("index.sql", "first")
+
+    def tearDown(self):
+        self.pool.close_all()
+        shutil.rmtree(self.work_dir)
+
+    def make_index(self, name, value):
+        """Writes index file aside and renames it into place, as the indexer does."""
+        path = os.path.join(self.work_dir, name)
+        conn = sqlite3.connect(path + ".tmp")
+        conn.execute("CREATE TABLE t (value TEXT)")
+        conn.execute("INSERT INTO t VALUES (?)", (value,))
+        conn.commit()
+        conn.close()
+        os.replace(path + ".tmp", path)
+        return path
+
+    def query(self, conn):
+        return conn.execute("SELECT value FROM t").fetchone()[0]
+
+    def is_closed(self, conn):
+        try:
+            conn.execute("SELECT 1")
+        except sqlite3.ProgrammingError:
+            return True
+        return False
+
+    def is_flocked(self, path):
+        with open(path, "rb") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+        return False
+
+    def in_thread(self, func):
+        """Runs func on another thread (which then exits), returns its result."""
+        result = []
+        thread = threading.Thread(target=lambda: result.append(func()))
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def test_per_thread_reuse(self):
+        conn = self.pool.get_connection(self.path)
+        self.assertIs(self.pool.get_connection(self.path), conn)
+        self.assertEqual(self.query(conn), "first")
+        other = self.in_thread(lambda: self.pool.get_connection(self.path))
+        self.assertIsNot(other, conn)
+        other_path = self.make_index("other.sql", "other")
+        self.assertEqual(self.query(self.pool.get_connection(other_path)), "other")
+        # read-only
+        with self.assertRaises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO t VALUES ('x')")
+
+    def test_reopen_replaced_file(self):
+        conn = self.pool.get_connection(self.path)
+        self.make_index("index.sql", "second")
+        new_conn = self.pool.get_connection(self.path)
+        self.assertIsNot(new_conn, conn)
+        self.assertEqual(self.query(new_conn), "second")
+        self.assertTrue(self.is_closed(conn))
+
+    def test_close_files(self):
+        conn = self.pool.get_connection(self.path)
+        got_connection = threading.Event()
+        closed_files = threading.Event()
+        seen = {}
+
+        def reader():
+            seen["conn"] = self.pool.get_connection(self.path)
+            got_connection.set()
+            closed_files.wait()
+            # retired connection keeps working until the thread asks again
+            seen["query"] = self.query(seen["conn"])
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        got_connection.wait()
+        self.assertTrue(self.is_flocked(self.path))
+        self.pool.close_files([self.path])
+        closed_files.set()
+        thread.join()
+        # file isn't held any more, connections are closed by their threads
+        self.assertFalse(self.is_flocked(self.path))
+        self.assertEqual(seen["query"], "first")
+        self.assertFalse(self.is_closed(conn))
+        new_conn = self.pool.get_connection(self.path)
+        self.assertIsNot(new_conn, conn)
+        self.assertTrue(self.is_closed(conn))
+        # the one of the thread that's gone by now is closed by the sweep
+        self.assertFalse(self.is_closed(seen["conn"]))
+        self.pool.last_sweep = 0
+        self.pool.get_connection(self.path)
+        self.assertTrue(self.is_closed(seen["conn"]))
+        self.assertEqual(self.pool.retired, {})
+
+    def test_idle_sweep(self):
+        conn = self.pool.get_connection(self.path)
+        other = self.in_thread(lambda: self.pool.get_connection(self.path))
+        for pooled in self.pool.connections.values():
+            pooled.last_used = time.time() - 61
+        other_path = self.make_index("other.sql", "other")
+        # recently swept, nothing happens yet
+        self.pool.get_connection(other_path)
+        self.assertEqual(len(self.pool.connections), 3)
+        self.pool.last_sweep = 0
+        self.pool.get_connection(other_path)
+        self.assertEqual(list(self.pool.connections), [(threading.get_ident(), other_path)])
+        self.assertFalse(self.is_flocked(self.path))
+        # connection of the thread that's gone is closed right away, this
+        # thread closes its own when it asks for a connection again
+        self.assertTrue(self.is_closed(other))
+        self.assertFalse(self.is_closed(conn))
+        self.pool.get_connection(other_path)
+        self.assertTrue(self.is_closed(conn))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Peak memory of parsing gzip'd features blob, whole blob in memory vs streaming.
+
+A synthetic blob of --features features (shaped like the ones stored for
+AnnotatedMetagenomeAssembly objects) is written to a temporary file, then
+each parser runs in its own process reading the file in download sized
+chunks and the peak RSS of the process is reported. Run from the repository
+root:
+
+    PYTHONPATH=lib python test/benchmarks/bench_feature_stream.py --features 2000000
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from MetagenomeAPI.FeatureStream import DOWNLOAD_CHUNK_SIZE, iter_gunzip, iter_json_array
+
+
+def make_features(n_features, features_per_contig=1000):
+    """Synthetic features shaped like the ones of AnnotatedMetagenomeAssembly."""
+    random.seed(1)
+    for pos in range(n_features):
+        length = random.randint(100, 3000)
+        contig_id = "contig_%d" % (pos // features_per_contig)
+        yield {"id": "%s_%d" % (contig_id, pos),
+               "type": random.choice(["gene", "CDS", "mRNA"]),
+               "location": [[contig_id, (pos % features_per_contig) * 300,
+                             random.choice("+-"), length]],
+               "dna_sequence": "".join(random.choice("ACGT") for _ in range(64)),
+               "dna_sequence_length": length,
+               "functions": ["hypothetical protein %d" % (pos % 997)]}
+
+
+def write_blob(path, n_features):
+    with gzip.open(path, "wb") as f:
+        f.write(b"[")
+        for pos, feature in enumerate(make_features(n_features)):
+            f.write((b"," if pos else b"") + json.dumps(feature).encode("utf-8"))
+        f.write(b"]")
+
+
+def read_chunks(path):
+    # what requests' iter_content hands out while downloading
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(DOWNLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def parse_whole(path):
+    with open(path, "rb") as f:
+        features = json.loads(gzip.decompress(f.read()))
+    return sum(1 for feature in features if json.dumps(feature))
+
+
+def parse_streaming(path):
+    return sum(1 for feature in iter_json_array(iter_gunzip(read_chunks(path)))
+               if json.dumps(feature))
+
+
+def run_mode(mode, path):
+    t1 = time.time()
+    count = {"whole": parse_whole, "streaming": parse_streaming}[mode](path)
+    elapsed = time.time() - t1
+    # ru_maxrss is in KB on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print("%-10s %10d %10.1f %12.1f" % (mode, count, elapsed, peak_mb))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--features", type=int, default=1000000)
+    parser.add_argument("--mode", choices=["whole", "streaming"])
+    parser.add_argument("--file")
+    args = parser.parse_args()
+    if args.mode:
+        run_mode(args.mode, args.file)
+        return
+    work_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(work_dir, "features.json.gz")
+        write_blob(path, args.features)
+        print("blob: %d features, %.1f MB gzip'd" % (args.features, os.path.getsize(path) / 2**20))
+        print("%-10s %10s %10s %12s" % ("parser", "features", "sec", "peak RSS, MB"))
+        sys.stdout.flush()
+        for mode in ["whole", "streaming"]:
+            subprocess.run([sys.executable, __file__, "--mode", mode, "--file", path], check=True)
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
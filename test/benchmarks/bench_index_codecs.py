@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Build and read throughput of BinnedContigs contig indexes per codec.
+
+Contigs of the MaxBin test sample are replicated --scale times (with ids made
+unique) so the tables are of realistic size. Run from the repository root:
+
+    PYTHONPATH=lib python test/benchmarks/bench_index_codecs.py --scale 200
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from MetagenomeAPI.Codecs import get_available_codecs, get_codec
+from MetagenomeAPI.ColumnarTable import ColumnarTable
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data",
+                          "MaxBin_Result_Sample")
+CONTIGS_COLUMN_PROPS_MAP = {
+    "id": {"col": 1, "type": "", "dtype": "str"},
+    "len": {"col": 2, "type": "n", "dtype": "int"},
+    "gc": {"col": 3, "type": "n", "dtype": "float"},
+    "cov": {"col": 4, "type": "n", "dtype": "float"}
+}
+
+
+def load_contigs(scale):
+    """Contig values (id, len, gc, cov) parsed from MaxBin sample headers."""
+    random.seed(1)
+    values = {col_name: [] for col_name in CONTIGS_COLUMN_PROPS_MAP}
+    for file_name in sorted(os.listdir(SAMPLE_DIR)):
+        if not file_name.endswith(".fasta"):
+            continue
+        with open(os.path.join(SAMPLE_DIR, file_name)) as f:
+            headers = [line[1:].strip() for line in f if line.startswith(">")]
+        for copy in range(scale):
+            for header in headers:
+                # NODE_<n>_length_<len>_cov_<cov>
+                parts = header.split("_")
+                values["id"].append(header + ("_" + str(copy) if copy else ""))
+                values["len"].append(int(parts[3]))
+                values["gc"].append(round(random.random(), 4))
+                values["cov"].append(float(parts[5]))
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--scale", type=int, default=100)
+    parser.add_argument("--reads", type=int, default=20)
+    args = parser.parse_args()
+    values = load_contigs(args.scale)
+    size = len(values["id"])
+    print("rows: " + str(size))
+    print("%-6s %10s %12s %12s %12s" % ("codec", "size, KB", "build, ms", "load, ms",
+                                          "page, ms"))
+    work_dir = tempfile.mkdtemp()
+    try:
+        for codec_name in get_available_codecs():
+            codec = get_codec(codec_name)
+            index_file = os.path.join(work_dir, codec_name + ".col")
+            t1 = time.time()
+            table = ColumnarTable.from_values(CONTIGS_COLUMN_PROPS_MAP, size, values)
+            table.save(index_file, codec)
+            build_time = time.time() - t1
+            file_size = os.path.getsize(index_file) + \
+                os.path.getsize(os.path.splitext(index_file)[0] + ".tok")
+            load_time = 0
+            page_time = 0
+            for _ in range(args.reads):
+                # cold load (what a table cache miss costs) and one sorted,
+                # filtered page on top of it
+                t1 = time.time()
+                table = ColumnarTable.from_store_file(CONTIGS_COLUMN_PROPS_MAP, index_file)
+                load_time += time.time() - t1
+                t1 = time.time()
+                order = table.get_sorted_order([["len", 0]])
+                rows = set(table.find_rows(["node_1"]).tolist())
+                page = [row for row in order[:10000] if row in rows][:50]
+                [table.get_value("id", row) for row in page]
+                page_time += time.time() - t1
+            print("%-6s %10d %12.1f %12.2f %12.2f" % (
+                codec_name, file_size // 1024, build_time * 1000,
+                load_time * 1000 / args.reads, page_time * 1000 / args.reads))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Lines/sec of reading gzip'd TSV index lines, old per line readers vs ChunkedLineReader.
+
+The "old" readers are what CombinedLineIterator did: TextIOWrapper over
+gzip.open for files and readline() + poll() per line of `gunzip -c` output.
+Run from the repository root:
+
+    PYTHONPATH=lib python test/benchmarks/bench_line_reader.py --scale 200
+"""
+import argparse
+import gzip
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from bench_index_codecs import CONTIGS_COLUMN_PROPS_MAP, load_contigs
+from MetagenomeAPI.ChunkedLineReader import ChunkedLineReader
+
+
+def write_tsv(values, path):
+    col_names = sorted(CONTIGS_COLUMN_PROPS_MAP, key=lambda c: CONTIGS_COLUMN_PROPS_MAP[c]["col"])
+    with gzip.open(path, "wt") as f:
+        for row in zip(*[values[col_name] for col_name in col_names]):
+            f.write("\t".join(str(v) for v in row) + "\n")
+
+
+def old_file_lines(path):
+    with io.TextIOWrapper(io.BufferedReader(gzip.open(path)), encoding="utf-8") as f:
+        return sum(1 for _ in f)
+
+
+def old_process_lines(path):
+    process = subprocess.Popen(["gunzip", "-c", path], stdout=subprocess.PIPE)
+    count = 0
+    while True:
+        line = process.stdout.readline().decode("utf-8")
+        if line == '' and process.poll() is not None:
+            break
+        if line:
+            count += 1
+    return count
+
+
+def new_file_lines(path):
+    with ChunkedLineReader(path) as reader:
+        return sum(len(lines) for lines in reader.text_chunks())
+
+
+def new_process_lines(path):
+    process = subprocess.Popen(["gunzip", "-c", path], stdout=subprocess.PIPE)
+    with ChunkedLineReader(process) as reader:
+        return sum(len(lines) for lines in reader.text_chunks())
+
+
+def new_filtered_lines(path):
+    # only lines passing the filter are decoded
+    with ChunkedLineReader(path) as reader:
+        return sum(len([line.decode("utf-8") for line in lines if b"NODE_1" in line])
+                   for lines in reader.chunks())
+
+
+def new_first_page(path):
+    # early termination, reading stops after the first page
+    with ChunkedLineReader(path) as reader:
+        return sum(1 for _, line in zip(range(50), reader))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--scale", type=int, default=100)
+    parser.add_argument("--reads", type=int, default=3)
+    args = parser.parse_args()
+    work_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(work_dir, "contigs.tsv.gz")
+        write_tsv(load_contigs(args.scale), path)
+        total = old_file_lines(path)
+        print("%-20s %10s %10s %14s" % ("reader", "returned", "ms", "scanned/sec"))
+        for name, read in [("old gzip file", old_file_lines),
+                           ("old gunzip process", old_process_lines),
+                           ("new gzip file", new_file_lines),
+                           ("new gunzip process", new_process_lines),
+                           ("new filtered", new_filtered_lines),
+                           ("new first page", new_first_page)]:
+            t1 = time.time()
+            for _ in range(args.reads):
+                count = read(path)
+            elapsed = (time.time() - t1) / args.reads
+            # the first page doesn't scan the whole file
+            scanned = count if read is new_first_page else total
+            print("%-20s %10d %10.1f %14.0f" % (name, count, elapsed * 1000, scanned / elapsed))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
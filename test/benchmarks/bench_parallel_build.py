@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Wall time of indexing every bin of a BinnedContigs object vs build workers.
+
+A synthetic object of --bins bins with --contigs contigs each is indexed
+(per bin tables and the object-wide one) by BinnedContigsIndexer with each
+of --workers build workers, speedup is relative to the sequential build.
+Speedup can't exceed the number of CPUs (reported), so the build is also
+split into the tasks the pool runs and each task is timed on its own: the
+longest task and the part left to the indexing process (loading values,
+merging token indexes, saving the object-wide table) bound the speedup on a
+machine with a CPU per worker. Run from the repository root:
+
+    PYTHONPATH=lib python test/benchmarks/bench_parallel_build.py --bins 50 --contigs 4000
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from MetagenomeAPI.BinnedContigsIndexer import BinnedContigsIndexer
+
+
+class SyntheticWorkspace:
+    """Serves one BinnedContigs object shaped like metaSPAdes assembly bins."""
+
+    def __init__(self, n_bins, contigs_per_bin):
+        random.seed(1)
+        self.bins = []
+        for bin_pos in range(n_bins):
+            contigs = {}
+            for pos in range(contigs_per_bin):
+                length = random.randint(1000, 200000)
+                cov = random.uniform(1, 300)
+                contig_id = "NODE_%d_length_%d_cov_%.6f" % (bin_pos * contigs_per_bin + pos,
+                                                            length, cov)
+                contigs[contig_id] = {"len": length, "gc": random.uniform(0.2, 0.7), "cov": cov}
+            self.bins.append({"bid": "bin.%03d.fasta" % (bin_pos + 1), "contigs": contigs})
+
+    def get_objects2(self, params):
+        bins = [{"bid": b["bid"], "contigs": dict(b["contigs"])} for b in self.bins]
+        return {"data": [{"data": {"bins": bins}}]}
+
+
+class TaskTimingIndexer(BinnedContigsIndexer):
+    """Runs the pool's tasks one by one in this process, timing each of them."""
+
+    def map_on_build_pool(self, func, items, while_waiting=None):
+        self.task_times = []
+        results = []
+        for item in items:
+            t1 = time.time()
+            results.append(func(item))
+            self.task_times.append(time.time() - t1)
+        if while_waiting is not None:
+            while_waiting()
+        return results
+
+
+def build(indexer_class, ws, index_dir, workers):
+    config = {"workspace-url": "https://localhost/ws", "metagenome-index-dir": index_dir,
+              "index-build-workers": str(workers), "index-parallel-build-min-contigs": "0"}
+    indexer = indexer_class(config)
+    try:
+        t1 = time.time()
+        indexer.save_all_contigs_in_bins(ws, "1/2/3", "0123456789abcdef")
+        elapsed = time.time() - t1
+    finally:
+        if indexer.build_pool is not None:
+            indexer.build_pool.terminate()
+    shutil.rmtree(index_dir)
+    return indexer, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--bins", type=int, default=50)
+    parser.add_argument("--contigs", type=int, default=4000, help="contigs per bin")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    work_dir = tempfile.mkdtemp()
+    try:
+        ws = SyntheticWorkspace(args.bins, args.contigs)
+        print("%d contigs in %d bins, %d CPUs" % (args.bins * args.contigs, args.bins,
+                                                  os.cpu_count()))
+        print("%-8s %8s %8s %8s %14s %14s" % ("workers", "tasks", "sec", "speedup",
+                                              "longest task", "speedup bound"))
+        base = None
+        for workers in args.workers:
+            index_dir = os.path.join(work_dir, "index")
+            _, elapsed = build(BinnedContigsIndexer, ws, index_dir, workers)
+            base = base or elapsed
+            if workers <= 1:
+                print("%-8d %8s %8.1f %8.2f %14s %14s" % (workers, "-", elapsed, base / elapsed,
+                                                         "", ""))
+                continue
+            timing, total = build(TaskTimingIndexer, ws, index_dir, workers)
+            tasks_time = sum(timing.task_times)
+            # this process' own work plus the pool kept busy by its tasks
+            bound = (total - tasks_time) + max(max(timing.task_times), tasks_time / workers)
+            print("%-8d %8d %8.1f %8.2f %14.1f %14.2f" % (workers, len(timing.task_times),
+                                                          elapsed, base / elapsed,
+                                                          max(timing.task_times), total / bound))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
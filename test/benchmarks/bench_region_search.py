@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Latency of search_region overlap queries, BETWEEN/OR filter vs R*Tree interval index.
+
+Features are spread over --contigs contigs with --per-contig features each
+(default 2 x 150000). The same feature index is queried for random regions
+of --region bases once as built by older versions (no interval index) and
+once with it. Run from the repository root:
+
+    PYTHONPATH=lib python test/benchmarks/bench_region_search.py
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from bench_feature_stream import make_features
+from MetagenomeAPI.MetagenomeSearchUtils import Indexer, MetagenomeSearchUtils
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--contigs", type=int, default=2)
+    parser.add_argument("--per-contig", type=int, default=150000)
+    parser.add_argument("--region", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    work_dir = tempfile.mkdtemp()
+    try:
+        indexer = Indexer(None, work_dir)
+        new_sql = os.path.join(work_dir, "new.sql")
+        old_sql = os.path.join(work_dir, "old.sql")
+        indexer._build_sql(new_sql, make_features(args.contigs * args.per_contig,
+                                                  args.per_contig))
+        shutil.copyfile(new_sql, old_sql)
+        conn = sqlite3.connect(old_sql)
+        conn.execute("DROP TABLE " + Indexer.RTREE_TABLE)
+        conn.commit()
+        conn.close()
+        # search_region needs only the indexer, so the service parts are skipped
+        msu = MetagenomeSearchUtils.__new__(MetagenomeSearchUtils)
+        msu.indexer = indexer
+        contig_len = args.per_contig * 300
+        random.seed(1)
+        regions = [("contig_%d" % random.randrange(args.contigs),
+                    random.randrange(contig_len - args.region)) for _ in range(args.queries)]
+        print("%-10s %10s %12s" % ("index", "found", "ms/query"))
+        for name, sqlf in [("between", old_sql), ("rtree", new_sql)]:
+            conn = sqlite3.connect(sqlf)
+            msu._get_sql_conn = lambda ref, token: conn
+            found = 0
+            t1 = time.time()
+            for contig_id, region_start in regions:
+                ret = msu.search_region(None, None, contig_id, region_start, args.region, 0, 50,
+                                        [("starts", 1)])
+                found += ret["num_found"]
+            elapsed = time.time() - t1
+            print("%-10s %10d %12.2f" % (name, found, elapsed * 1000 / args.queries))
+            conn.close()
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Per-request latency on a hot feature index, new connection per request vs pooled connection.
+
+Each request is what MetagenomeSearchUtils does for a search page: get a
+connection, check the index tables and run the count and page queries.
+Run from the repository root:
+
+    PYTHONPATH=lib python test/benchmarks/bench_sql_connections.py --features 200000
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from bench_feature_stream import make_features
+from MetagenomeAPI.MetagenomeSearchUtils import Indexer
+from MetagenomeAPI.SqlConnectionPool import SqlConnectionPool
+
+
+def run_request(indexer, conn, contig_id):
+    indexer.is_complete(conn)
+    conn.execute("SELECT count(*) FROM features WHERE contig_id=?", [contig_id]).fetchone()
+    return conn.execute("SELECT json FROM features WHERE contig_id=? ORDER BY starts LIMIT 50",
+                        [contig_id]).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--features", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+    work_dir = tempfile.mkdtemp()
+    try:
+        indexer = Indexer(None, work_dir)
+        sqlf = os.path.join(work_dir, "features.sql")
+        indexer._build_sql(sqlf, make_features(args.features))
+        n_contigs = args.features // 1000
+        pool = SqlConnectionPool({})
+        print("%-12s %12s" % ("connection", "ms/request"))
+        for name, connect in [("per request", lambda: sqlite3.connect(sqlf)),
+                              ("pooled", lambda: pool.get_connection(sqlf))]:
+            t1 = time.time()
+            for i in range(args.requests):
+                run_request(indexer, connect(), "contig_%d" % (i % n_contigs))
+            elapsed = time.time() - t1
+            print("%-12s %12.3f" % (name, elapsed * 1000 / args.requests))
+        pool.close_all()
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
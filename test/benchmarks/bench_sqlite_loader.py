@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Features/sec of building the SQLite feature index, old per row loader vs bulk loader.
+
+The old loader is what Indexer._create_index did before: secondary indexes
+created up front, one execute per feature with duplicates skipped in
+python, default journaling and a commit every 30 seconds. The bulk loader
+is Indexer._build_sql; features/sec compares loading the rows (with the
+secondary indexes and ANALYZE), the time spent on the search tables (full
+text and interval indexes) the old loader didn't build is reported apart.
+Run from the repository root:
+
+    PYTHONPATH=lib python test/benchmarks/bench_sqlite_loader.py --features 500000
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from bench_feature_stream import make_features
+from MetagenomeAPI.MetagenomeSearchUtils import Indexer
+
+
+def old_loader(sqlf, features):
+    conn = sqlite3.connect(sqlf)
+    conn.execute('''CREATE TABLE features
+         (id INT PRIMARY KEY     NOT NULL,
+         contig_id        TEXT    NOT NULL,
+         type             TEXT    NOT NULL,
+         starts           INT     NOT NULL,
+         stops            INT     NOT NULL,
+         size             INT     NOT NULL,
+         functions        TEXT    NOT NULL,
+         functional_descriptions   TEXT    NOT NULL,
+         strands          TEXT    NOT NULL,
+         json             BLOB    NOT NULL);
+         ''')
+    for index_sql in Indexer._INDEXES:
+        conn.execute(index_sql)
+    ct = 0
+    seen = {}
+    last_update = time.time()
+    for f in features:
+        if f["id"] in seen:
+            continue
+        seen[f["id"]] = 1
+        loc = f["location"][0]
+        length = loc[3]
+        if loc[2] == "+":
+            start = loc[1]
+            stop = start + length
+        else:
+            start = loc[1] - length
+            stop = loc[1]
+        values = [f["id"], loc[0], f["type"], start, stop, length,
+                  f.get("functions", [''])[0], f.get("functions", [''])[0], loc[2], json.dumps(f)]
+        conn.execute("INSERT INTO features VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", values)
+        if time.time() - last_update >= 30:
+            conn.commit()
+            last_update = time.time()
+        ct += 1
+    conn.commit()
+    conn.close()
+    return ct
+
+
+class TimedIndexer(Indexer):
+    """Indexer keeping time spent on building search tables."""
+
+    def __init__(self, scratch):
+        super().__init__(None, scratch)
+        self.search_tables_time = 0
+
+    def _add_search_tables(self, conn):
+        t1 = time.time()
+        super()._add_search_tables(conn)
+        self.search_tables_time += time.time() - t1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--features", type=int, default=200000)
+    args = parser.parse_args()
+    work_dir = tempfile.mkdtemp()
+    try:
+        # generated up front so only the loading is timed
+        features = list(make_features(args.features))
+        print("%-8s %10s %10s %14s %14s %10s" % ("loader", "features", "load sec", "features/sec",
+                                                 "search tables", "size, MB"))
+        indexer = TimedIndexer(work_dir)
+        for name, load in [("old", old_loader), ("bulk", indexer._build_sql)]:
+            sqlf = os.path.join(work_dir, name + ".sql")
+            t1 = time.time()
+            count = load(sqlf, features)
+            search_tables_time = indexer.search_tables_time if name == "bulk" else 0
+            elapsed = time.time() - t1 - search_tables_time
+            print("%-8s %10d %10.1f %14.0f %14.1f %10.1f" % (name, count, elapsed, count / elapsed,
+                                                             search_tables_time,
+                                                             os.path.getsize(sqlf) / 2**20))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()